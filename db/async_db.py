@@ -0,0 +1,158 @@
+import logging
+import uuid
+from typing import AsyncIterator
+
+import pandas as pd
+import psycopg
+import pyarrow as pa
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+from db.postgres_db import libpq_conninfo, rows_to_record_batch
+from db.rowcounts import ROW_ESTIMATE_SQL
+
+
+def _table_identifier(table_name: str) -> sql.Identifier:
+    # Quote a table name, optionally schema qualified, eg. public.bdc_2024_06_30
+    return sql.Identifier(*table_name.split("."))
+
+
+class AsyncDBConnection:
+    """Pooled async counterpart of DBConnection on psycopg 3.
+
+    Each call borrows a connection from an AsyncConnectionPool and returns it
+    when done, so concurrent tasks, eg. the ingest pipeline, Streamlit
+    sessions and the RAG tools, each get their own connection instead of
+    sharing one cursor. The pool belongs to the event loop it is opened on.
+
+    args:
+        connection_string: PostgreSQL connection string
+        min_size: Connections kept open
+        max_size: Most connections open at once
+        timeout: Seconds to wait for a free connection
+    """
+
+    def __init__(
+        self,
+        connection_string: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+    ):
+        self.connection_string = connection_string
+        self.pool = AsyncConnectionPool(
+            libpq_conninfo(connection_string),
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            open=False,
+        )
+
+    async def open(self):
+        await self.pool.open()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_table_schema(self, table_name: str):
+        query = """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_name = %s;
+        """
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(query, (table_name,))
+                records = await cur.fetchall()
+            schema = {record[0]: record[1] for record in records}
+            return f"Schema for table {table_name}:\n{schema}"
+        except psycopg.Error as e:
+            logging.error(f"Error getting the schema of {table_name}: {e}")
+            return False
+
+    async def execute_query(self, query: str) -> pd.DataFrame | None:
+        try:
+            async with self.pool.connection() as conn:
+                cur = await conn.execute(query)
+                if cur.description is None:
+                    return None
+                results = await cur.fetchall()
+                columns = pd.Index([column.name for column in cur.description])
+                return pd.DataFrame(results, columns=columns)
+        except Exception as e:
+            logging.error(f"Error executing query: {e}")
+            return None
+
+    async def get_rowcount(self, table_name: str, estimate: bool = False) -> int:
+        async with self.pool.connection() as conn:
+            if estimate:
+                # Planner statistics instead of a full scan, see db.rowcounts
+                cur = await conn.execute(ROW_ESTIMATE_SQL, {"table_name": table_name})
+            else:
+                cur = await conn.execute(
+                    sql.SQL("SELECT COUNT(*) FROM {}").format(
+                        _table_identifier(table_name)
+                    )
+                )
+            result = await cur.fetchone()
+        if result is None or result[0] is None:
+            raise psycopg.Error("No results returned from count query")
+        return result[0]
+
+    async def stream_query_arrow(
+        self, query: str, itersize: int = 50_000, max_rows: int | None = None
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """
+        Run a query on a named server-side cursor and yield its rows as Arrow
+        record batches, like DBConnection.stream_query_arrow.
+
+        args:
+            query: SQL query returning rows
+            itersize: Rows fetched from the server per batch
+            max_rows: Stop after this many rows, all rows if None
+
+        returns:
+            AsyncIterator[pa.RecordBatch]: Batches of at most itersize rows
+        """
+        async with self.pool.connection() as conn:
+            # The pool ends the cursor's transaction when the connection is
+            # returned, including when the generator is closed early
+            async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                await cur.execute(query)
+                fetched = 0
+                while max_rows is None or fetched < max_rows:
+                    size = (
+                        itersize
+                        if max_rows is None
+                        else min(itersize, max_rows - fetched)
+                    )
+                    rows = await cur.fetchmany(size)
+                    if not rows:
+                        break
+                    fetched += len(rows)
+                    yield rows_to_record_batch(rows, cur.description)
+
+    async def stream_query(
+        self, query: str, itersize: int = 50_000, max_rows: int | None = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        Run a query on a named server-side cursor and yield its rows as
+        DataFrames with nullable Arrow-backed dtypes.
+
+        args:
+            query: SQL query returning rows
+            itersize: Rows fetched from the server per batch
+            max_rows: Stop after this many rows, all rows if None
+
+        returns:
+            AsyncIterator[pd.DataFrame]: Batches of at most itersize rows
+        """
+        async for batch in self.stream_query_arrow(query, itersize, max_rows):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Iterator
+
+import psycopg
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from db.postgres_db import PG_ARROW_TYPES, libpq_conninfo
+
+EXPORT_FORMATS = ("csv", "binary")
+
+
+def _copy_sql(query: str, format: str) -> str:
+    if format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unsupported format {format}, choose from {', '.join(EXPORT_FORMATS)}"
+        )
+    options = "FORMAT csv, HEADER true" if format == "csv" else "FORMAT binary"
+    return f"COPY ({query.strip().rstrip(';')}) TO STDOUT WITH ({options})"
+
+
+def query_arrow_schema(connection: psycopg.Connection, query: str) -> pa.Schema:
+    """Arrow schema of a query's result without running it
+    args:
+        connection: psycopg.Connection - open psycopg 3 connection
+        query: str - SQL query returning rows
+    returns:
+        pa.Schema - column types mapped from PostgreSQL, string where there
+            is no direct Arrow type
+    """
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) AS q LIMIT 0")
+        return pa.schema(
+            [
+                (column.name, PG_ARROW_TYPES.get(column.type_code, pa.string()))
+                for column in cur.description
+            ]
+        )
+
+
+class _CopyReader(io.RawIOBase):
+    """Read-only file object over the chunks of a COPY TO STDOUT."""
+
+    def __init__(self, copy: psycopg.Copy):
+        self._chunks = iter(copy)
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        # COPY sends a chunk per row, fill the whole buffer so the CSV reader
+        # gets full blocks
+        view = memoryview(b)
+        size = 0
+        while size < len(view):
+            if not self._buffer:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer = memoryview(bytes(chunk))
+            n = min(len(view) - size, len(self._buffer))
+            view[size : size + n] = self._buffer[:n]
+            self._buffer = self._buffer[n:]
+            size += n
+        return size
+
+
+def export_query(
+    connection_string: str, query: str, path: str | Path, format: str = "csv"
+) -> int:
+    """Write a query's result to a file with COPY TO STDOUT
+    args:
+        connection_string: str - PostgreSQL connection string
+        query: str - SQL query to export, eg. SELECT * FROM bdc_2024_06_30
+        path: str | Path - file to write, replaced once it is complete
+        format: str - csv with a header row, or PostgreSQL's binary COPY
+            format, which COPY FROM reads back without parsing
+    returns:
+        int - bytes written
+    """
+    path = Path(path)
+    part = path.with_name(f"{path.name}.part")
+    written = 0
+    with psycopg.connect(libpq_conninfo(connection_string)) as connection:
+        with connection.cursor() as cur, open(part, "wb") as f:
+            with cur.copy(_copy_sql(query, format)) as copy:
+                for chunk in copy:
+                    f.write(chunk)
+                    written += len(chunk)
+    os.replace(part, path)
+    logging.info(f"Exported {written} bytes to {path}")
+    return written
+
+
+def iter_query_batches(
+    connection_string: str, query: str, block_size: int = 16 * 1024 * 1024
+) -> Iterator[pa.RecordBatch]:
+    """Stream a query's result into Arrow record batches.
+
+    The CSV from COPY TO STDOUT is decoded by Arrow's CSV reader with the
+    query's column types, so rows never become Python objects.
+
+    args:
+        connection_string: str - PostgreSQL connection string
+        query: str - SQL query returning rows
+        block_size: int - bytes of CSV decoded per batch
+    returns:
+        Iterator[pa.RecordBatch] - batches of the result in order
+    """
+    with psycopg.connect(libpq_conninfo(connection_string)) as connection:
+        schema = query_arrow_schema(connection, query)
+        with connection.cursor() as cur:
+            with cur.copy(_copy_sql(query, "csv")) as copy:
+                reader = pa_csv.open_csv(
+                    _CopyReader(copy),
+                    read_options=pa_csv.ReadOptions(
+                        block_size=block_size, use_threads=True
+                    ),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=schema,
+                        true_values=["t"],
+                        false_values=["f"],
+                        # COPY writes NULL unquoted and empty strings quoted
+                        strings_can_be_null=True,
+                        quoted_strings_can_be_null=False,
+                    ),
+                )
+                yield from reader
+
+
+def export_query_to_parquet(
+    connection_string: str,
+    query: str,
+    path: str | Path,
+    compression: str = "zstd",
+) -> int:
+    """Write a query's result to a Parquet file through iter_query_batches
+    args:
+        connection_string: str - PostgreSQL connection string
+        query: str - SQL query returning rows
+        path: str | Path - Parquet file to write, replaced once it is complete
+        compression: str - Parquet compression codec
+    returns:
+        int - rows written
+    """
+    path = Path(path)
+    part = path.with_name(f"{path.name}.part")
+    rows = 0
+    writer = None
+    try:
+        for batch in iter_query_batches(connection_string, query):
+            if writer is None:
+                writer = pq.ParquetWriter(part, batch.schema, compression=compression)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        logging.warning(f"No rows to export to {path}")
+        return 0
+    os.replace(part, path)
+    logging.info(f"Exported {rows} rows to {path}")
+    return rows
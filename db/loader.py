@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import Engine, create_engine
+
+from db.schema import AfterCopy, copy_data_to_postgres, copy_zip_to_postgres
+from db.transform import Converter
+
+
+@dataclass
+class LoadStats:
+    """Outcome of loading one CSV source into PostgreSQL."""
+
+    source: str
+    table_name: str
+    rows: int = 0
+    seconds: float = 0.0
+    error: Exception | None = None
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def create_bulk_engine(connection_string: str, max_connections: int = 4) -> Engine:
+    """Create an engine whose pool holds exactly one connection per COPY stream.
+
+    Args:
+        connection_string: PostgreSQL connection string
+        max_connections: Number of pooled connections
+
+    Returns:
+        Engine: SQLAlchemy engine
+    """
+    return create_engine(
+        connection_string,
+        pool_size=max_connections,
+        max_overflow=0,
+        pool_pre_ping=True,
+    )
+
+
+class BulkLoader:
+    """Load many CSV sources into PostgreSQL with concurrent COPY streams.
+
+    Each source is copied over its own pooled connection. The total number
+    of streams is capped by max_connections, and table_concurrency can cap
+    the streams into any one table below that.
+
+    Args:
+        engine: SQLAlchemy engine, ideally from create_bulk_engine
+        max_connections: Maximum number of COPY streams at once
+        table_concurrency: Maximum number of COPY streams per table name
+        converters: Conversions applied to each row on its way in, eg.
+            BDC_TYPED_CONVERTERS when loading a typed table
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        max_connections: int = 4,
+        table_concurrency: dict[str, int] | None = None,
+        converters: dict[str, Converter] | None = None,
+    ):
+        self.engine = engine
+        self.max_connections = max_connections
+        self.table_concurrency = table_concurrency or {}
+        self.converters = converters
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._table_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _table_slot(self, table_name: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if table_name not in self._table_slots:
+                limit = self.table_concurrency.get(table_name, self.max_connections)
+                self._table_slots[table_name] = threading.BoundedSemaphore(limit)
+            return self._table_slots[table_name]
+
+    def load_file(
+        self,
+        source: str | Path,
+        table_name: str,
+        columns: list[str] | None = None,
+        after_copy: AfterCopy | None = None,
+    ) -> LoadStats:
+        """Copy one CSV or zipped CSV source into a table.
+
+        Args:
+            source: Path to a .csv file, or a .zip file whose CSV members are
+                streamed without extracting them
+            table_name: Name of the PostgreSQL table
+            columns: Table columns the CSV columns map to
+            after_copy: Called with the connection and rows copied before the
+                COPY commits, eg. to record the load in the same transaction
+
+        Returns:
+            LoadStats: Rows copied and throughput of the stream
+        """
+        source = Path(source)
+        stats = LoadStats(source=str(source), table_name=table_name)
+
+        with self._table_slot(table_name), self._slots:
+            start = time.monotonic()
+            if source.suffix == ".zip":
+                stats.rows = copy_zip_to_postgres(
+                    self.engine,
+                    source,
+                    table_name,
+                    self.converters,
+                    columns,
+                    after_copy,
+                )
+            else:
+                stats.rows = copy_data_to_postgres(
+                    self.engine,
+                    str(source),
+                    table_name,
+                    converters=self.converters,
+                    columns=columns,
+                    after_copy=after_copy,
+                )
+            stats.seconds = time.monotonic() - start
+
+        logging.info(
+            f"Loaded {stats.rows} rows from {source.name} into {table_name} in {stats.seconds:.1f}s ({stats.rows_per_sec:,.0f} rows/s)"
+        )
+        return stats
+
+    def load(self, sources: list[tuple[str | Path, str]]) -> list[LoadStats]:
+        """Copy many sources concurrently.
+
+        Args:
+            sources: (path, table name) pairs
+
+        Returns:
+            list[LoadStats]: One entry per source, in the same order. Failed
+                sources have their exception in LoadStats.error.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            futures = [
+                executor.submit(self.load_file, source, table_name)
+                for source, table_name in sources
+            ]
+
+        results = []
+        for (source, table_name), future in zip(sources, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"Failed to load {source} into {table_name}: {e}")
+                results.append(
+                    LoadStats(source=str(source), table_name=table_name, error=e)
+                )
+
+        total_rows = sum(stats.rows for stats in results)
+        logging.info(f"Loaded {total_rows} rows from {len(sources)} sources")
+        return results
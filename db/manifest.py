@@ -0,0 +1,186 @@
+import logging
+from contextlib import nullcontext
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Connection,
+    DateTime,
+    Engine,
+    MetaData,
+    Table,
+    Text,
+    func,
+    select,
+)
+
+MANIFEST_TABLE = "bdc_load_manifest"
+
+metadata = MetaData()
+
+manifest_table = Table(
+    MANIFEST_TABLE,
+    metadata,
+    Column("table_name", Text, primary_key=True),
+    Column("file_id", Text, primary_key=True),
+    Column("as_of_date", Text, nullable=False),
+    Column("file_name", Text, nullable=True),
+    Column("record_count", BigInteger, nullable=True),
+    Column("size_bytes", BigInteger, nullable=True),
+    Column("checksum", Text, nullable=True),
+    Column("rows_loaded", BigInteger, nullable=True),
+    Column("loaded_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def create_manifest_table(engine: Engine) -> None:
+    """Create the load manifest table if it does not exist"""
+    metadata.create_all(engine, tables=[manifest_table])
+
+
+def get_manifest(engine: Engine, table_name: str) -> dict[str, dict]:
+    """Files already loaded into a table
+    args:
+        engine: Engine - SQLAlchemy engine
+        table_name: str - name of the table the files were loaded into
+    returns:
+        dict[str, dict] - manifest rows keyed by file_id
+    """
+    query = select(manifest_table).where(manifest_table.c.table_name == table_name)
+    with engine.connect() as connection:
+        return {
+            row["file_id"]: dict(row) for row in connection.execute(query).mappings()
+        }
+
+
+def record_loads(
+    engine: Engine | Connection, table_name: str, entries: list[dict]
+) -> None:
+    """Record successfully loaded files, replacing earlier entries for them
+    args:
+        engine: Engine | Connection - SQLAlchemy engine, or the connection of
+            the transaction that loaded the files so both commit together
+        table_name: str - name of the table the files were loaded into
+        entries: list[dict] - one dict per file with file_id, as_of_date,
+            file_name, record_count, size_bytes, checksum and rows_loaded
+    """
+    if not entries:
+        return
+    rows = [
+        {**entry, "file_id": str(entry["file_id"]), "table_name": table_name}
+        for entry in entries
+    ]
+    transaction = (
+        nullcontext(engine) if isinstance(engine, Connection) else engine.begin()
+    )
+    with transaction as connection:
+        connection.execute(
+            manifest_table.delete().where(
+                manifest_table.c.table_name == table_name,
+                manifest_table.c.file_id.in_([row["file_id"] for row in rows]),
+            )
+        )
+        connection.execute(manifest_table.insert(), rows)
+
+    for row in rows:
+        if row.get("record_count") is not None and row.get("rows_loaded") is not None:
+            if int(row["record_count"]) != int(row["rows_loaded"]):
+                logging.warning(
+                    f"{row['file_name']}: loaded {row['rows_loaded']} rows, listing reports {row['record_count']}"
+                )
+
+
+def states_with_rows(engine: Engine, table_name: str, states: list[str]) -> set[str]:
+    """The states that already have rows in a table, loaded by this run's
+    manifest or not, eg. in tables loaded before the manifest existed
+    args:
+        engine: Engine - SQLAlchemy engine
+        table_name: str - name of the table
+        states: list[str] - state codes to look for, eg. AL
+    returns:
+        set[str] - the states with at least one row
+    """
+    table = Table(table_name, MetaData(), Column("state_usps", Text))
+    query = (
+        select(table.c.state_usps)
+        .where(table.c.state_usps.in_(states))
+        .group_by(table.c.state_usps)
+    )
+    with engine.connect() as connection:
+        return {str(state).strip() for state in connection.execute(query).scalars()}
+
+
+def unload_states(
+    engine: Engine, table_name: str, states: list[str], file_ids: list
+) -> None:
+    """Delete a table's rows for some states and forget the loads of their
+    files, in one transaction, so the states can be loaded again without
+    duplicating rows. An interrupted reload is picked up by the next run.
+    args:
+        engine: Engine - SQLAlchemy engine
+        table_name: str - name of the table the files were loaded into
+        states: list[str] - state codes whose rows are deleted, eg. AL
+        file_ids: list - files of those states to remove from the manifest
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            manifest_table.delete().where(
+                manifest_table.c.table_name == table_name,
+                manifest_table.c.file_id.in_([str(file_id) for file_id in file_ids]),
+            )
+        )
+        table = Table(table_name, MetaData(), Column("state_usps", Text))
+        connection.execute(table.delete().where(table.c.state_usps.in_(states)))
+    logging.info(f"Deleted the rows of {', '.join(states)} from {table_name}")
+
+
+def get_loaded_rows(
+    engine: Engine, table_name: str, as_of_date: str | None = None
+) -> int | None:
+    """Rows loaded into a table as recorded by COPY when each file loaded
+    args:
+        engine: Engine - SQLAlchemy engine
+        table_name: str - name of the table the files were loaded into
+        as_of_date: str | None - only count the files of this as of date
+    returns:
+        int | None - total rows loaded, None if the manifest has no complete
+            record of the table
+    """
+    query = select(
+        func.sum(manifest_table.c.rows_loaded),
+        func.count(),
+        func.count(manifest_table.c.rows_loaded),
+    ).where(manifest_table.c.table_name == table_name)
+    if as_of_date is not None:
+        query = query.where(manifest_table.c.as_of_date == as_of_date)
+    with engine.connect() as connection:
+        rows, files, counted = connection.execute(query).one()
+    if not files or counted != files:
+        return None
+    return int(rows)
+
+
+def is_file_changed(file: dict, entry: dict | None) -> bool:
+    """True if a file from BDC.getDownloadList is new or differs from the
+    version recorded in the manifest"""
+    if entry is None:
+        return True
+    record_count = file.get("record_count")
+    if record_count is not None and str(record_count) != str(entry["record_count"]):
+        return True
+    return file.get("file_name") != entry["file_name"]
+
+
+def files_to_load(files: list[dict], manifest: dict[str, dict]) -> list[dict]:
+    """Files from the API listing that are new or changed since they were loaded
+    args:
+        files: list[dict] - download list from BDC.getDownloadList
+        manifest: dict[str, dict] - manifest from get_manifest
+    returns:
+        list[dict] - the files that need to be downloaded and loaded
+    """
+    return [
+        file
+        for file in files
+        if is_file_changed(file, manifest.get(str(file["file_id"])))
+    ]
@@ -0,0 +1,185 @@
+import logging
+
+from sqlalchemy import Column, Date, Engine, Index, MetaData, Table, inspect, text
+
+from db.schema import BDC_INDEX_COLUMNS, create_bdc_table
+
+PARENT_TABLE = "bdc_availability"
+
+STATE_FIPS_TO_USPS = {
+    "01": "AL", "02": "AK", "04": "AZ", "05": "AR", "06": "CA", "08": "CO",
+    "09": "CT", "10": "DE", "11": "DC", "12": "FL", "13": "GA", "15": "HI",
+    "16": "ID", "17": "IL", "18": "IN", "19": "IA", "20": "KS", "21": "KY",
+    "22": "LA", "23": "ME", "24": "MD", "25": "MA", "26": "MI", "27": "MN",
+    "28": "MS", "29": "MO", "30": "MT", "31": "NE", "32": "NV", "33": "NH",
+    "34": "NJ", "35": "NM", "36": "NY", "37": "NC", "38": "ND", "39": "OH",
+    "40": "OK", "41": "OR", "42": "PA", "44": "RI", "45": "SC", "46": "SD",
+    "47": "TN", "48": "TX", "49": "UT", "50": "VT", "51": "VA", "53": "WA",
+    "54": "WV", "55": "WI", "56": "WY", "60": "AS", "66": "GU", "69": "MP",
+    "72": "PR", "78": "VI",
+}  # fmt: skip
+
+
+def bdc_columns(typed: bool = False) -> list[str]:
+    """Names of the columns in a BDC availability CSV, in file order"""
+    table = create_bdc_table("bdc", MetaData(), typed=typed)
+    return [column.name for column in table.columns]
+
+
+def date_partition_name(as_of_date: str) -> str:
+    return f"{PARENT_TABLE}_{as_of_date}".replace("-", "_")
+
+
+def state_partition_name(as_of_date: str, state_usps: str) -> str:
+    return f"{date_partition_name(as_of_date)}_{state_usps.lower()}"
+
+
+def state_usps_for_file(file: dict) -> str:
+    """State USPS code of a file from BDC.getDownloadList"""
+    return STATE_FIPS_TO_USPS[str(file["state_fips"]).zfill(2)]
+
+
+def file_state_usps(file: dict) -> str | None:
+    """State USPS code of a file, None for files without a state, eg.
+    provider and national summary files"""
+    state_fips = file.get("state_fips")
+    if not state_fips:
+        return None
+    return STATE_FIPS_TO_USPS.get(str(state_fips).zfill(2))
+
+
+def create_partitioned_parent(engine: Engine, typed: bool = False) -> Table:
+    """Create the bdc_availability parent table, list-partitioned by as_of_date,
+    with partitioned indexes that every attached partition inherits
+    args:
+        engine: Engine - SQLAlchemy engine
+        typed: bool - use the compact typed schema
+    returns:
+        Table - the parent table
+    """
+    metadata = MetaData()
+    columns = [
+        Column(column.name, column.type, nullable=True)
+        for column in create_bdc_table("bdc", MetaData(), typed=typed).columns
+    ]
+    parent = Table(
+        PARENT_TABLE,
+        metadata,
+        Column("as_of_date", Date, nullable=False),
+        *columns,
+        *[
+            Index(f"{PARENT_TABLE}_{column}_idx", column)
+            for column in BDC_INDEX_COLUMNS
+        ],
+        postgresql_partition_by="LIST (as_of_date)",
+    )
+    metadata.create_all(engine)
+    return parent
+
+
+def create_date_partition(engine: Engine, as_of_date: str) -> str:
+    """Create the partition for one as of date, sub-partitioned by state_usps
+    args:
+        engine: Engine - SQLAlchemy engine
+        as_of_date: str - as of date, eg. 2024-06-30
+    returns:
+        str - name of the date partition
+    """
+    partition_name = date_partition_name(as_of_date)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES IN ('{as_of_date}') PARTITION BY LIST (state_usps)"
+            )
+        )
+    return partition_name
+
+
+def create_state_load_table(engine: Engine, as_of_date: str, state_usps: str) -> str:
+    """Create a standalone table shaped like a state partition to COPY into.
+    It is swapped in with attach_state_partition once the state is loaded,
+    so the current partition stays readable while a state is reloaded.
+    args:
+        engine: Engine - SQLAlchemy engine
+        as_of_date: str - as of date, eg. 2024-06-30
+        state_usps: str - state code, eg. AL
+    returns:
+        str - name of the load table
+    """
+    load_name = f"{state_partition_name(as_of_date, state_usps)}_load"
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {load_name}"))
+        connection.execute(
+            text(f"CREATE TABLE {load_name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)")
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {load_name} ALTER COLUMN as_of_date SET DEFAULT '{as_of_date}'"
+            )
+        )
+    return load_name
+
+
+def attach_state_partition(engine: Engine, as_of_date: str, state_usps: str) -> str:
+    """Swap a loaded state table in as the state's partition, replacing the
+    partition that was there before
+    args:
+        engine: Engine - SQLAlchemy engine
+        as_of_date: str - as of date, eg. 2024-06-30
+        state_usps: str - state code, eg. AL
+    returns:
+        str - name of the state partition
+    """
+    date_partition = date_partition_name(as_of_date)
+    partition_name = state_partition_name(as_of_date, state_usps)
+    load_name = f"{partition_name}_load"
+
+    # The CHECK constraint and indexes are built before taking any lock on the
+    # parent, so ATTACH PARTITION can skip its validation scan and index build.
+    # A CHECK passes on NULL, so the partition constraint is only implied with
+    # the IS NOT NULL terms
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"ALTER TABLE {load_name} ADD CONSTRAINT {load_name}_bounds "
+                f"CHECK (as_of_date IS NOT NULL AND state_usps IS NOT NULL "
+                f"AND as_of_date = '{as_of_date}' AND state_usps = '{state_usps}')"
+            )
+        )
+        for column in BDC_INDEX_COLUMNS:
+            connection.execute(
+                text(f"CREATE INDEX {load_name}_{column}_idx ON {load_name} ({column})")
+            )
+        connection.execute(text(f"ANALYZE {load_name}"))
+
+    with engine.begin() as connection:
+        if inspect(connection).has_table(partition_name):
+            connection.execute(
+                text(f"ALTER TABLE {date_partition} DETACH PARTITION {partition_name}")
+            )
+            connection.execute(text(f"DROP TABLE {partition_name}"))
+        connection.execute(text(f"ALTER TABLE {load_name} RENAME TO {partition_name}"))
+        for column in BDC_INDEX_COLUMNS:
+            connection.execute(
+                text(
+                    f"ALTER INDEX {load_name}_{column}_idx RENAME TO {partition_name}_{column}_idx"
+                )
+            )
+        connection.execute(
+            text(
+                f"ALTER TABLE {date_partition} ATTACH PARTITION {partition_name} "
+                f"FOR VALUES IN ('{state_usps}')"
+            )
+        )
+
+    logging.info(f"Partition {partition_name} attached to {date_partition}")
+    return partition_name
+
+
+def truncate_state_partition(engine: Engine, as_of_date: str, state_usps: str) -> None:
+    """Empty one state's partition without touching any other state or date"""
+    partition_name = state_partition_name(as_of_date, state_usps)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {partition_name}"))
+    logging.info(f"Partition {partition_name} truncated")
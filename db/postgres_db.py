@@ -1,7 +1,50 @@
+import re
+import uuid
+from typing import Iterator, Sequence
+
 import pandas as pd
 import psycopg2
+import pyarrow as pa
 from pandas.io.sql import get_schema
 
+from db.rowcounts import ROW_ESTIMATE_SQL
+
+# Arrow types of common PostgreSQL type OIDs. Other types are inferred from
+# the values of each batch.
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    700: pa.float32(),
+    701: pa.float64(),
+    25: pa.string(),
+    1042: pa.string(),
+    1043: pa.string(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+}
+
+
+def libpq_conninfo(connection_string: str) -> str:
+    """Connection string without a SQLAlchemy driver suffix, eg.
+    postgresql+psycopg2://, for psycopg 3"""
+    return re.sub(r"^postgresql\+\w+://", "postgresql://", connection_string)
+
+
+def rows_to_record_batch(rows: list[tuple], description: Sequence) -> pa.RecordBatch:
+    """Arrow record batch from fetched rows and their cursor description,
+    with types from PG_ARROW_TYPES where the column type is common"""
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(values, type=PG_ARROW_TYPES.get(desc[1]))
+            for values, desc in zip(columns, description)
+        ],
+        names=[desc[0] for desc in description],
+    )
+
 
 class DBConnection:
     def __init__(self, connection_string: str):
@@ -61,11 +104,70 @@ class DBConnection:
             print(f"Error executing query: {e}")
             return None
 
-    def get_rowcount(self, table_name: str) -> int:
+    def stream_query_arrow(
+        self, query: str, itersize: int = 50_000, max_rows: int | None = None
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Run a query on a named server-side cursor and yield its rows as Arrow
+        record batches, so only one batch is held in memory at a time.
+
+        args:
+            query: SQL query returning rows
+            itersize: Rows fetched from the server per batch
+            max_rows: Stop after this many rows, all rows if None
+
+        returns:
+            Iterator[pa.RecordBatch]: Batches of at most itersize rows
+        """
+        # A connection of its own, so ending the cursor's transaction cannot
+        # discard uncommitted work on self.conn
+        conn = psycopg2.connect(self.connection_string)
         try:
-            self.cur.execute(f"SELECT COUNT(*) FROM {table_name}")
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                cur.execute(query)
+                fetched = 0
+                while max_rows is None or fetched < max_rows:
+                    size = (
+                        itersize
+                        if max_rows is None
+                        else min(itersize, max_rows - fetched)
+                    )
+                    rows = cur.fetchmany(size)
+                    if not rows:
+                        break
+                    fetched += len(rows)
+                    yield rows_to_record_batch(rows, cur.description)
+        finally:
+            # Also runs when the caller stops early
+            conn.close()
+
+    def stream_query(
+        self, query: str, itersize: int = 50_000, max_rows: int | None = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Run a query on a named server-side cursor and yield its rows as
+        DataFrames with nullable Arrow-backed dtypes.
+
+        args:
+            query: SQL query returning rows
+            itersize: Rows fetched from the server per batch
+            max_rows: Stop after this many rows, all rows if None
+
+        returns:
+            Iterator[pd.DataFrame]: Batches of at most itersize rows
+        """
+        for batch in self.stream_query_arrow(query, itersize, max_rows):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def get_rowcount(self, table_name: str, estimate: bool = False) -> int:
+        try:
+            if estimate:
+                # Planner statistics instead of a full scan, see db.rowcounts
+                self.cur.execute(ROW_ESTIMATE_SQL, {"table_name": table_name})
+            else:
+                self.cur.execute(f"SELECT COUNT(*) FROM {table_name}")
             result = self.cur.fetchone()
-            if result is not None:
+            if result is not None and result[0] is not None:
                 count: int = result[0]
                 return count
             else:
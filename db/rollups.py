@@ -0,0 +1,249 @@
+import logging
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Engine,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    bindparam,
+    inspect,
+    text,
+)
+
+COVERAGE_TABLE = "bdc_rollup_coverage"
+BLOCK_PROVIDERS_TABLE = "bdc_rollup_block_providers"
+H3_SERVICE_TABLE = "bdc_rollup_h3_service"
+
+# Download/upload Mbps each speed tier needs, fastest first
+SPEED_TIERS = [
+    ("1000/100", 1000, 100),
+    ("100/20", 100, 20),
+    ("25/3", 25, 3),
+]
+BELOW_TIER = "below 25/3"
+
+metadata = MetaData()
+
+coverage_table = Table(
+    COVERAGE_TABLE,
+    metadata,
+    Column("as_of_date", Text, nullable=False),
+    Column("state_usps", Text, nullable=True),
+    Column("technology", Integer, nullable=True),
+    Column("speed_tier", Text, nullable=False),
+    Column("locations", BigInteger, nullable=False),
+    Column("providers", BigInteger, nullable=False),
+    Index(f"{COVERAGE_TABLE}_as_of_date_state_usps_idx", "as_of_date", "state_usps"),
+)
+
+block_providers_table = Table(
+    BLOCK_PROVIDERS_TABLE,
+    metadata,
+    Column("as_of_date", Text, nullable=False),
+    Column("state_usps", Text, nullable=True),
+    Column("block_geoid", BigInteger, nullable=True),
+    Column("providers", BigInteger, nullable=False),
+    Column("served_providers", BigInteger, nullable=False),
+    Column("locations", BigInteger, nullable=False),
+    Index(
+        f"{BLOCK_PROVIDERS_TABLE}_as_of_date_state_usps_idx",
+        "as_of_date",
+        "state_usps",
+    ),
+    Index(f"{BLOCK_PROVIDERS_TABLE}_block_geoid_idx", "block_geoid"),
+)
+
+h3_service_table = Table(
+    H3_SERVICE_TABLE,
+    metadata,
+    Column("as_of_date", Text, nullable=False),
+    Column("state_usps", Text, nullable=True),
+    Column("h3_res8_id", Text, nullable=True),
+    Column("locations", BigInteger, nullable=False),
+    Column("served", BigInteger, nullable=False),
+    Column("underserved", BigInteger, nullable=False),
+    Column("unserved", BigInteger, nullable=False),
+    Index(f"{H3_SERVICE_TABLE}_as_of_date_state_usps_idx", "as_of_date", "state_usps"),
+    Index(f"{H3_SERVICE_TABLE}_h3_res8_id_idx", "h3_res8_id"),
+)
+
+ROLLUP_TABLES = [coverage_table, block_providers_table, h3_service_table]
+
+_NUMERIC_COLUMNS = [
+    "provider_id",
+    "location_id",
+    "technology",
+    "max_advertised_download_speed",
+    "max_advertised_upload_speed",
+    "low_latency",
+    "block_geoid",
+]
+
+
+def create_rollup_tables(engine: Engine) -> None:
+    """Create the rollup tables if they do not exist"""
+    metadata.create_all(engine, tables=ROLLUP_TABLES)
+
+
+def _column_expressions(engine: Engine, source_table: str) -> dict[str, str]:
+    # The same SQL reads the typed and untyped schemas, and tables loaded
+    # with every column as text
+    types = {
+        column["name"]: column["type"]
+        for column in inspect(engine).get_columns(source_table)
+    }
+    expressions = {}
+    for name in _NUMERIC_COLUMNS:
+        if isinstance(types.get(name), String):
+            expressions[name] = f"NULLIF({name}, '')::numeric::bigint"
+        elif isinstance(types.get(name), Float):
+            expressions[name] = f"{name}::bigint"
+        else:
+            expressions[name] = name
+    # The typed schema keeps the H3 index as a BIGINT, the rollup keeps the hex
+    expressions["h3_res8_id"] = (
+        "to_hex(h3_res8_id)"
+        if isinstance(types.get("h3_res8_id"), Integer)
+        else "h3_res8_id"
+    )
+    return expressions
+
+
+def _meets(columns: dict[str, str], download: int, upload: int) -> str:
+    return (
+        f"({columns['max_advertised_download_speed']} >= {download} "
+        f"AND {columns['max_advertised_upload_speed']} >= {upload})"
+    )
+
+
+def _speed_tier(columns: dict[str, str]) -> str:
+    cases = " ".join(
+        f"WHEN {_meets(columns, download, upload)} THEN '{tier}'"
+        for tier, download, upload in SPEED_TIERS
+    )
+    return f"CASE {cases} ELSE '{BELOW_TIER}' END"
+
+
+def _served(columns: dict[str, str], download: int, upload: int) -> str:
+    # FCC definitions: reliable broadband is low latency service at the speed
+    return f"({_meets(columns, download, upload)} AND {columns['low_latency']} = 1)"
+
+
+def rollup_queries(
+    engine: Engine,
+    source_table: str,
+    partitioned: bool,
+    states: list[str] | None = None,
+) -> dict[str, str]:
+    """INSERT ... SELECT statements that rebuild each rollup from a source
+    table, with :as_of_date and, if states are given, :states parameters
+    args:
+        engine: Engine - SQLAlchemy engine
+        source_table: str - bdc_availability or a per date table, eg. bdc_2024_06_30
+        partitioned: bool - the source has an as_of_date column to filter on
+        states: list[str] | None - only read these states, all of them if None
+    returns:
+        dict[str, str] - statement for each rollup table
+    """
+    columns = _column_expressions(engine, source_table)
+    filters = []
+    if partitioned:
+        filters.append("as_of_date = :as_of_date")
+    if states is not None:
+        filters.append("state_usps IN :states")
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    served = _served(columns, 100, 20)
+    underserved = _served(columns, 25, 3)
+
+    return {
+        COVERAGE_TABLE: f"""
+            INSERT INTO {COVERAGE_TABLE}
+                (as_of_date, state_usps, technology, speed_tier, locations, providers)
+            SELECT :as_of_date, state_usps, technology, speed_tier,
+                count(DISTINCT location_id), count(DISTINCT provider_id)
+            FROM (
+                SELECT state_usps, {columns["technology"]} AS technology,
+                    {_speed_tier(columns)} AS speed_tier,
+                    {columns["location_id"]} AS location_id,
+                    {columns["provider_id"]} AS provider_id
+                FROM {source_table} {where}
+            ) AS availability
+            GROUP BY state_usps, technology, speed_tier
+        """,
+        BLOCK_PROVIDERS_TABLE: f"""
+            INSERT INTO {BLOCK_PROVIDERS_TABLE}
+                (as_of_date, state_usps, block_geoid, providers, served_providers, locations)
+            SELECT :as_of_date, state_usps, {columns["block_geoid"]},
+                count(DISTINCT {columns["provider_id"]}),
+                count(DISTINCT {columns["provider_id"]}) FILTER (WHERE {served}),
+                count(DISTINCT {columns["location_id"]})
+            FROM {source_table} {where}
+            GROUP BY state_usps, {columns["block_geoid"]}
+        """,
+        # A location takes the best service any provider offers it
+        H3_SERVICE_TABLE: f"""
+            INSERT INTO {H3_SERVICE_TABLE}
+                (as_of_date, state_usps, h3_res8_id, locations, served, underserved, unserved)
+            SELECT :as_of_date, state_usps, h3_res8_id, count(*),
+                count(*) FILTER (WHERE served),
+                count(*) FILTER (WHERE underserved AND NOT served),
+                count(*) FILTER (WHERE NOT underserved)
+            FROM (
+                SELECT state_usps, {columns["h3_res8_id"]} AS h3_res8_id,
+                    bool_or(coalesce({served}, false)) AS served,
+                    bool_or(coalesce({underserved}, false)) AS underserved
+                FROM {source_table} {where}
+                GROUP BY state_usps, {columns["h3_res8_id"]}, {columns["location_id"]}
+            ) AS locations
+            GROUP BY state_usps, h3_res8_id
+        """,
+    }
+
+
+def refresh_rollups(
+    engine: Engine,
+    source_table: str,
+    as_of_date: str,
+    states: list[str] | None = None,
+    partitioned: bool = False,
+) -> None:
+    """Rebuild the rollups of one as of date from its source table.
+
+    Only the given states' rows are deleted and aggregated again, so a load
+    that changed a few states does not rescan the others. Every rollup is
+    replaced in one transaction, so readers never see a half refreshed date.
+
+    args:
+        engine: Engine - SQLAlchemy engine
+        source_table: str - bdc_availability or a per date table, eg. bdc_2024_06_30
+        as_of_date: str - as of date, eg. 2024-06-30
+        states: list[str] | None - states to refresh, the whole date if None
+        partitioned: bool - source_table is bdc_availability
+    """
+    if states is not None and not states:
+        return
+    create_rollup_tables(engine)
+    queries = rollup_queries(engine, source_table, partitioned, states)
+    params: dict = {"as_of_date": as_of_date}
+    if states is not None:
+        params["states"] = sorted(states)
+
+    with engine.begin() as connection:
+        for table in ROLLUP_TABLES:
+            delete = table.delete().where(table.c.as_of_date == as_of_date)
+            if states is not None:
+                delete = delete.where(table.c.state_usps.in_(params["states"]))
+            connection.execute(delete)
+            query = text(queries[table.name])
+            if states is not None:
+                query = query.bindparams(bindparam("states", expanding=True))
+            connection.execute(query, params)
+
+    refreshed = ", ".join(sorted(states)) if states is not None else "every state"
+    logging.info(f"Rollups refreshed for {as_of_date} from {source_table}: {refreshed}")
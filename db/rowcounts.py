@@ -0,0 +1,153 @@
+import logging
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import Engine, text
+
+from db.manifest import get_loaded_rows
+from db.partitions import PARENT_TABLE, date_partition_name
+
+# Planner statistics for a table, or for the leaf partitions under a
+# partitioned table. reltuples is -1 until the table is first analyzed, the
+# live tuple count from the statistics collector is used until then.
+ROW_ESTIMATE_SQL = """
+SELECT sum(
+    CASE WHEN c.reltuples >= 0 THEN c.reltuples ELSE coalesce(s.n_live_tup, 0) END
+)::bigint
+FROM pg_class c
+LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+WHERE c.relkind IN ('r', 'm')
+AND (
+    c.oid = to_regclass(%(table_name)s)
+    OR c.oid IN (
+        SELECT relid FROM pg_partition_tree(to_regclass(%(table_name)s))
+    )
+)
+"""
+
+
+@dataclass
+class RowCount:
+    """Number of rows in a table and where the number came from: manifest
+    for the rows COPY reported at load time, estimate for planner
+    statistics, or count for a full COUNT(*)."""
+
+    table_name: str
+    rows: int
+    source: str
+
+    @property
+    def exact(self) -> bool:
+        return self.source != "estimate"
+
+    def __str__(self) -> str:
+        rows = f"{self.rows:,}" if self.exact else f"about {self.rows:,}"
+        return f"{self.table_name}: {rows} rows"
+
+
+class RowCounter:
+    """Row counts of BDC tables without scanning them.
+
+    count() uses the rows COPY reported when each file was loaded, which the
+    load manifest keeps, and falls back to planner statistics for tables the
+    manifest does not cover. Rows loaded outside the manifest, eg. before it
+    existed, make its total wrong, so it is only reported when the statistics
+    roughly agree with it. Results are cached for ttl seconds.
+
+    args:
+        engine: SQLAlchemy engine
+        ttl: Seconds a count is reused before it is looked up again
+        tolerance: Share of the rows the manifest and the statistics may
+            differ by before the manifest is not trusted
+    """
+
+    def __init__(self, engine: Engine, ttl: float = 300, tolerance: float = 0.1):
+        self.engine = engine
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self._cache: dict[tuple, tuple[float, RowCount | None]] = {}
+
+    def _cached(self, key: tuple, lookup) -> RowCount | None:
+        hit = self._cache.get(key)
+        if hit is not None and time.monotonic() - hit[0] < self.ttl:
+            return hit[1]
+        result = lookup()
+        self._cache[key] = (time.monotonic(), result)
+        return result
+
+    def loaded(self, table_name: str, as_of_date: str | None = None) -> RowCount | None:
+        """Rows loaded according to the load manifest, None if the manifest
+        has no record of the table"""
+
+        def lookup():
+            rows = get_loaded_rows(self.engine, table_name, as_of_date)
+            return RowCount(table_name, rows, "manifest") if rows is not None else None
+
+        return self._cached(("loaded", table_name, as_of_date), lookup)
+
+    def estimate(self, table_name: str) -> RowCount | None:
+        """Estimated rows from planner statistics, None if the table does
+        not exist"""
+
+        def lookup():
+            with self.engine.connect() as connection:
+                rows = connection.exec_driver_sql(
+                    ROW_ESTIMATE_SQL, {"table_name": table_name}
+                ).scalar()
+            return RowCount(table_name, rows, "estimate") if rows is not None else None
+
+        return self._cached(("estimate", table_name), lookup)
+
+    def exact(self, table_name: str) -> RowCount:
+        """Rows from a full COUNT(*), only for when nothing else will do"""
+
+        def lookup():
+            with self.engine.connect() as connection:
+                rows = connection.execute(
+                    text(f"SELECT COUNT(*) FROM {table_name}")
+                ).scalar()
+            return RowCount(table_name, rows, "count")
+
+        return self._cached(("exact", table_name), lookup)
+
+    def count(self, table_name: str, as_of_date: str | None = None) -> RowCount | None:
+        """Rows from the load manifest, or an estimate if the manifest does
+        not cover the table or disagrees with the estimate by more than the
+        tolerance
+
+        args:
+            table_name: name of the table, eg. bdc_2024_06_30 or bdc_availability
+            as_of_date: only count the rows of this as of date. For
+                bdc_availability the estimate then comes from the date's
+                partition.
+        returns:
+            RowCount | None - None if the table does not exist
+        """
+        loaded = self.loaded(table_name, as_of_date)
+        if table_name == PARENT_TABLE and as_of_date is not None:
+            estimate = self.estimate(date_partition_name(as_of_date))
+        else:
+            estimate = self.estimate(table_name)
+        if estimate is None:
+            return None
+        if loaded is None:
+            logging.info(f"No load manifest for {table_name}, estimated its rows")
+            return estimate
+        if abs(loaded.rows - estimate.rows) > self.tolerance * max(
+            loaded.rows, estimate.rows
+        ):
+            logging.warning(
+                f"The load manifest has {loaded.rows:,} rows for {table_name} but "
+                f"its statistics have about {estimate.rows:,}, reporting the estimate"
+            )
+            return estimate
+        return loaded
+
+    def invalidate(self, table_name: str | None = None) -> None:
+        """Forget cached counts, of one table or of all of them"""
+        if table_name is None:
+            self._cache.clear()
+        else:
+            self._cache = {
+                key: value for key, value in self._cache.items() if key[1] != table_name
+            }
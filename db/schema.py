@@ -1,17 +1,50 @@
 import logging
+import zipfile
+from pathlib import Path
+from typing import IO, Callable
 
-from sqlalchemy import Column, Engine, Float, Integer, MetaData, Table, Text
+from sqlalchemy import (
+    CHAR,
+    BigInteger,
+    Column,
+    Connection,
+    Engine,
+    Float,
+    Integer,
+    MetaData,
+    SmallInteger,
+    Table,
+    Text,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
+from db.transform import Converter, TransformedCSV
+
+# Called with the COPY's connection and the rows copied, before it commits
+AfterCopy = Callable[[Connection, int], None]
+
 
 def copy_data_to_postgres(
-    engine: Engine, csv_path: str, table_name: str, start_id: int | None = None
-) -> None:
+    engine: Engine,
+    csv_path: str,
+    table_name: str,
+    start_id: int | None = None,
+    converters: dict[str, Converter] | None = None,
+    columns: list[str] | None = None,
+    after_copy: AfterCopy | None = None,
+) -> int:
     """Add 'id' column to CSV and copy data from a CSV file to a PostgreSQL table
     args:
         engine: Engine - SQLAlchemy engine
         csv_path: str - path to the CSV file
         table_name: str - name of the PostgreSQL table
+        converters: dict[str, Converter] - conversions applied to each row
+        columns: list[str] - table columns the CSV columns map to
+        after_copy: AfterCopy - run in the COPY's transaction, eg. to record
+            the load in the manifest
+    returns:
+        int - number of rows copied
     """
 
     # Load CSV data into a pandas DataFrame
@@ -25,14 +58,92 @@ def copy_data_to_postgres(
     # print(f"Generated IDs from {start_id} to {start_id + row_count - 1}")
 
     # Copy data to PostgreSQL
+    with open(csv_path, "r") as file:
+        return copy_file_to_postgres(
+            engine, file, table_name, converters, columns, after_copy
+        )
+
+
+def _copy_csv(
+    connection: Connection,
+    file: IO,
+    table_name: str,
+    converters: dict[str, Converter] | None,
+    columns: list[str] | None,
+) -> int:
+    if converters:
+        file = TransformedCSV(file, converters)
+    cursor = connection.connection.cursor()
+    target = f"{table_name} ({', '.join(columns)})" if columns else table_name
+    sql_copy_statement: str = (
+        f"COPY {target} FROM STDIN WITH CSV HEADER DELIMITER AS ','"
+    )
+    cursor.copy_expert(sql_copy_statement, file)
+    logging.info("Data copied to PostgreSQL")
+    return cursor.rowcount
+
+
+def copy_file_to_postgres(
+    engine: Engine,
+    file: IO,
+    table_name: str,
+    converters: dict[str, Converter] | None = None,
+    columns: list[str] | None = None,
+    after_copy: AfterCopy | None = None,
+) -> int:
+    """Copy CSV data from an open file object to a PostgreSQL table
+    args:
+        engine: Engine - SQLAlchemy engine
+        file: IO - file object opened in text or binary mode
+        table_name: str - name of the PostgreSQL table
+        converters: dict[str, Converter] - conversions applied to each row
+            as COPY reads it, eg. BDC_TYPED_CONVERTERS for a typed table
+        columns: list[str] - table columns the CSV columns map to, needed when
+            the table has columns the CSV does not, eg. a partition's as_of_date
+        after_copy: AfterCopy - run in the COPY's transaction
+    returns:
+        int - number of rows copied
+    """
     with engine.begin() as connection:
-        cursor = connection.connection.cursor()
-        with open(csv_path, "r") as file:
-            sql_copy_statement: str = (
-                f"COPY {table_name} FROM STDIN WITH CSV HEADER DELIMITER AS ','"
-            )
-            cursor.copy_expert(sql_copy_statement, file)
-            logging.info("Data copied to PostgreSQL")
+        rows = _copy_csv(connection, file, table_name, converters, columns)
+        if after_copy is not None:
+            after_copy(connection, rows)
+        return rows
+
+
+def copy_zip_to_postgres(
+    engine: Engine,
+    zip_path: str | Path,
+    table_name: str,
+    converters: dict[str, Converter] | None = None,
+    columns: list[str] | None = None,
+    after_copy: AfterCopy | None = None,
+) -> int:
+    """Stream the CSV members of a ZIP file straight into a PostgreSQL table
+    without extracting them to disk. Every member is copied in one
+    transaction.
+    args:
+        engine: Engine - SQLAlchemy engine
+        zip_path: str | Path - path to the ZIP file
+        table_name: str - name of the PostgreSQL table
+        converters: dict[str, Converter] - conversions applied to each row
+        columns: list[str] - table columns the CSV columns map to
+        after_copy: AfterCopy - run in the COPY's transaction
+    returns:
+        int - number of rows copied
+    """
+    rows = 0
+    with zipfile.ZipFile(zip_path, "r") as zip_ref, engine.begin() as connection:
+        members = [name for name in zip_ref.namelist() if name.endswith(".csv")]
+        for name in members:
+            # Members are inflated chunk by chunk as COPY reads them
+            with zip_ref.open(name) as file:
+                rows += _copy_csv(connection, file, table_name, converters, columns)
+            logging.info(f"{name} streamed from {zip_path} to PostgreSQL")
+        if after_copy is not None:
+            after_copy(connection, rows)
+
+    return rows
 
 
 class Base(DeclarativeBase):
@@ -65,7 +176,11 @@ class BDCInfo(Base):
 def create_bdc_table(
     table_name: str,
     metadata: MetaData,
+    unlogged: bool = False,
+    typed: bool = False,
 ) -> Table:
+    if typed:
+        return create_typed_bdc_table(table_name, metadata, unlogged)
     return Table(
         table_name,
         metadata,
@@ -82,4 +197,93 @@ def create_bdc_table(
         Column("block_geoid", Float, nullable=True),
         Column("h3_res8_id", Text, nullable=True),
         # Column("id", Integer, primary_key=True, autoincrement=True),
+        prefixes=["UNLOGGED"] if unlogged else [],
     )
+
+
+def create_typed_bdc_table(
+    table_name: str,
+    metadata: MetaData,
+    unlogged: bool = False,
+) -> Table:
+    """Compact BDC table with native column types. Rows have to be copied in
+    with BDC_TYPED_CONVERTERS, which turns the hex h3_res8_id into a BIGINT."""
+    return Table(
+        table_name,
+        metadata,
+        Column("frn", Integer, nullable=True),
+        Column("provider_id", Integer, nullable=True),
+        Column("brand_name", Text, nullable=True),
+        Column("location_id", BigInteger, nullable=True),
+        Column("technology", SmallInteger, nullable=True),
+        Column("max_advertised_download_speed", SmallInteger, nullable=True),
+        Column("max_advertised_upload_speed", SmallInteger, nullable=True),
+        Column("low_latency", SmallInteger, nullable=True),
+        Column("business_residential_code", CHAR(1), nullable=True),
+        Column("state_usps", CHAR(2), nullable=True),
+        Column("block_geoid", BigInteger, nullable=True),
+        Column("h3_res8_id", BigInteger, nullable=True),
+        prefixes=["UNLOGGED"] if unlogged else [],
+    )
+
+
+BDC_INDEX_COLUMNS = ["location_id", "provider_id", "block_geoid", "h3_res8_id"]
+
+
+def create_staging_table(engine: Engine, table_name: str, typed: bool = False) -> str:
+    """Create an empty UNLOGGED table with no indexes to bulk load into
+    args:
+        engine: Engine - SQLAlchemy engine
+        table_name: str - name of the table the staging table will replace
+        typed: bool - use the compact typed schema
+    returns:
+        str - name of the staging table
+    """
+    staging_name = f"{table_name}_staging"
+    metadata = MetaData()
+    staging_table = create_bdc_table(staging_name, metadata, unlogged=True, typed=typed)
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {staging_name}"))
+        staging_table.create(connection)
+
+    logging.info(f"Staging table {staging_name} created")
+    return staging_name
+
+
+def swap_staging_table(
+    engine: Engine,
+    staging_name: str,
+    table_name: str,
+    index_columns: list[str] = BDC_INDEX_COLUMNS,
+) -> None:
+    """Analyze a loaded staging table, build its indexes and swap it in
+    args:
+        engine: Engine - SQLAlchemy engine
+        staging_name: str - name of the loaded staging table
+        table_name: str - name of the table to replace
+        index_columns: list[str] - columns to index
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f"ANALYZE {staging_name}"))
+
+    # Index builds, the switch to a logged table and the rename happen in a
+    # single transaction so readers see either the old table or the new one
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {staging_name} SET LOGGED"))
+        for column in index_columns:
+            connection.execute(
+                text(
+                    f"CREATE INDEX {staging_name}_{column}_idx ON {staging_name} ({column})"
+                )
+            )
+        connection.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        connection.execute(text(f"ALTER TABLE {staging_name} RENAME TO {table_name}"))
+        for column in index_columns:
+            connection.execute(
+                text(
+                    f"ALTER INDEX {staging_name}_{column}_idx RENAME TO {table_name}_{column}_idx"
+                )
+            )
+
+    logging.info(f"Staging table {staging_name} swapped in as {table_name}")
@@ -0,0 +1,102 @@
+import csv
+import io
+from itertools import islice
+from typing import IO, Callable
+
+Converter = Callable[[str], str]
+
+
+def to_integer(value: str) -> str:
+    """Normalise an integer that may have been written as a float, eg. 1.0e14"""
+    try:
+        return str(int(value))
+    except ValueError:
+        return str(round(float(value)))
+
+
+def h3_to_integer(value: str) -> str:
+    """Convert a hex H3 cell id to the signed 64 bit integer stored in BIGINT.
+
+    The reserved high bit of a valid H3 index is always 0, so every cell fits.
+    Use to_hex(h3_res8_id) in SQL to get the hex form back.
+    """
+    return str(int(value, 16))
+
+
+# Conversions applied to each row on its way into a typed BDC table
+BDC_TYPED_CONVERTERS: dict[str, Converter] = {
+    "location_id": to_integer,
+    "max_advertised_download_speed": to_integer,
+    "max_advertised_upload_speed": to_integer,
+    "block_geoid": to_integer,
+    "h3_res8_id": h3_to_integer,
+}
+
+
+class TransformedCSV:
+    """Read-only file object that converts CSV rows as they are read.
+
+    Wraps a CSV stream (text or binary) and applies a converter to the named
+    columns of every row, so COPY can read converted rows without the file
+    ever being rewritten on disk. Empty values are passed through as NULL.
+
+    Args:
+        file: CSV file object with a header row
+        converters: Converter to apply to each named column
+        batch_size: Number of rows converted at a time
+    """
+
+    def __init__(
+        self, file: IO, converters: dict[str, Converter], batch_size: int = 1000
+    ):
+        if isinstance(file, io.TextIOBase):
+            text_file = file
+        else:
+            text_file = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        self._reader = csv.reader(text_file)
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out, lineterminator="\n")
+        self._batch_size = batch_size
+        self._pending = ""
+        self._offset = 0
+
+        header = next(self._reader, None)
+        self._conversions: list[tuple[int, Converter]] = []
+        if header is not None:
+            self._writer.writerow(header)
+            self._conversions = [
+                (index, converters[name])
+                for index, name in enumerate(header)
+                if name in converters
+            ]
+        self._flush()
+
+    def _flush(self):
+        self._pending = self._pending[self._offset :] + self._out.getvalue()
+        self._offset = 0
+        self._out.seek(0)
+        self._out.truncate()
+
+    def _convert_batch(self) -> bool:
+        rows = list(islice(self._reader, self._batch_size))
+        if not rows:
+            return False
+        for row in rows:
+            for index, converter in self._conversions:
+                if index < len(row) and row[index] != "":
+                    row[index] = converter(row[index])
+            self._writer.writerow(row)
+        self._flush()
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) - self._offset < size:
+            if not self._convert_batch():
+                break
+
+        if size < 0:
+            data = self._pending[self._offset :]
+        else:
+            data = self._pending[self._offset : self._offset + size]
+        self._offset += len(data)
+        return data
@@ -1,12 +1,184 @@
+import asyncio
+import json
 import logging
+import os
 import time
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Callable
 
+import backoff
 import httpx
 
+from src.ratelimit import AdaptiveConcurrency, TokenBucket, is_throttled, retry_after
+
+
+class DownloadError(Exception):
+    """Raised when a downloaded file is incomplete or fails verification."""
+
+
+def _is_permanent_error(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    return False
+
+
+def _content_range_total(content_range: str | None) -> int | None:
+    # Content-Range looks like "bytes 100-199/200" or "bytes */200"
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+def _verify_zip(path: str | Path) -> None:
+    with zipfile.ZipFile(path) as zip_ref:
+        bad_member = zip_ref.testzip()
+    if bad_member is not None:
+        raise zipfile.BadZipFile(f"CRC check failed for {bad_member}")
+
+
+class MetadataCache:
+    """Responses of the listing endpoints, keyed by URL.
+
+    An entry is served without a request until it is older than ttl seconds.
+    After that it is revalidated with If-None-Match/If-Modified-Since when
+    the API sent an ETag or Last-Modified header, and a 304 keeps it.
+
+    Args:
+        ttl: Seconds an entry is served without asking the API
+        path: JSON file the cache is persisted to, in memory only if None
+    """
+
+    def __init__(self, ttl: float = 3600, path: str | Path | None = None):
+        self.ttl = ttl
+        self.path = Path(path) if path is not None else None
+        self._entries: dict[str, dict] = {}
+        if self.path is not None and self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except ValueError as e:
+                logging.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+
+    def get(self, url: str) -> dict | None:
+        return self._entries.get(url)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def put(self, url: str, data, headers: httpx.Headers | dict) -> None:
+        self._entries[url] = {
+            "data": data,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        self._save()
+
+    def touch(self, url: str) -> None:
+        self._entries[url]["fetched_at"] = time.time()
+        self._save()
+
+    def invalidate(self, match: str | None = None) -> None:
+        """Drop every entry, or only those whose URL contains match"""
+        self._entries = {
+            url: entry
+            for url, entry in self._entries.items()
+            if match is not None and match not in url
+        }
+        self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        part = self.path.with_name(f"{self.path.name}.part")
+        part.write_text(json.dumps(self._entries))
+        os.replace(part, self.path)
+
+
+def create_http_client(
+    max_connections: int = 32,
+    max_keepalive_connections: int = 16,
+    keepalive_expiry: float = 60.0,
+    http2: bool = False,
+) -> httpx.AsyncClient:
+    """Create the pooled client shared by the BDC API and the uploads.
+
+    Args:
+        max_connections: Maximum number of open connections
+        max_keepalive_connections: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept open
+        http2: Negotiate HTTP/2 where the server supports it. Needs the h2
+            package, falls back to HTTP/1.1 without it.
+
+    Returns:
+        httpx.AsyncClient: The pooled client
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logging.warning("h2 is not installed, using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        http2=http2,
+    )
+
 
 class BDC:
-    def __init__(self, username: str, api_key: str):
-        self.client = httpx.AsyncClient()
+    """Client for the BDC public data API.
+
+    Use it as an async context manager, or call aclose(), so the pooled
+    connections are closed when done. The pooled client is also exposed as
+    BDC.client for other requests, eg. uploads, to share.
+
+    Args:
+        username: FCC user registration username
+        api_key: API token generated in the BDC system
+        max_download_tries: Attempts made for each download
+        metadata_ttl: Seconds a listing is served from the metadata cache
+        metadata_cache_path: JSON file the metadata cache is persisted to
+        list_rate_limit: Listing calls allowed per minute
+        download_rate_limit: Downloads allowed per minute
+        max_download_concurrency: Most downloads the adaptive limit allows
+        client: Client to use instead of creating one, it is not closed by
+            aclose()
+        http2: Negotiate HTTP/2 on the client created here
+    """
+
+    def __init__(
+        self,
+        username: str,
+        api_key: str,
+        max_download_tries: int = 5,
+        metadata_ttl: float = 3600,
+        metadata_cache_path: str | Path | None = None,
+        list_rate_limit: float = 10,
+        download_rate_limit: float = 60,
+        max_download_concurrency: int = 16,
+        client: httpx.AsyncClient | None = None,
+        http2: bool = False,
+    ):
+        self._owns_client = client is None
+        self.client = client if client is not None else create_http_client(http2=http2)
+        self.max_download_tries = max_download_tries
+        self.metadata = MetadataCache(metadata_ttl, metadata_cache_path)
+        # Requests per minute allowed by the API specification
+        self.list_limiter = TokenBucket(list_rate_limit)
+        self.download_limiter = TokenBucket(download_rate_limit)
+        self.download_concurrency = AdaptiveConcurrency(
+            initial=min(4, max_download_concurrency),
+            maximum=max_download_concurrency,
+        )
         self.baseURL = "https://broadbandmap.fcc.gov/api/public/map"
         self.headersList = {
             "Accept": "application/json",
@@ -15,12 +187,23 @@ class BDC:
             "hash_value": api_key,
         }
 
+    async def __aenter__(self) -> "BDC":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the pooled connections, unless the client was passed in"""
+        if self._owns_client:
+            await self.client.aclose()
+
     async def getlistofDates(
         self, data_type: str = "availability"
     ) -> tuple[str, list[str]]:
         reqUrl = f"{self.baseURL}/listAsOfDates"
-        data = await self.client.get(url=reqUrl, headers=self.headersList)
-        dates = data.json()["data"]
+        data = await self.getMetadata(reqUrl)
+        dates = data["data"]
         dates = [i["as_of_date"] for i in dates if i["data_type"] == data_type]
         dates.reverse()
         return data_type, dates
@@ -30,27 +213,251 @@ class BDC:
         date: str,
         category: str,
         subcategory: str = "",
+        technology_type: str | None = "Fixed Broadband",
+        file_type: str | None = "csv",
+        include_satellite: bool = False,
     ) -> list[dict]:
+        """List the availability files for an as of date.
+
+        Args:
+            date: As of date, eg. 2024-06-30
+            category: State, Provider or Summary
+            subcategory: Subcategory within the category, all if empty
+            technology_type: Only files of this technology type, eg. Mobile
+                Broadband, all types if None
+            file_type: Only files of this type, csv or gis, all types if None
+            include_satellite: Keep the satellite provider files
+
+        Returns:
+            list[dict]: The matching files from the listing
+        """
         reqUrl = f"{self.baseURL}/downloads/listAvailabilityData/{date}?category={category}&subcategory={subcategory}"
-        data = await self.client.get(url=reqUrl, headers=self.headersList)
+        data = await self.getMetadata(reqUrl)
         downloadList = [
             i
-            for i in data.json()["data"]
-            if "Satellite" not in i["file_name"]
-            and "Fixed Broadband" == i["technology_type"]
-            and "csv" == i["file_type"]
+            for i in data["data"]
+            if (include_satellite or "Satellite" not in i["file_name"])
+            and (technology_type is None or technology_type == i.get("technology_type"))
+            and (file_type is None or file_type == i.get("file_type"))
         ]
         # downloadList.sort(key=lambda x: x["state_fips"])
         return downloadList
 
-    async def getDownloadFile(self, file_id: int):
+    async def getMetadata(self, url: str):
+        """GET a listing endpoint through the metadata cache.
+
+        Args:
+            url: URL of the listing
+
+        Returns:
+            The decoded JSON response
+        """
+        entry = self.metadata.get(url)
+        if entry is not None and self.metadata.is_fresh(entry):
+            return entry["data"]
+
+        headers = dict(self.headersList)
+        if entry is not None and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        async def request() -> httpx.Response:
+            await self.list_limiter.acquire()
+            response = await self.client.get(url=url, headers=headers)
+            self._checkThrottled(response, self.list_limiter)
+            return response
+
+        response = await self._retry(request)
+
+        if response.status_code == 304 and entry is not None:
+            self.metadata.touch(url)
+            return entry["data"]
+        data = response.json()
+        if response.status_code == 200:
+            self.metadata.put(url, data, response.headers)
+        return data
+
+    def invalidateMetadata(self, date: str | None = None) -> None:
+        """Forget cached listings so the next call asks the API again.
+
+        Args:
+            date: Only forget the listings for this as of date
+        """
+        self.metadata.invalidate(date)
+
+    def _checkThrottled(self, response: httpx.Response, limiter: TokenBucket):
+        """Slow down and raise if the API throttled or failed a request"""
+        if not is_throttled(response):
+            return
+        wait = retry_after(response)
+        if wait is not None:
+            logging.warning(f"API asked to retry after {wait:.0f}s")
+            limiter.pause(wait)
+        if limiter is self.download_limiter:
+            self.download_concurrency.throttled()
+        response.raise_for_status()
+
+    async def _retry(self, request: Callable):
+        return await backoff.on_exception(
+            backoff.expo,
+            (httpx.TransportError, httpx.HTTPStatusError),
+            max_tries=self.max_download_tries,
+            giveup=_is_permanent_error,
+        )(request)()
+
+    def _downloadURL(self, file_id: int, gis_file_type: int | None = None) -> str:
+        # gis_file_type is 1 for a shapefile, 2 for a GeoPackage and must be
+        # left out for CSV files
         reqUrl = f"{self.baseURL}/downloads/downloadfile/availability/{file_id}"
-        response = await self.client.get(
+        if gis_file_type is not None:
+            reqUrl = f"{reqUrl}/{gis_file_type}"
+        return reqUrl
+
+    async def getDownloadFile(self, file_id: int, gis_file_type: int | None = None):
+        reqUrl = self._downloadURL(file_id, gis_file_type)
+
+        async def request() -> httpx.Response:
+            async with self.download_concurrency:
+                await self.download_limiter.acquire()
+                response = await self.client.get(
+                    url=reqUrl,
+                    headers=self.headersList,
+                    timeout=httpx.Timeout(connect=5.0, read=30.0, write=5.0, pool=5.0),
+                )
+                self._checkThrottled(response, self.download_limiter)
+                self.download_concurrency.success()
+                return response
+
+        return await self._retry(request)
+
+    async def streamDownloadFile(
+        self,
+        file_id: int,
+        path: str | Path,
+        chunk_size: int = 1024 * 1024,
+        on_progress: Callable[[int, int | None, float], None] | None = None,
+        verify: bool = True,
+        gis_file_type: int | None = None,
+    ) -> Path:
+        """Stream a file to disk chunk by chunk instead of buffering it in memory.
+
+        The file is written to ``{path}.part`` and only renamed to ``path`` once
+        it is complete. If a download is interrupted the partial file is kept and
+        the next attempt continues it with an HTTP Range request. Failed attempts
+        are retried with exponential backoff.
+
+        Each attempt waits for the download rate limiter and a slot from the
+        adaptive concurrency limit. A 429 or 5xx response halves that limit
+        and pauses every download until its Retry-After time.
+
+        Args:
+            file_id: ID of the file to download
+            path: Path the downloaded file is written to
+            chunk_size: Number of bytes read from the network at a time
+            on_progress: Called with (bytes downloaded, total bytes, bytes/sec)
+                after every chunk
+            verify: Check the CRC of every member of the downloaded ZIP file
+            gis_file_type: 1 for a shapefile or 2 for a GeoPackage when
+                downloading a gis file
+
+        Returns:
+            Path: Path to the downloaded file
+        """
+        path = Path(path)
+
+        async def attempt() -> Path:
+            async with self.download_concurrency:
+                await self.download_limiter.acquire()
+                part_path = await self._streamDownloadPart(
+                    file_id, path, chunk_size, on_progress, gis_file_type
+                )
+                self.download_concurrency.success()
+            if verify:
+                try:
+                    await asyncio.to_thread(_verify_zip, part_path)
+                except (zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+                    # A corrupt part file can't be resumed, start over
+                    os.remove(part_path)
+                    raise DownloadError(
+                        f"File {file_id} failed verification: {e}"
+                    ) from e
+            return part_path
+
+        download = backoff.on_exception(
+            backoff.expo,
+            (httpx.TransportError, httpx.HTTPStatusError, DownloadError),
+            max_tries=self.max_download_tries,
+            giveup=_is_permanent_error,
+        )(attempt)
+        part_path = await download()
+
+        os.replace(part_path, path)
+        return path
+
+    async def _streamDownloadPart(
+        self,
+        file_id: int,
+        path: Path,
+        chunk_size: int,
+        on_progress: Callable[[int, int | None, float], None] | None,
+        gis_file_type: int | None = None,
+    ) -> Path:
+        reqUrl = self._downloadURL(file_id, gis_file_type)
+        part_path = path.with_name(f"{path.name}.part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = dict(self.headersList)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        downloaded = 0
+        start = time.monotonic()
+
+        async with self.client.stream(
+            "GET",
             url=reqUrl,
-            headers=self.headersList,
+            headers=headers,
             timeout=httpx.Timeout(connect=5.0, read=30.0, write=5.0, pool=5.0),
+        ) as response:
+            if response.status_code == 416:
+                # The part file is already complete, or the server no longer
+                # has the range we asked for
+                total = _content_range_total(response.headers.get("Content-Range"))
+                if total == offset:
+                    return part_path
+                os.remove(part_path)
+                raise DownloadError(f"Range not satisfiable for file {file_id}")
+            self._checkThrottled(response, self.download_limiter)
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                total = _content_range_total(response.headers.get("Content-Range"))
+                mode = "ab"
+                logging.info(f"Resuming file {file_id} at byte {offset}")
+            else:
+                content_length = response.headers.get("Content-Length")
+                total = int(content_length) if content_length else None
+                offset = 0
+                mode = "wb"
+
+            with open(part_path, mode) as file:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    file.write(chunk)
+                    downloaded += len(chunk)
+                    if on_progress is not None:
+                        elapsed = max(time.monotonic() - start, 1e-6)
+                        on_progress(offset + downloaded, total, downloaded / elapsed)
+
+        size = part_path.stat().st_size
+        if total is not None and size != total:
+            raise DownloadError(
+                f"File {file_id} is incomplete: {size} of {total} bytes downloaded"
+            )
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        logging.info(
+            f"Downloaded file {file_id}: {downloaded / 1024 / 1024:.2f}MB at {downloaded / elapsed / 1024 / 1024:.2f}MB/s"
         )
-        return response
+        return part_path
 
     async def downloadFiles(self, files: list):
         for file in files:
@@ -58,7 +465,6 @@ class BDC:
             try:
                 await self.getDownloadFile(file_id=file["file_id"])
                 print(f"Downloaded {index + 1} of {len(files)}")
-                time.sleep(1)
             except Exception as e:
                 logging.error(f"Failed to download file {index + 1}: {e}")
                 pass
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from db.manifest import is_file_changed
+from src.utils import file_checksum
+
+
+class DownloadCache:
+    """Content-addressed local cache of downloaded BDC files.
+
+    Each file is stored once under the SHA-256 of its contents and indexed
+    by as of date and file_id, along with the file name and record count
+    from the download list so a republished file is not served from the
+    cache. When the cache grows past max_size_gb the least recently used
+    files are evicted.
+
+    Args:
+        path: Directory the cache is kept in
+        max_size_gb: Size the cache is trimmed to after each file is added
+    """
+
+    def __init__(self, path: str | Path = "./cache", max_size_gb: float = 50):
+        self.path = Path(path)
+        self.max_size_bytes = int(max_size_gb * 1024**3)
+        self._objects = self.path / "objects"
+        self._index_path = self.path / "index.json"
+        self._lock = threading.Lock()
+        self._objects.mkdir(parents=True, exist_ok=True)
+        self._index: dict[str, dict] = (
+            json.loads(self._index_path.read_text())
+            if self._index_path.exists()
+            else {}
+        )
+
+    @staticmethod
+    def _key(as_of_date: str, file_id) -> str:
+        return f"{as_of_date}/{file_id}"
+
+    def _object_path(self, checksum: str) -> Path:
+        return self._objects / f"{checksum}.zip"
+
+    def _save_index(self):
+        part = self._index_path.with_suffix(".json.part")
+        part.write_text(json.dumps(self._index, indent=2))
+        os.replace(part, self._index_path)
+
+    @property
+    def size_bytes(self) -> int:
+        """Total size of the files in the cache"""
+        with self._lock:
+            return self._size_bytes()
+
+    def _size_bytes(self) -> int:
+        checksums = {
+            entry["checksum"]: entry["size_bytes"] for entry in self._index.values()
+        }
+        return sum(checksums.values())
+
+    def get(self, as_of_date: str, file: dict) -> dict | None:
+        """Look up a file from BDC.getDownloadList.
+
+        Args:
+            as_of_date: As of date of the file
+            file: Entry from the download list
+
+        Returns:
+            dict | None: Cache entry with path, size_bytes and checksum, or
+                None if the file is not cached or has changed since
+        """
+        key = self._key(as_of_date, file["file_id"])
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            path = self._object_path(entry["checksum"])
+            if is_file_changed(file, entry) or not path.exists():
+                del self._index[key]
+                self._save_index()
+                return None
+            entry["last_used"] = time.time()
+            self._save_index()
+            return {**entry, "path": str(path)}
+
+    def put(self, as_of_date: str, file: dict, source: str | Path | bytes) -> dict:
+        """Add a downloaded file to the cache.
+
+        Args:
+            as_of_date: As of date of the file
+            file: Entry from the download list
+            source: Path to the downloaded ZIP, or its contents
+
+        Returns:
+            dict: Cache entry with path, size_bytes and checksum
+        """
+        size_bytes, checksum = file_checksum(source)
+        path = self._object_path(checksum)
+        if not path.exists():
+            part = path.with_name(f"{path.name}.{threading.get_ident()}.part")
+            if isinstance(source, bytes):
+                part.write_bytes(source)
+            else:
+                link_or_copy(source, part)
+            os.replace(part, path)
+
+        record_count = file.get("record_count")
+        entry = {
+            "file_name": file.get("file_name"),
+            "record_count": str(record_count) if record_count is not None else None,
+            "size_bytes": size_bytes,
+            "checksum": checksum,
+            "last_used": time.time(),
+        }
+        with self._lock:
+            self._index[self._key(as_of_date, file["file_id"])] = entry
+            self._evict()
+            self._save_index()
+        return {**entry, "path": str(path)}
+
+    def invalidate(self, as_of_date: str, file_id) -> None:
+        """Drop one file from the cache"""
+        with self._lock:
+            entry = self._index.pop(self._key(as_of_date, file_id), None)
+            if entry is not None:
+                self._remove_unreferenced(entry["checksum"])
+                self._save_index()
+
+    def paths(self, as_of_date: str) -> list[str]:
+        """Paths of the cached files for an as of date, eg. to pass to
+        combineCSVsintoDataFrame"""
+        prefix = f"{as_of_date}/"
+        with self._lock:
+            return sorted(
+                str(self._object_path(entry["checksum"]))
+                for key, entry in self._index.items()
+                if key.startswith(prefix)
+            )
+
+    def _remove_unreferenced(self, checksum: str):
+        if all(entry["checksum"] != checksum for entry in self._index.values()):
+            self._object_path(checksum).unlink(missing_ok=True)
+
+    def _evict(self):
+        # Least recently used first. A file in use elsewhere is hard linked or
+        # copied out of the cache, so removing it here is safe.
+        for key, entry in sorted(
+            self._index.items(), key=lambda item: item[1]["last_used"]
+        ):
+            if self._size_bytes() <= self.max_size_bytes:
+                return
+            del self._index[key]
+            self._remove_unreferenced(entry["checksum"])
+            logging.info(f"Evicted {entry['file_name']} from the download cache")
+
+
+def link_or_copy(source: str | Path, destination: str | Path) -> None:
+    """Hard link a file, or copy it when linking is not possible, eg. across
+    file systems"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
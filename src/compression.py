@@ -0,0 +1,67 @@
+import gzip
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import pyarrow as pa
+
+# File extension and media type of each codec
+COMPRESSION_EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+COMPRESSION_CONTENT_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def _compress_block(block: bytes, codec: str, level: int | None) -> bytes:
+    # zlib and Arrow's zstd release the GIL, so blocks compress in parallel
+    if codec == "gzip":
+        return gzip.compress(
+            block, compresslevel=6 if level is None else level, mtime=0
+        )
+    return pa.Codec("zstd", compression_level=level).compress(block, asbytes=True)
+
+
+def compress_blocks(
+    filepath: str | Path,
+    codec: str = "zstd",
+    level: int | None = None,
+    block_size: int = BLOCK_SIZE,
+    threads: int | None = None,
+) -> Iterator[bytes]:
+    """
+    Compress a file in independent blocks on a thread pool.
+
+    Each block becomes a complete gzip member or zstd frame. Concatenated
+    members and frames are themselves a valid gzip or zstd file, so the
+    blocks can be written or uploaded as soon as they are ready, and any run
+    of them decompresses on its own. Blocks are compressed ahead of the one
+    being yielded, at most two per thread.
+
+    Args:
+        filepath: Path to the file to compress
+        codec: gzip or zstd
+        level: Compression level, the codec's default if None
+        block_size: Bytes of the file compressed per block
+        threads: Number of blocks compressed at once, one per CPU if None
+
+    Returns:
+        Iterator[bytes]: Compressed blocks in file order
+
+    Raises:
+        ValueError: If the codec is not supported
+    """
+    if codec not in COMPRESSION_EXTENSIONS:
+        raise ValueError(
+            f"Unsupported codec {codec}, choose from {', '.join(COMPRESSION_EXTENSIONS)}"
+        )
+    threads = threads or os.cpu_count() or 1
+    with open(filepath, "rb") as f, ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        while True:
+            while len(pending) < threads * 2 and (block := f.read(block_size)):
+                pending.append(executor.submit(_compress_block, block, codec, level))
+            if not pending:
+                return
+            yield pending.popleft().result()
@@ -0,0 +1,165 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas import DataFrame
+
+# Compact pandas dtypes for the columns of a BDC availability CSV, and the
+# source of the Parquet schema. Integer columns are sized to the real value
+# domain, eg. 10 digit location ids and 15 digit block GEOIDs, but never past
+# the column of the typed Postgres table, so a file that passes check_dtypes
+# also fits a typed COPY: speeds are SMALLINT there, so Int16 here. They are
+# nullable because some files leave speeds empty. Only strings with few
+# distinct values are categories.
+BDC_DTYPES = {
+    "frn": "category",
+    "provider_id": "Int32",
+    "brand_name": "category",
+    "location_id": "UInt32",
+    "technology": "UInt8",
+    "max_advertised_download_speed": "Int16",
+    "max_advertised_upload_speed": "Int16",
+    "low_latency": "UInt8",
+    "business_residential_code": "category",
+    "state_usps": "category",
+    "block_geoid": "Int64",
+    "h3_res8_id": "string[pyarrow]",
+}
+
+# Categories are dictionary encoded with 32 bit indices, so every batch of a
+# file has the same type whatever its number of distinct values
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# A category column with more distinct values than this share of its rows
+# uses more memory than a plain string column. Smaller samples are not
+# checked, they have too few rows to tell.
+MAX_CATEGORY_RATIO = 0.5
+MIN_CATEGORY_SAMPLE = 1000
+
+
+class DtypeOverflowError(ValueError):
+    """Raised when a value does not fit the dtype of its column."""
+
+
+def _integer_bounds(dtype: str) -> tuple[int, int] | None:
+    pandas_dtype = pd.api.types.pandas_dtype(dtype)
+    if not pd.api.types.is_integer_dtype(pandas_dtype):
+        return None
+    info = np.iinfo(getattr(pandas_dtype, "numpy_dtype", pandas_dtype))
+    return int(info.min), int(info.max)
+
+
+def arrow_type(dtype: str) -> pa.DataType:
+    """Arrow type a column of a BDC_DTYPES dtype is written to Parquet as"""
+    if dtype == "category":
+        return _DICTIONARY
+    pandas_dtype = pd.api.types.pandas_dtype(dtype)
+    if pd.api.types.is_integer_dtype(pandas_dtype):
+        return pa.from_numpy_dtype(pandas_dtype.numpy_dtype)
+    return pa.string()
+
+
+def arrow_schema(columns: list[str] | None = None) -> pa.Schema:
+    """Arrow schema of BDC_DTYPES.
+
+    Args:
+        columns: Only these columns, in this order, all columns if None
+
+    Returns:
+        pa.Schema: Arrow type of each column
+    """
+    if columns is None:
+        columns = list(BDC_DTYPES)
+    return pa.schema([(column, arrow_type(BDC_DTYPES[column])) for column in columns])
+
+
+def read_dtypes(columns: list[str] | None = None) -> dict[str, str]:
+    """dtype argument for read_csv that cannot overflow.
+
+    Integer columns are read as Int64 and narrowed by cast_batch once their
+    values are checked, because read_csv silently wraps values that do not
+    fit a smaller integer dtype.
+
+    Args:
+        columns: Only the dtypes of these columns, all columns if None
+
+    Returns:
+        dict[str, str]: dtype of each column
+    """
+    return {
+        column: "Int64" if _integer_bounds(dtype) else dtype
+        for column, dtype in BDC_DTYPES.items()
+        if columns is None or column in columns
+    }
+
+
+def cast_batch(batch: DataFrame, source: str = "") -> DataFrame:
+    """Narrow a batch read with read_dtypes to BDC_DTYPES.
+
+    Args:
+        batch: DataFrame read with read_dtypes
+        source: Name of the file the batch came from, used in errors
+
+    Returns:
+        DataFrame: The batch with compact dtypes
+
+    Raises:
+        DtypeOverflowError: If a value is outside the range of its dtype
+    """
+    for column in batch.columns:
+        bounds = _integer_bounds(BDC_DTYPES.get(column, "object"))
+        if bounds is None:
+            continue
+        low, high = batch[column].min(), batch[column].max()
+        if pd.notna(low) and (low < bounds[0] or high > bounds[1]):
+            raise DtypeOverflowError(
+                f"{source}: {column} has values from {low} to {high}, "
+                f"outside the {BDC_DTYPES[column]} range {bounds[0]} to {bounds[1]}"
+            )
+    return batch.astype(
+        {column: BDC_DTYPES[column] for column in batch.columns if column in BDC_DTYPES}
+    )
+
+
+def check_dtypes(
+    paths: list[str | Path],
+    sample_rows: int = 100_000,
+    columns: list[str] | None = None,
+) -> None:
+    """Check that a sample of each file fits BDC_DTYPES before a long read.
+
+    Args:
+        paths: CSV files to check
+        sample_rows: Number of rows read from the start of each file
+        columns: Only check these columns, all columns if None
+
+    Raises:
+        DtypeOverflowError: If a sampled value does not fit its dtype
+    """
+    for path in paths:
+        try:
+            sample = pd.read_csv(
+                path,
+                encoding="utf-8",
+                usecols=columns,
+                dtype=read_dtypes(columns),
+                nrows=sample_rows,
+                index_col=False,
+            )
+        except (TypeError, ValueError) as e:
+            raise DtypeOverflowError(f"{path}: {e}") from e
+        cast_batch(sample, str(path))
+
+        for column in sample.columns:
+            if (
+                BDC_DTYPES.get(column) != "category"
+                or len(sample) < MIN_CATEGORY_SAMPLE
+            ):
+                continue
+            ratio = sample[column].nunique() / len(sample)
+            if ratio > MAX_CATEGORY_RATIO:
+                logging.warning(
+                    f"{path}: {column} has {ratio:.0%} distinct values, too many for a category"
+                )
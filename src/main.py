@@ -1,16 +1,22 @@
+import argparse
 import asyncio
-import json
 import logging
 import os
 import sys
 
 from dotenv import load_dotenv
-from sqlalchemy import MetaData, create_engine, inspect, text
+from sqlalchemy import Engine, MetaData, inspect
 from tqdm import tqdm
 
-from db.schema import copy_data_to_postgres, create_bdc_table
+from db.loader import create_bulk_engine
+from db.partitions import PARENT_TABLE
+from db.rowcounts import RowCounter
+from db.schema import create_bdc_table
 from src.bdc_api import BDC
-from src.utils import check_file_size, extractZip, upload_file_to_zapier, zip_file
+from src.cache import DownloadCache
+from src.pipeline import IngestPipeline, PipelineConfig, PipelineResult
+from src.planner import DownloadSelection, plan_downloads, run_plan
+from src.uploads import UploadQueue, retry_uploads
 
 load_dotenv()
 
@@ -21,110 +27,354 @@ ZAPIER_WEBHOOK = str(os.getenv("ZAPIER_WEBHOOK"))
 
 CONNECTION_STRING = str(os.getenv("CONNECTION_STRING"))
 
-logging.basicConfig(level=logging.WARNING)
+CACHE_PATH = os.getenv("CACHE_PATH", "./cache")
 
+SINKS = ["postgres", "parquet", "zapier"]
 
-async def main():
-    engine = create_engine(CONNECTION_STRING)
-    inspector = inspect(engine)
-    metadata = MetaData()
 
-    # Initialize the BDC class
-    bdc = BDC(USERNAME, API_KEY)
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Parse the command line arguments.
 
-    # Get the list of dates
-    dates = await bdc.getlistofDates()
+    Args:
+        argv: Arguments, sys.argv[1:] if None
 
-    # Seperate the data_type and dates
-    data_type, dates = dates
-    print(f"Data Type: {data_type}")
-    print("Dates:")
-    for date in dates:
-        print(f"for {date} enter {dates.index(date) + 1}")
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main",
+        description="Download BDC availability files and load them into Postgres, a Parquet dataset and Zapier.",
+    )
+    parser.add_argument(
+        "--dates",
+        nargs="+",
+        default=["latest"],
+        help="As of dates to ingest: latest, all, YYYY-MM-DD or a range START:END, "
+        "either end of which can be left open (default: latest)",
+    )
+    parser.add_argument(
+        "--list-dates",
+        action="store_true",
+        help="Print the available as of dates and exit",
+    )
+    parser.add_argument(
+        "--states",
+        nargs="+",
+        type=str.upper,
+        help="State USPS codes to ingest, eg. AL GA (default: every state)",
+    )
+    parser.add_argument("--categories", nargs="+", default=["State"])
+    parser.add_argument("--subcategories", nargs="+")
+    parser.add_argument(
+        "--technology-types",
+        nargs="+",
+        default=["Fixed Broadband"],
+        help="Technology types to ingest, or all (default: Fixed Broadband)",
+    )
+    parser.add_argument("--include-satellite", action="store_true")
+    parser.add_argument(
+        "--sinks",
+        nargs="+",
+        choices=SINKS,
+        default=["postgres", "zapier"],
+        help="Where the files are loaded (default: postgres zapier)",
+    )
+    parser.add_argument("--parquet-path", default="./parquet")
+    parser.add_argument(
+        "--upload-parquet",
+        action="store_true",
+        help="Upload the Parquet files to Zapier instead of the CSVs",
+    )
+    parser.add_argument(
+        "--upload-compression",
+        choices=["zip", "gzip", "zstd"],
+        default="zip",
+        help="How files too large to upload as they are get compressed. gzip and "
+        "zstd compress in parallel while the upload streams (default: zip)",
+    )
+    parser.add_argument("--compression-threads", type=int)
+    parser.add_argument(
+        "--upload-queue",
+        default="./upload_queue.json",
+        help="JSON file failed uploads are queued in to retry",
+    )
+    parser.add_argument(
+        "--retry-uploads",
+        action="store_true",
+        help="Retry the queued uploads and exit",
+    )
+    parser.add_argument("--cache-path", default=CACHE_PATH)
+    parser.add_argument("--cache-size-gb", type=float, default=50)
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Always download, skip the cache"
+    )
+    parser.add_argument(
+        "--download-concurrency",
+        type=int,
+        default=4,
+        help="Downloads at once across every date",
+    )
+    parser.add_argument("--extract-concurrency", type=int, default=2)
+    parser.add_argument(
+        "--copy-concurrency", type=int, default=2, help="COPY streams per date"
+    )
+    parser.add_argument("--upload-concurrency", type=int, default=2)
+    parser.add_argument(
+        "--parallel-dates",
+        type=int,
+        default=1,
+        help="Dates ingested at the same time (default: 1)",
+    )
+    parser.add_argument("--stream-copy", action="store_true")
+    parser.add_argument("--fast-load", action="store_true")
+    parser.add_argument("--typed", action="store_true", help="Use the typed schema")
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help=f"Load into the {PARENT_TABLE} table partitioned by date and state",
+    )
+    parser.add_argument(
+        "--rollups",
+        action="store_true",
+        help="Refresh the bdc_rollup_* summary tables for the states loaded",
+    )
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="Reload files the manifest shows are already loaded",
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    for name in ("download", "extract", "copy", "upload"):
+        if getattr(args, f"{name}_concurrency") < 1:
+            parser.error(f"--{name}-concurrency must be at least 1")
+    if args.parallel_dates < 1:
+        parser.error("--parallel-dates must be at least 1")
+    if "zapier" not in args.sinks and (
+        args.categories != ["State"] or args.technology_types != ["Fixed Broadband"]
+    ):
+        # Only State Fixed Broadband CSVs are loaded, the rest are uploaded
+        parser.error(
+            "Files other than State Fixed Broadband availability CSVs need the zapier sink"
+        )
+    if args.fast_load and (args.states or args.subcategories):
+        # The staging table replaces the whole date's table, so it has to
+        # hold every state
+        parser.error(
+            "--fast-load replaces the whole table and needs every state, drop --states and --subcategories"
+        )
+    if args.stream_copy and "postgres" not in args.sinks:
+        parser.error("--stream-copy needs the postgres sink")
+    return args
+
+
+def select_dates(available: list[str], specs: list[str]) -> list[str]:
+    """Resolve date arguments against the dates the API has files for.
+
+    Args:
+        available: As of dates from BDC.getlistofDates
+        specs: latest, all, a date or a START:END range
+
+    Returns:
+        list[str]: Selected dates, oldest first
 
-    # Get the date from the user from the index of the dates list
-    date: str = input("Enter a date (eg.2023-12-31): ")
-    if date not in [str(i) for i in range(1, len(dates) + 1)]:
-        raise ValueError("Invalid date")
-        sys.exit(1)
+    Raises:
+        ValueError: If a date is not available or a range matches no dates
+    """
+    available = sorted(available)
+    selected: set[str] = set()
+    for spec in specs:
+        if spec == "all":
+            selected.update(available)
+        elif spec == "latest":
+            selected.update(available[-1:])
+        elif ":" in spec:
+            start, end = spec.split(":", 1)
+            dates = [
+                date
+                for date in available
+                if (not start or date >= start) and (not end or date <= end)
+            ]
+            if not dates:
+                raise ValueError(f"No dates available from {spec}")
+            selected.update(dates)
+        elif spec in available:
+            selected.add(spec)
+        else:
+            raise ValueError(
+                f"{spec} is not an available date, choose from {', '.join(available)}"
+            )
+    return sorted(selected)
 
-    # Convert the index to the date
-    date: str = dates[int(date) - 1]
 
+def table_name_for(date: str) -> str:
     # replace the - with _ in the date because postgres does not allow - in the table name
-    table_name = f"bdc_{date}".replace("-", "_")
-
-    # Check if table exists
-    if table_name in inspector.get_table_names():
-        logging.warning(f"Table {table_name} already exists")
-        pass
-    else:
-        create_bdc_table(table_name, metadata)
-        metadata.create_all(engine)
-        logging.info(f"Table {table_name} created")
-
-    # Get the download list for a specific date
-    downloadList: list[dict] = await bdc.getDownloadList(date=date, category="State")
-    if not downloadList:
+    return f"bdc_{date}".replace("-", "_")
+
+
+def pipeline_config(args: argparse.Namespace) -> PipelineConfig:
+    """Build the pipeline settings for each date from the arguments"""
+    return PipelineConfig(
+        download_concurrency=args.download_concurrency,
+        extract_concurrency=args.extract_concurrency,
+        copy_concurrency=args.copy_concurrency,
+        upload_concurrency=args.upload_concurrency,
+        stream_copy=args.stream_copy,
+        fast_load=args.fast_load,
+        typed_schema=args.typed,
+        partitioned=args.partitioned,
+        incremental=not args.no_incremental,
+        parquet_path=args.parquet_path if "parquet" in args.sinks else None,
+        upload_parquet=args.upload_parquet,
+        upload_compression=args.upload_compression,
+        compression_threads=args.compression_threads,
+        rollups=args.rollups,
+    )
+
+
+def create_tables(engine: Engine, dates: list[str], typed: bool = False) -> None:
+    """Create the table for each date that does not exist yet"""
+    existing = inspect(engine).get_table_names()
+    metadata = MetaData()
+    for date in dates:
+        table_name = table_name_for(date)
+        if table_name in existing:
+            logging.warning(f"Table {table_name} already exists")
+        else:
+            create_bdc_table(table_name, metadata, typed=typed)
+            logging.info(f"Table {table_name} created")
+    metadata.create_all(engine)
+
+
+def print_row_counts(engine: Engine, dates: list[str], partitioned: bool) -> None:
+    """Print the rows loaded for each date from the load manifest, or an
+    estimate, instead of scanning the tables"""
+    counter = RowCounter(engine)
+    for date in dates:
+        if partitioned:
+            count = counter.count(PARENT_TABLE, as_of_date=date)
+        else:
+            count = counter.count(table_name_for(date))
+        if count is not None:
+            print(f"{date}: {count}")
+
+
+async def ingest(bdc: BDC, args: argparse.Namespace) -> int:
+    """Ingest every selected date through one BDC client, engine and cache.
+
+    Args:
+        bdc: BDC API client shared by every date
+        args: Parsed arguments
+
+    Returns:
+        int: Exit code, 1 if any file failed or nothing matched
+    """
+    upload_queue = UploadQueue(args.upload_queue)
+    if args.retry_uploads:
+        uploaded = await retry_uploads(
+            upload_queue,
+            ZAPIER_WEBHOOK,
+            concurrency=args.upload_concurrency,
+            client=bdc.client,
+        )
+        print(f"{uploaded} queued files uploaded, {len(upload_queue)} still queued")
+        return 1 if len(upload_queue) else 0
+
+    data_type, available = await bdc.getlistofDates()
+    if args.list_dates:
+        print(f"Data Type: {data_type}")
+        for date in available:
+            print(date)
+        return 0
+
+    try:
+        dates = select_dates(available, args.dates)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+
+    selection = DownloadSelection(
+        categories=args.categories,
+        subcategories=args.subcategories,
+        technology_types=None
+        if "all" in args.technology_types
+        else args.technology_types,
+        states=args.states,
+        include_satellite=args.include_satellite,
+    )
+    plan = await plan_downloads(bdc, dates, selection)
+    if not plan.total:
         logging.error("No files to download")
-        sys.exit(1)
-    else:
-        for file in tqdm(downloadList, desc="Downloading BDC files"):
-            logging.info(json.dumps(file, indent=4, sort_keys=True))
-
-            file_id = file["file_id"]
-            response = await bdc.getDownloadFile(file_id)
-            extractZip(response=response, file_id=file["file_id"])
-            filename = f"{file['file_name']}"
-
-            logging.info(f"Extracted {filename}")
-
-            copy_data_to_postgres(engine, f"exports/{filename}.csv", table_name)
-
-            if check_file_size(f"exports/{filename}.csv", 100):
-                success = await upload_file_to_zapier(
-                    f"exports/{filename}.csv", ZAPIER_WEBHOOK, filename, date
-                )
-                if success:
-                    os.remove(f"exports/{filename}.csv")
-                    logging.info(f"Deleted {filename}")
-                else:
-                    logging.error(
-                        f"Failed to upload {filename}, keeping file for retry"
-                    )
-            else:
-                try:
-                    zipped_file = zip_file(f"exports/{filename}.csv")
-                    zipped_filename = f"{filename}.zip"
-                    success = await upload_file_to_zapier(
-                        str(zipped_file), ZAPIER_WEBHOOK, zipped_filename, date
-                    )
-                    if success:
-                        os.remove(zipped_file)
-                        os.remove(f"exports/{filename}.csv")
-                        logging.info(
-                            f"Successfully uploaded and deleted {zipped_filename}"
-                        )
-                    else:
-                        logging.error(
-                            f"Failed to upload {zipped_filename}, keeping files for retry"
-                        )
-                except Exception as e:
-                    logging.error(f"Error during zip and upload process: {str(e)}")
+        return 1
 
+    config = pipeline_config(args)
+    engine = None
+    if "postgres" in args.sinks:
+        # One connection per COPY stream and partition attach for every date
+        # running at once, and a couple more for creating tables and the
+        # manifest
+        engine = create_bulk_engine(
+            CONNECTION_STRING,
+            max_connections=(args.copy_concurrency + config.attach_concurrency)
+            * args.parallel_dates
+            + 2,
+        )
+        if not args.partitioned:
+            await asyncio.to_thread(create_tables, engine, dates, args.typed)
+    cache = (
+        None if args.no_cache else DownloadCache(args.cache_path, args.cache_size_gb)
+    )
+    zapier_webhook = ZAPIER_WEBHOOK if "zapier" in args.sinks else None
+
+    with tqdm(total=plan.total, desc="Ingesting BDC files") as pbar:
+
+        def make_pipeline(date: str, files: list[dict]) -> IngestPipeline:
+            return IngestPipeline(
+                bdc,
+                date,
+                engine=engine,
+                table_name=None if args.partitioned else table_name_for(date),
+                zapier_webhook=zapier_webhook,
+                config=config,
+                on_progress=lambda job, completed, total: pbar.update(1),
+                cache=cache,
+                upload_queue=upload_queue,
+            )
+
+        results: dict[str, PipelineResult] = await run_plan(
+            plan, make_pipeline, max_concurrent_dates=args.parallel_dates
+        )
+
+    failed = 0
+    for date, result in results.items():
+        for job in result.failed:
+            logging.error(f"Failed to ingest {job.filename} for {date}: {job.error}")
+        failed += len(result.failed)
         print(
-            f"Files uploaded to Box folder Broadband Data/{date} and {table_name} table created in database"
+            f"{date}: {len(result.succeeded)} files ingested, {len(result.failed)} failed"
         )
-        # Print the number of rows in the table
-        with engine.connect() as connection:
-            result = connection.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-            for row in result:
-                print(f"Number of rows in {table_name}: {row[0]}")
 
+    if engine is not None:
+        print_row_counts(engine, list(results), args.partitioned)
         # Close the connection
         engine.dispose()
         logging.info("Connection closed")
+    return 1 if failed else 0
+
+
+async def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+
+    async with BDC(
+        USERNAME,
+        API_KEY,
+        metadata_cache_path=os.path.join(args.cache_path, "metadata.json"),
+        max_download_concurrency=args.download_concurrency,
+    ) as bdc:
+        return await ingest(bdc, args)
 
 
 if __name__ == "__main__":
-    asyncio.run(main=main())
+    sys.exit(asyncio.run(main()))
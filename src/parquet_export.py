@@ -0,0 +1,165 @@
+import logging
+import os
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Iterator
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from src.dtypes import BDC_DTYPES, arrow_schema
+
+# Column types of a BDC availability file once written to Parquet, the same
+# as combineCSVsintoParquet writes. state_usps is not stored in the files, it
+# is the state_usps= partition of the path.
+BDC_PARQUET_SCHEMA = arrow_schema(
+    [column for column in BDC_DTYPES if column != "state_usps"]
+)
+
+# Integer columns that some files write as floats, eg. 1000.0 or 1.0e14.
+# They are parsed as float64 and cast, which fails on any fractional value.
+_FLOAT_ENCODED = [
+    "location_id",
+    "max_advertised_download_speed",
+    "max_advertised_upload_speed",
+    "block_geoid",
+]
+
+
+@dataclass
+class ParquetStats:
+    """Outcome of writing one source file to Parquet."""
+
+    path: str
+    rows: int = 0
+    row_groups: int = 0
+
+
+def parquet_partition_path(root: str | Path, as_of_date: str, state_usps: str) -> Path:
+    """Directory of one as of date and state in a hive-partitioned dataset"""
+    return Path(root) / f"as_of_date={as_of_date}" / f"state_usps={state_usps}"
+
+
+def _read_csv_batches(file: IO, block_size: int) -> Iterator[pa.RecordBatch]:
+    column_types = {
+        field.name: pa.float64() if field.name in _FLOAT_ENCODED else field.type
+        for field in BDC_PARQUET_SCHEMA
+    }
+    reader = pacsv.open_csv(
+        file,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            include_columns=BDC_PARQUET_SCHEMA.names,
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        yield pa.RecordBatch.from_arrays(
+            [batch.column(field.name).cast(field.type) for field in BDC_PARQUET_SCHEMA],
+            schema=BDC_PARQUET_SCHEMA,
+        )
+
+
+def _open_sources(source: Path) -> Iterator[IO]:
+    if source.suffix == ".zip":
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.namelist():
+                if member.endswith(".csv"):
+                    with archive.open(member) as file:
+                        yield file
+    else:
+        with open(source, "rb") as file:
+            yield file
+
+
+def write_csv_to_parquet(
+    source: str | Path,
+    root: str | Path,
+    as_of_date: str,
+    state_usps: str,
+    name: str | None = None,
+    compression: str = "zstd",
+    compression_level: int | None = None,
+    row_group_size: int = 512 * 1024,
+    block_size: int = 16 * 1024 * 1024,
+) -> ParquetStats:
+    """Stream a BDC availability CSV into one Parquet file of a dataset
+    partitioned by as_of_date and state_usps.
+
+    The CSV is read in blocks and written out in row groups of
+    row_group_size rows, so memory use does not grow with the file. Every
+    column is dictionary encoded where that is smaller and each row group
+    carries min/max statistics, so readers can skip row groups and columns
+    they do not need. The file is written under a temporary name and moved
+    into place once complete, so a rerun replaces it without readers ever
+    seeing a partial file.
+
+    Args:
+        source: Path to a .csv file, or a .zip file whose CSV members are
+            streamed without extracting them
+        root: Root directory of the Parquet dataset
+        as_of_date: As of date of the file, eg. 2024-06-30
+        state_usps: State code of the file, eg. AL
+        name: File name without extension, defaults to the name of the source
+        compression: Parquet compression codec
+        compression_level: Codec compression level, None for the default
+        row_group_size: Rows per row group
+        block_size: Bytes of CSV parsed at a time
+
+    Returns:
+        ParquetStats: Path of the Parquet file, rows and row groups written
+    """
+    source = Path(source)
+    if name is None:
+        name = source.name.split(".")[0]
+    partition = parquet_partition_path(root, as_of_date, state_usps)
+    partition.mkdir(parents=True, exist_ok=True)
+    path = partition / f"{name}.parquet"
+    part = partition / f"{name}.parquet.part"
+    stats = ParquetStats(path=str(path))
+
+    pending: list[pa.RecordBatch] = []
+    pending_rows = 0
+
+    try:
+        with pq.ParquetWriter(
+            part,
+            BDC_PARQUET_SCHEMA,
+            compression=compression,
+            compression_level=compression_level,
+            use_dictionary=True,
+            write_statistics=True,
+        ) as writer:
+
+            def flush():
+                nonlocal pending, pending_rows
+                if pending_rows:
+                    writer.write_table(
+                        pa.Table.from_batches(pending, BDC_PARQUET_SCHEMA),
+                        row_group_size=row_group_size,
+                    )
+                    stats.row_groups += 1
+                pending, pending_rows = [], 0
+
+            for file in _open_sources(source):
+                for batch in _read_csv_batches(file, block_size):
+                    # Collect CSV blocks into full-sized row groups
+                    while batch.num_rows:
+                        take = min(batch.num_rows, row_group_size - pending_rows)
+                        pending.append(batch.slice(0, take))
+                        pending_rows += take
+                        stats.rows += take
+                        batch = batch.slice(take)
+                        if pending_rows == row_group_size:
+                            flush()
+            flush()
+    except Exception:
+        part.unlink(missing_ok=True)
+        raise
+
+    os.replace(part, path)
+    logging.info(f"Wrote {stats.rows} rows in {stats.row_groups} row groups to {path}")
+    return stats
@@ -0,0 +1,815 @@
+import asyncio
+import json
+import logging
+import os
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable
+
+from sqlalchemy import Engine
+
+from db.loader import BulkLoader
+from db.manifest import (
+    create_manifest_table,
+    files_to_load,
+    get_manifest,
+    record_loads,
+    states_with_rows,
+    unload_states,
+)
+from db.partitions import (
+    PARENT_TABLE,
+    attach_state_partition,
+    bdc_columns,
+    create_date_partition,
+    create_partitioned_parent,
+    create_state_load_table,
+    file_state_usps,
+    state_partition_name,
+    state_usps_for_file,
+)
+from db.rollups import refresh_rollups
+from db.schema import create_staging_table, swap_staging_table
+from db.transform import BDC_TYPED_CONVERTERS
+from src.bdc_api import BDC
+from src.cache import DownloadCache, link_or_copy
+from src.parquet_export import write_csv_to_parquet
+from src.uploads import UploadQueue, retry_uploads
+from src.utils import (
+    check_file_size,
+    extractZipFile,
+    file_checksum,
+    upload_compressed_to_zapier,
+    upload_file_to_zapier,
+    zip_file,
+)
+
+_STOP = None
+
+
+def is_availability_csv(file: dict) -> bool:
+    """True for the State Fixed Broadband availability CSVs that the COPY
+    and Parquet stages read. Other files, eg. provider and summary files,
+    Mobile Broadband or gis files, are only downloaded and uploaded."""
+    return (
+        file.get("category", "State") == "State"
+        and file.get("technology_type", "Fixed Broadband") == "Fixed Broadband"
+        and file.get("file_type", "csv") == "csv"
+    )
+
+
+@dataclass
+class PipelineConfig:
+    """Concurrency and queue settings for each stage of the ingest pipeline.
+
+    Args:
+        download_concurrency: Number of files downloaded at once
+        extract_concurrency: Number of ZIPs extracted at once
+        copy_concurrency: Number of COPY streams into Postgres at once
+        upload_concurrency: Number of uploads to Zapier at once
+        queue_size: Maximum number of finished files waiting between two stages
+        max_upload_size_mb: Files above this size are compressed before upload
+        exports_path: Directory the extracted CSV files are written to
+        stream_downloads: Stream downloads to disk instead of buffering them
+            in memory
+        download_path: Directory streamed ZIP files are spooled to
+        stream_copy: COPY straight from the downloaded ZIP into Postgres
+            without extracting the CSV to disk. The ZIP itself is uploaded
+            in place of the CSV. Requires stream_downloads.
+        fast_load: COPY into an UNLOGGED staging table without indexes and
+            swap it in for the target table once every file has loaded
+        typed_schema: Load into the compact typed BDC schema, converting each
+            row on its way into COPY
+        partitioned: Load into the bdc_availability parent table instead of
+            table_name. Each state is loaded into its own table and attached
+            as that state's partition once all of its files are in.
+        attach_concurrency: Number of state partitions indexed and attached
+            at once, each holds a connection of its own next to the COPY
+            streams
+        incremental: Skip files the load manifest shows were already loaded
+            into the target table and have not changed since
+        parquet_path: Root directory of a Parquet dataset, partitioned by
+            as_of_date and state_usps, that each file is also written to
+        parquet_concurrency: Number of files written to Parquet at once
+        upload_parquet: Upload the Parquet file instead of the CSV
+        cache_path: Directory of a DownloadCache that is checked before each
+            download and that every downloaded file is added to
+        cache_size_gb: Size the download cache is trimmed to
+        gis_file_type: Format gis files are downloaded in, 1 for a shapefile
+            or 2 for a GeoPackage
+        upload_queue_path: JSON file of an UploadQueue. A failed upload is
+            queued there instead of failing its file, and the date's queued
+            uploads are retried once the other stages are done.
+        upload_compression: How files above max_upload_size_mb are
+            compressed. zip writes a ZIP before uploading it. gzip and zstd
+            compress in parallel blocks while the upload streams, split into
+            volumes of at most max_upload_size_mb.
+        compression_threads: Number of blocks compressed at once for gzip
+            and zstd, one per CPU if None
+        rollups: Refresh the bdc_rollup_* summary tables for the date once
+            the COPY stage is done, only for the states that were loaded
+    """
+
+    download_concurrency: int = 4
+    extract_concurrency: int = 2
+    copy_concurrency: int = 2
+    upload_concurrency: int = 2
+    queue_size: int = 4
+    max_upload_size_mb: int = 100
+    exports_path: str = "./exports"
+    stream_downloads: bool = True
+    download_path: str = "."
+    stream_copy: bool = False
+    fast_load: bool = False
+    typed_schema: bool = False
+    partitioned: bool = False
+    attach_concurrency: int = 1
+    incremental: bool = False
+    parquet_path: str | None = None
+    parquet_concurrency: int = 2
+    upload_parquet: bool = False
+    cache_path: str | None = None
+    cache_size_gb: float = 50
+    gis_file_type: int = 1
+    upload_queue_path: str | None = None
+    upload_compression: str = "zip"
+    compression_threads: int | None = None
+    rollups: bool = False
+
+
+@dataclass
+class FileJob:
+    """A single BDC file moving through the pipeline."""
+
+    file: dict
+    response: object | None = None
+    zip_path: str | None = None
+    csv_path: str | None = None
+    parquet_path: str | None = None
+    rows: int = 0
+    size_bytes: int | None = None
+    checksum: str | None = None
+    cached: bool = False
+    error: Exception | None = None
+    stages: list[str] = field(default_factory=list)
+
+    @property
+    def file_id(self):
+        return self.file["file_id"]
+
+    @property
+    def filename(self) -> str:
+        return f"{self.file['file_name']}"
+
+
+@dataclass
+class PipelineResult:
+    succeeded: list[FileJob] = field(default_factory=list)
+    failed: list[FileJob] = field(default_factory=list)
+
+
+class IngestPipeline:
+    """Download, extract, COPY, export and upload BDC files with overlapping
+    stages.
+
+    Downloads run in a semaphore-bounded pool and hand finished files to the
+    extract, copy, Parquet export and upload stages through bounded queues,
+    so network, CPU and database work run at the same time. A stage is
+    skipped when its sink is not configured (no engine/table for COPY, no
+    parquet_path for export, no webhook for upload).
+
+    Args:
+        bdc: BDC API client
+        date: As of date of the files being ingested
+        engine: SQLAlchemy engine used for the COPY stage
+        table_name: Name of the PostgreSQL table to COPY into
+        zapier_webhook: Zapier webhook URL used for the upload stage
+        config: Stage concurrency settings
+        on_progress: Called with (job, completed, total) when a file finishes
+        cache: Download cache shared with other pipelines, instead of the
+            one configured by config.cache_path
+        upload_queue: Upload queue shared with other pipelines, instead of
+            the one configured by config.upload_queue_path
+    """
+
+    def __init__(
+        self,
+        bdc: BDC,
+        date: str,
+        engine: Engine | None = None,
+        table_name: str | None = None,
+        zapier_webhook: str | None = None,
+        config: PipelineConfig | None = None,
+        on_progress: Callable[[FileJob, int, int], None] | None = None,
+        cache: DownloadCache | None = None,
+        upload_queue: UploadQueue | None = None,
+    ):
+        self.bdc = bdc
+        self.date = date
+        self.engine = engine
+        self.table_name = table_name
+        self.zapier_webhook = zapier_webhook
+        self.config = config or PipelineConfig()
+        self.on_progress = on_progress
+        # Uploads reuse the API client's pooled connections
+        self.http_client = getattr(bdc, "client", None)
+        self.loader = (
+            BulkLoader(
+                engine,
+                max_connections=self.config.copy_concurrency,
+                converters=BDC_TYPED_CONVERTERS if self.config.typed_schema else None,
+            )
+            if engine is not None
+            else None
+        )
+        if cache is None and self.config.cache_path is not None:
+            cache = DownloadCache(self.config.cache_path, self.config.cache_size_gb)
+        self.cache = cache
+        if upload_queue is None and self.config.upload_queue_path is not None:
+            upload_queue = UploadQueue(self.config.upload_queue_path)
+        self.upload_queue = upload_queue
+
+    async def run(self, files: list[dict]) -> PipelineResult:
+        """Run every file in the download list through the pipeline.
+
+        Args:
+            files: Download list as returned by BDC.getDownloadList
+
+        Returns:
+            PipelineResult: The jobs that completed and the jobs that failed
+        """
+        config = self.config
+        result = PipelineResult()
+        self._total = len(files)
+        self._completed = 0
+        self._copied = 0
+
+        copy_enabled = self.engine is not None and (
+            self.table_name is not None or config.partitioned
+        )
+        stages = [(self._extract, config.extract_concurrency)]
+        if copy_enabled:
+            stages.append((self._copy, config.copy_concurrency))
+        if config.parquet_path is not None:
+            stages.append((self._export, config.parquet_concurrency))
+        if self.zapier_webhook:
+            stages.append((self._upload, config.upload_concurrency))
+
+        if copy_enabled:
+            self._manifest_table = (
+                PARENT_TABLE if config.partitioned else str(self.table_name)
+            )
+            await asyncio.to_thread(create_manifest_table, self.engine)
+            if config.incremental:
+                manifest = await asyncio.to_thread(
+                    get_manifest, self.engine, self._manifest_table
+                )
+                planned = self._plan_incremental(files, manifest)
+            else:
+                planned = files
+            if not config.partitioned and not config.fast_load:
+                planned = await self._plan_reloads(files, planned)
+            files = planned
+            self._total = len(files)
+        self._to_copy = sum(self._copyable(file) for file in files)
+
+        self._copy_table = self.table_name
+        self._copied_jobs: list[FileJob] = []
+        self._load_error: Exception | None = None
+        if copy_enabled and config.partitioned:
+            await self._create_partitions(files)
+        elif copy_enabled and config.fast_load and self._to_copy:
+            # Nothing to load leaves the table as it is, no staging table
+            self._copy_table = await asyncio.to_thread(
+                create_staging_table,
+                self.engine,
+                str(self.table_name),
+                config.typed_schema,
+            )
+
+        inboxes = [asyncio.Queue(maxsize=config.queue_size) for _ in stages]
+        done_queue: asyncio.Queue = asyncio.Queue()
+        outboxes = inboxes[1:] + [done_queue]
+
+        semaphore = asyncio.Semaphore(config.download_concurrency)
+        downloads = [
+            asyncio.create_task(
+                self._download(FileJob(file=file), semaphore, inboxes[0], result)
+            )
+            for file in files
+        ]
+        workers = [
+            self._start(concurrency, stage, inbox, outbox)
+            for (stage, concurrency), inbox, outbox in zip(stages, inboxes, outboxes)
+        ]
+        collector = asyncio.create_task(self._collect(done_queue, result))
+
+        # Shut each stage down once the stage feeding it has drained
+        await asyncio.gather(*downloads)
+        for (stage, _), inbox, stage_workers in zip(stages, inboxes, workers):
+            await self._stop(stage_workers, inbox)
+            if stage == self._copy:
+                await self._finish_copy()
+        await done_queue.put(_STOP)
+        await collector
+        if self._load_error is not None:
+            for job in self._copied_jobs:
+                job.error = job.error or self._load_error
+            result.failed += [job for job in result.succeeded if job.error]
+            result.succeeded = [job for job in result.succeeded if not job.error]
+
+        if self.zapier_webhook and self.upload_queue is not None:
+            uploaded = await retry_uploads(
+                self.upload_queue,
+                self.zapier_webhook,
+                table_name=self.date,
+                concurrency=config.upload_concurrency,
+                client=self.http_client,
+            )
+            if uploaded:
+                logging.info(f"Uploaded {uploaded} queued files for {self.date}")
+
+        logging.info(
+            f"Pipeline finished: {len(result.succeeded)} succeeded, {len(result.failed)} failed"
+        )
+        return result
+
+    async def _finish_copy(self):
+        states: list[str] | None
+        if self.config.partitioned:
+            for error in await asyncio.gather(
+                *self._attachments, return_exceptions=True
+            ):
+                if isinstance(error, Exception):
+                    logging.error(f"Failed to attach partition: {error}")
+            states = sorted(self._attached_states)
+        elif self.config.fast_load:
+            try:
+                swapped = await self._swap_staging_table()
+            except Exception as e:
+                logging.error(
+                    f"Failed to swap {self._copy_table} in for {self.table_name}, leaving it in place: {e}"
+                )
+                # The files are marked failed once the other stages are done
+                # with them
+                self._load_error = e
+                return
+            if not swapped:
+                return
+            # The whole table was replaced
+            states = None
+        else:
+            states = self._loaded_states(self._copied_jobs)
+        if self.config.rollups:
+            await self._refresh_rollups(states)
+
+    @staticmethod
+    def _loaded_states(jobs: list[FileJob]) -> list[str] | None:
+        # Files without a state, eg. national provider files, refresh the
+        # whole date
+        try:
+            return sorted({state_usps_for_file(job.file) for job in jobs})
+        except KeyError:
+            return None
+
+    async def _refresh_rollups(self, states: list[str] | None):
+        source = PARENT_TABLE if self.config.partitioned else str(self.table_name)
+        try:
+            await asyncio.to_thread(
+                refresh_rollups,
+                self.engine,
+                source,
+                self.date,
+                states,
+                self.config.partitioned,
+            )
+        except Exception as e:
+            logging.error(f"Failed to refresh the rollups for {self.date}: {e}")
+
+    def _plan_incremental(
+        self, files: list[dict], manifest: dict[str, dict]
+    ) -> list[dict]:
+        changed = files_to_load(files, manifest)
+        if self.config.partitioned:
+            # A state partition is rebuilt from all of the state's files
+            states = {file_state_usps(file) for file in changed} - {None}
+            planned = [
+                file
+                for file in files
+                if file in changed or file_state_usps(file) in states
+            ]
+        elif self.config.fast_load:
+            # The staging table replaces the whole table, so load all or nothing
+            planned = files if changed else []
+        else:
+            # A changed file's state is reloaded by _plan_reloads
+            planned = []
+            for file in changed:
+                if str(file["file_id"]) in manifest and file_state_usps(file) is None:
+                    logging.error(
+                        f"{file['file_name']} changed since it was loaded but has no state to reload, not loading it again"
+                    )
+                else:
+                    planned.append(file)
+        logging.info(
+            f"{len(files) - len(planned)} of {len(files)} files already loaded, {len(planned)} to load"
+        )
+        return planned
+
+    async def _plan_reloads(self, files: list[dict], planned: list[dict]) -> list[dict]:
+        # Appending to a state that already has rows would duplicate them, eg.
+        # rows of a changed file, of an earlier non-incremental run or from
+        # before the manifest existed. Those states are deleted and all of
+        # their files loaded again.
+        table_name = str(self.table_name)
+        states = {
+            file_state_usps(file) for file in planned if is_availability_csv(file)
+        } - {None}
+        if not states:
+            return planned
+        reload = sorted(
+            await asyncio.to_thread(
+                states_with_rows, self.engine, table_name, sorted(states)
+            )
+        )
+        if not reload:
+            return planned
+        planned = [
+            file for file in files if file in planned or file_state_usps(file) in reload
+        ]
+        await asyncio.to_thread(
+            unload_states,
+            self.engine,
+            table_name,
+            reload,
+            [file["file_id"] for file in planned],
+        )
+        logging.warning(
+            f"{', '.join(reload)} already have rows in {table_name}, reloading them"
+        )
+        return planned
+
+    def _manifest_entry(self, job: FileJob) -> dict:
+        record_count = job.file.get("record_count")
+        return {
+            "file_id": job.file_id,
+            "as_of_date": self.date,
+            "file_name": job.filename,
+            "record_count": int(record_count) if record_count is not None else None,
+            "size_bytes": job.size_bytes,
+            "checksum": job.checksum,
+            "rows_loaded": job.rows,
+        }
+
+    async def _record_loads(self, jobs: list[FileJob]):
+        await asyncio.to_thread(
+            record_loads,
+            self.engine,
+            self._manifest_table,
+            [self._manifest_entry(job) for job in jobs],
+        )
+
+    async def _create_partitions(self, files: list[dict]):
+        typed = self.config.typed_schema
+        await asyncio.to_thread(create_partitioned_parent, self.engine, typed)
+        await asyncio.to_thread(create_date_partition, self.engine, self.date)
+
+        self._state_remaining = Counter(
+            state_usps_for_file(file) for file in files if self._copyable(file)
+        )
+        self._state_jobs: dict[str, list[FileJob]] = defaultdict(list)
+        self._attachments: list[asyncio.Task] = []
+        self._attach_slots = asyncio.Semaphore(self.config.attach_concurrency)
+        self._attached_states: list[str] = []
+        self._columns = bdc_columns(typed)
+        await asyncio.gather(
+            *[
+                asyncio.to_thread(
+                    create_state_load_table, self.engine, self.date, state_usps
+                )
+                for state_usps in self._state_remaining
+            ]
+        )
+
+    async def _swap_staging_table(self) -> bool:
+        if self._copy_table == self.table_name:
+            # No files were planned, so there is no staging table to swap in
+            return False
+        if self._copied == 0 or self._copied < self._to_copy:
+            logging.error(
+                f"Only {self._copied} of {self._to_copy} files loaded, leaving {self._copy_table} in place of {self.table_name}"
+            )
+            return False
+        await asyncio.to_thread(
+            swap_staging_table, self.engine, str(self._copy_table), str(self.table_name)
+        )
+        await self._record_loads(self._copied_jobs)
+        return True
+
+    async def _attach_state_partition(self, state_usps: str):
+        async with self._attach_slots:
+            await asyncio.to_thread(
+                attach_state_partition, self.engine, self.date, state_usps
+            )
+            await self._record_loads(self._state_jobs[state_usps])
+        self._attached_states.append(state_usps)
+
+    def _start(self, count: int, stage, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        return [
+            asyncio.create_task(self._worker(stage, inbox, outbox))
+            for _ in range(max(count, 1))
+        ]
+
+    async def _stop(self, workers: list[asyncio.Task], inbox: asyncio.Queue):
+        for _ in workers:
+            await inbox.put(_STOP)
+        await asyncio.gather(*workers)
+
+    async def _worker(self, stage, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            job = await inbox.get()
+            if job is _STOP:
+                return
+            try:
+                await stage(job)
+            except Exception as e:
+                logging.error(f"{stage.__name__[1:]} failed for {job.filename}: {e}")
+                job.error = e
+            await outbox.put(job)
+
+    async def _download(
+        self,
+        job: FileJob,
+        semaphore: asyncio.Semaphore,
+        outbox: asyncio.Queue,
+        result: PipelineResult,
+    ):
+        async with semaphore:
+            logging.info(json.dumps(job.file, indent=4, sort_keys=True))
+            try:
+                zip_path = os.path.join(
+                    self.config.download_path, f"{job.file_id}.csv.zip"
+                )
+                cached = (
+                    await asyncio.to_thread(self.cache.get, self.date, job.file)
+                    if self.cache is not None
+                    else None
+                )
+                if cached is not None:
+                    await asyncio.to_thread(self._link_cached, cached["path"], zip_path)
+                    job.zip_path = zip_path
+                    job.size_bytes, job.checksum = (
+                        cached["size_bytes"],
+                        cached["checksum"],
+                    )
+                    job.cached = True
+                    logging.info(f"{job.filename} found in the download cache")
+                else:
+                    options = (
+                        {"gis_file_type": self.config.gis_file_type}
+                        if job.file.get("file_type") == "gis"
+                        else {}
+                    )
+                    if self.config.stream_downloads:
+                        job.zip_path = str(
+                            await self.bdc.streamDownloadFile(
+                                job.file_id, zip_path, **options
+                            )
+                        )
+                    else:
+                        job.response = await self.bdc.getDownloadFile(
+                            job.file_id, **options
+                        )
+                    source = (
+                        job.zip_path
+                        if job.zip_path is not None
+                        else job.response.content
+                    )
+                    if self.cache is not None:
+                        entry = await asyncio.to_thread(
+                            self.cache.put, self.date, job.file, source
+                        )
+                        job.size_bytes, job.checksum = (
+                            entry["size_bytes"],
+                            entry["checksum"],
+                        )
+                    else:
+                        job.size_bytes, job.checksum = await asyncio.to_thread(
+                            file_checksum, source
+                        )
+                job.stages.append("download")
+            except Exception as e:
+                logging.error(f"Failed to download {job.filename}: {e}")
+                job.error = e
+                self._finish(job, result)
+                return
+            # Hold the download slot until the extract queue has room, so a
+            # slow stage stops new downloads instead of piling up files
+            await outbox.put(job)
+
+    @staticmethod
+    def _link_cached(cache_path: str, zip_path: str):
+        # The pipeline removes its copy when done, the cached file stays
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        link_or_copy(cache_path, zip_path)
+
+    def _copyable(self, file: dict) -> bool:
+        # A partition needs the file's state
+        return is_availability_csv(file) and (
+            not self.config.partitioned or file_state_usps(file) is not None
+        )
+
+    async def _extract(self, job: FileJob):
+        if job.error is not None:
+            return
+        if not is_availability_csv(job.file):
+            # Uploaded as downloaded, the ZIP may not hold a BDC CSV
+            if job.zip_path is None:
+                job.zip_path = os.path.join(
+                    self.config.download_path, f"{job.file_id}.csv.zip"
+                )
+                await asyncio.to_thread(self._write_response, job, job.zip_path)
+            return
+        if self.config.stream_copy and job.zip_path is not None:
+            # The COPY and upload stages read the ZIP directly
+            return
+        if job.zip_path is not None:
+            await asyncio.to_thread(
+                extractZipFile, job.zip_path, self.config.exports_path
+            )
+        else:
+            zip_path = os.path.join(self.config.download_path, f"{job.file_id}.csv.zip")
+            await asyncio.to_thread(self._write_response, job, zip_path)
+            await asyncio.to_thread(extractZipFile, zip_path, self.config.exports_path)
+        job.csv_path = os.path.join(self.config.exports_path, f"{job.filename}.csv")
+        job.stages.append("extract")
+        logging.info(f"Extracted {job.filename}")
+
+    @staticmethod
+    def _write_response(job: FileJob, path: str):
+        with open(path, "wb") as f:
+            f.write(job.response.content)
+        job.response = None
+
+    async def _copy(self, job: FileJob):
+        if job.error is not None or not is_availability_csv(job.file):
+            return
+        if not self._copyable(job.file):
+            logging.warning(
+                f"{job.filename} has no state to partition by, it is not loaded"
+            )
+            return
+        source = job.csv_path if job.csv_path is not None else job.zip_path
+        if self.config.partitioned:
+            state_usps = state_usps_for_file(job.file)
+            stats = await asyncio.to_thread(
+                self.loader.load_file,
+                str(source),
+                f"{state_partition_name(self.date, state_usps)}_load",
+                self._columns,
+            )
+            job.rows = stats.rows
+            self._state_jobs[state_usps].append(job)
+            self._state_remaining[state_usps] -= 1
+            if self._state_remaining[state_usps] == 0:
+                # Every file for the state is in, attach it while others load
+                self._attachments.append(
+                    asyncio.create_task(self._attach_state_partition(state_usps))
+                )
+        else:
+
+            def record_load(connection, rows: int):
+                # Committed with the COPY, so a load is never repeated
+                job.rows = rows
+                record_loads(
+                    connection, self._manifest_table, [self._manifest_entry(job)]
+                )
+
+            stats = await asyncio.to_thread(
+                self.loader.load_file,
+                str(source),
+                str(self._copy_table),
+                None,
+                None if self.config.fast_load else record_load,
+            )
+            job.rows = stats.rows
+        self._copied += 1
+        self._copied_jobs.append(job)
+        job.stages.append("copy")
+
+    async def _export(self, job: FileJob):
+        if job.error is not None or not is_availability_csv(job.file):
+            return
+        if file_state_usps(job.file) is None:
+            logging.warning(
+                f"{job.filename} has no state to partition by, it is not exported"
+            )
+            return
+        source = job.csv_path if job.csv_path is not None else job.zip_path
+        stats = await asyncio.to_thread(
+            write_csv_to_parquet,
+            str(source),
+            str(self.config.parquet_path),
+            self.date,
+            state_usps_for_file(job.file),
+            job.filename,
+        )
+        job.parquet_path = stats.path
+        job.stages.append("export")
+
+    async def _upload(self, job: FileJob):
+        if job.error is not None:
+            return
+        config = self.config
+        compression = None
+        if config.upload_parquet and job.parquet_path is not None:
+            upload_path, upload_name = job.parquet_path, f"{job.filename}.parquet"
+        elif job.csv_path is None:
+            upload_path, upload_name = str(job.zip_path), f"{job.filename}.zip"
+        elif check_file_size(job.csv_path, config.max_upload_size_mb):
+            upload_path, upload_name = job.csv_path, job.filename
+        elif config.upload_compression == "zip":
+            upload_path = str(await asyncio.to_thread(zip_file, job.csv_path))
+            upload_name = f"{job.filename}.zip"
+        else:
+            upload_path, upload_name = job.csv_path, job.filename
+            compression = config.upload_compression
+
+        if compression is None:
+            success = await upload_file_to_zapier(
+                upload_path,
+                str(self.zapier_webhook),
+                upload_name,
+                self.date,
+                client=self.http_client,
+            )
+        else:
+            success = await upload_compressed_to_zapier(
+                upload_path,
+                str(self.zapier_webhook),
+                upload_name,
+                self.date,
+                codec=compression,
+                max_volume_mb=config.max_upload_size_mb,
+                client=self.http_client,
+                threads=config.compression_threads,
+            )
+        if not success and self.upload_queue is None:
+            raise RuntimeError(
+                f"Failed to upload {upload_name}, keeping files for retry"
+            )
+
+        # The Parquet file stays in the dataset, the CSV and ZIP are removed
+        if job.csv_path is not None and upload_path != job.csv_path:
+            os.remove(job.csv_path)
+        if not success:
+            # Leave the file to the upload queue rather than holding up
+            # the rest of the pipeline
+            self.upload_queue.add(
+                upload_path,
+                upload_name,
+                self.date,
+                remove=upload_path != job.parquet_path,
+                error="Upload failed",
+                compression=compression,
+                max_volume_mb=config.max_upload_size_mb,
+            )
+            job.stages.append("upload_queued")
+            logging.warning(f"Queued {upload_name} to retry its upload")
+            return
+        if upload_path != job.parquet_path:
+            os.remove(upload_path)
+        job.stages.append("upload")
+        logging.info(f"Successfully uploaded and deleted {upload_name}")
+
+    async def _collect(self, inbox: asyncio.Queue, result: PipelineResult):
+        while True:
+            job = await inbox.get()
+            if job is _STOP:
+                return
+            self._finish(job, result)
+
+    def _finish(self, job: FileJob, result: PipelineResult):
+        if job.error is None:
+            # The upload stage removes what it sends, unless it is queued.
+            # Without an upload stage the extracted CSV is removed here once
+            # a sink has taken it, a run with no sinks keeps it.
+            if job.csv_path is None:
+                leftover = job.zip_path
+            elif {"copy", "export"} & set(job.stages):
+                leftover = job.csv_path
+            else:
+                leftover = None
+            if (
+                leftover
+                and os.path.exists(leftover)
+                and "upload_queued" not in job.stages
+            ):
+                os.remove(leftover)
+            result.succeeded.append(job)
+        else:
+            result.failed.append(job)
+        self._completed += 1
+        if self.on_progress is not None:
+            self.on_progress(job, self._completed, self._total)
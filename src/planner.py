@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Callable
+
+from db.partitions import file_state_usps
+from src.bdc_api import BDC
+from src.pipeline import IngestPipeline, PipelineResult
+
+
+@dataclass
+class DownloadSelection:
+    """Declarative description of the files to download.
+
+    Every list is a filter, None matches everything.
+
+    Args:
+        categories: Listing categories, eg. State, Provider, Summary
+        subcategories: Subcategories, eg. Fixed Broadband, Mobile Broadband.
+            None lists every subcategory of each category.
+        technology_types: Technology types, eg. Fixed Broadband
+        states: State USPS codes, eg. AL. Files without a state, such as
+            national summaries, are left out when this is set.
+        file_types: File types, csv or gis
+        include_satellite: Keep the satellite provider files
+    """
+
+    categories: list[str] = field(default_factory=lambda: ["State"])
+    subcategories: list[str] | None = None
+    technology_types: list[str] | None = field(
+        default_factory=lambda: ["Fixed Broadband"]
+    )
+    states: list[str] | None = None
+    file_types: list[str] | None = field(default_factory=lambda: ["csv"])
+    include_satellite: bool = False
+
+    def matches(self, file: dict) -> bool:
+        """True if a file from the listing is part of the selection"""
+        if (
+            self.technology_types is not None
+            and file.get("technology_type") not in self.technology_types
+        ):
+            return False
+        if self.file_types is not None and file.get("file_type") not in self.file_types:
+            return False
+        if not self.include_satellite and "Satellite" in file.get("file_name", ""):
+            return False
+        if self.states is not None:
+            if file_state_usps(file) not in {state.upper() for state in self.states}:
+                return False
+        return True
+
+
+@dataclass
+class DownloadPlan:
+    """Files to download for each as of date, largest first."""
+
+    files: dict[str, list[dict]] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(len(files) for files in self.files.values())
+
+    @property
+    def total_records(self) -> int:
+        return sum(
+            _record_count(file) for files in self.files.values() for file in files
+        )
+
+
+def _record_count(file: dict) -> int:
+    try:
+        return int(file.get("record_count") or 0)
+    except ValueError:
+        return 0
+
+
+async def plan_downloads(
+    bdc: BDC, dates: list[str], selection: DownloadSelection | None = None
+) -> DownloadPlan:
+    """Expand a selection into the files to download for each as of date.
+
+    The listings for every date and category are fetched concurrently through
+    the BDC client's metadata cache and rate limiter. A file listed under
+    more than one category or subcategory is planned once. The listing has
+    no file sizes, so files are ordered by record count, largest first, to
+    start the longest downloads and loads before the short ones.
+
+    Args:
+        bdc: BDC API client
+        dates: As of dates to plan
+        selection: Files to select, the State Fixed Broadband CSVs if None
+
+    Returns:
+        DownloadPlan: Files to download for each date
+    """
+    selection = selection or DownloadSelection()
+    subcategories = selection.subcategories or [""]
+    listings = list(product(dates, selection.categories, subcategories))
+    results = await asyncio.gather(
+        *[
+            bdc.getDownloadList(
+                date=date,
+                category=category,
+                subcategory=subcategory,
+                technology_type=None,
+                file_type=None,
+                include_satellite=True,
+            )
+            for date, category, subcategory in listings
+        ]
+    )
+
+    plan = DownloadPlan(files={date: [] for date in dates})
+    seen: set[tuple[str, str]] = set()
+    for (date, _, _), files in zip(listings, results):
+        for file in files:
+            key = (date, str(file["file_id"]))
+            if key in seen or not selection.matches(file):
+                continue
+            seen.add(key)
+            plan.files[date].append(file)
+    for files in plan.files.values():
+        files.sort(key=_record_count, reverse=True)
+
+    logging.info(
+        f"Planned {plan.total} files with {plan.total_records} records across {len(dates)} dates"
+    )
+    return plan
+
+
+async def run_plan(
+    plan: DownloadPlan,
+    make_pipeline: Callable[[str, list[dict]], IngestPipeline],
+    max_concurrent_dates: int | None = None,
+) -> dict[str, PipelineResult]:
+    """Run the files for every date in a plan through an ingest pipeline.
+
+    Give the pipelines the same BDC client, engine and download cache so
+    they share connection pools, rate limits and caches.
+
+    Args:
+        plan: Plan from plan_downloads
+        make_pipeline: Called with each date and its files, returns the
+            pipeline for that date
+        max_concurrent_dates: Number of dates run at the same time, all of
+            them if None
+
+    Returns:
+        dict[str, PipelineResult]: Result of each date's pipeline
+    """
+    dates = [date for date, files in plan.files.items() if files]
+    semaphore = asyncio.Semaphore(max_concurrent_dates or max(len(dates), 1))
+
+    async def run_date(date: str) -> PipelineResult:
+        async with semaphore:
+            return await make_pipeline(date, plan.files[date]).run(plan.files[date])
+
+    results = await asyncio.gather(*[run_date(date) for date in dates])
+    return dict(zip(dates, results))
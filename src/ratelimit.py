@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+def is_throttled(response: httpx.Response) -> bool:
+    """True if the API asked us to slow down or failed on its side"""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """Seconds to wait from a Retry-After header, given either as a number
+    of seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket rate limiter shared by every request to one endpoint.
+
+    Tokens refill at rate per `per` seconds up to burst. Each request takes
+    one token and waits for the next one when the bucket is empty. pause()
+    stops every request until a Retry-After deadline has passed.
+
+    Args:
+        rate: Requests allowed per period
+        per: Length of the period in seconds
+        burst: Requests allowed back to back before the rate applies
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, burst: float = 1):
+        self.rate = rate / per
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    Every successful request raises the limit by 1/limit, about one slot per
+    round of requests, and every throttled request halves it.
+
+    Args:
+        initial: Starting number of concurrent requests
+        minimum: Lowest the limit is cut to
+        maximum: Highest the limit grows to
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._active = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def throttled(self) -> None:
+        self.limit = max(self.minimum, self.limit / 2)
+        logging.warning(f"Throttled by the API, concurrency cut to {int(self.limit)}")
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from src.utils import upload_compressed_to_zapier, upload_file_to_zapier
+
+
+class UploadQueue:
+    """Durable queue of uploads that failed and are waiting to be retried.
+
+    The queue is a JSON file rewritten on every change, so uploads that
+    failed in one run are retried by the next. Each file keeps its own
+    attempt count and is left in the queue, but no longer retried, once it
+    reaches max_attempts.
+
+    Args:
+        path: JSON file the queue is kept in
+        max_attempts: Attempts before a file is given up on
+    """
+
+    def __init__(self, path: str | Path = "./upload_queue.json", max_attempts: int = 5):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self._entries: dict[str, dict] = (
+            json.loads(self.path.read_text()) if self.path.exists() else {}
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        part = self.path.with_suffix(".json.part")
+        part.write_text(json.dumps(self._entries, indent=2))
+        os.replace(part, self.path)
+
+    def add(
+        self,
+        filepath: str | Path,
+        filename: str,
+        table_name: str,
+        remove: bool = True,
+        error: str | None = None,
+        compression: str | None = None,
+        max_volume_mb: int | None = None,
+    ) -> None:
+        """Queue a failed upload, or count another failed attempt of a
+        queued one.
+
+        Args:
+            filepath: Path to the file to upload
+            filename: Name the file is uploaded as
+            table_name: Name of the table, sent to the webhook
+            remove: Delete the file once it is uploaded
+            error: Why the upload failed
+            compression: Codec the file is compressed with while it uploads,
+                see upload_compressed_to_zapier
+            max_volume_mb: Size limit of each compressed volume
+        """
+        key = str(filepath)
+        entry = self._entries.get(key) or {
+            "path": key,
+            "filename": filename,
+            "table_name": table_name,
+            "remove": remove,
+            "compression": compression,
+            "max_volume_mb": max_volume_mb,
+            "attempts": 0,
+            "queued_at": time.time(),
+        }
+        entry["attempts"] += 1
+        entry["last_error"] = error
+        self._entries[key] = entry
+        self._save()
+        if entry["attempts"] >= self.max_attempts:
+            logging.error(
+                f"Giving up on uploading {filename} after {entry['attempts']} attempts, it is kept at {key}"
+            )
+
+    def pending(self, table_name: str | None = None) -> list[dict]:
+        """Queued uploads that have attempts left.
+
+        Args:
+            table_name: Only the uploads for this table, all of them if None
+
+        Returns:
+            list[dict]: Queue entries, oldest first
+        """
+        return sorted(
+            (
+                entry
+                for entry in self._entries.values()
+                if entry["attempts"] < self.max_attempts
+                and (table_name is None or entry["table_name"] == table_name)
+            ),
+            key=lambda entry: entry["queued_at"],
+        )
+
+    def remove(self, filepath: str | Path) -> None:
+        if self._entries.pop(str(filepath), None) is not None:
+            self._save()
+
+
+async def retry_uploads(
+    queue: UploadQueue,
+    zapier_webhook: str,
+    table_name: str | None = None,
+    concurrency: int = 2,
+    client: httpx.AsyncClient | None = None,
+) -> int:
+    """Retry the pending uploads in a queue.
+
+    Uploaded files are removed from the queue, and from disk unless they
+    were queued with remove=False. Files whose file no longer exists are
+    dropped from the queue.
+
+    Args:
+        queue: Queue of failed uploads
+        zapier_webhook: Zapier webhook URL
+        table_name: Only retry the uploads for this table, all of them if None
+        concurrency: Number of uploads at once
+        client: Pooled client to upload with, eg. BDC.client
+
+    Returns:
+        int: Number of files uploaded
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def retry(entry: dict) -> bool:
+        path = entry["path"]
+        if not os.path.exists(path):
+            logging.warning(
+                f"Dropping queued upload of {entry['filename']}, {path} is gone"
+            )
+            queue.remove(path)
+            return False
+        async with semaphore:
+            if entry.get("compression"):
+                # Every volume is sent again, the queue does not track which
+                # of them made it
+                success = await upload_compressed_to_zapier(
+                    path,
+                    zapier_webhook,
+                    entry["filename"],
+                    entry["table_name"],
+                    codec=entry["compression"],
+                    max_volume_mb=entry.get("max_volume_mb"),
+                    client=client,
+                )
+            else:
+                success = await upload_file_to_zapier(
+                    path,
+                    zapier_webhook,
+                    entry["filename"],
+                    entry["table_name"],
+                    client=client,
+                )
+        if not success:
+            queue.add(
+                path,
+                entry["filename"],
+                entry["table_name"],
+                entry["remove"],
+                error="Retry failed",
+                compression=entry.get("compression"),
+                max_volume_mb=entry.get("max_volume_mb"),
+            )
+            return False
+        queue.remove(path)
+        if entry["remove"]:
+            os.remove(path)
+        logging.info(f"Uploaded {entry['filename']} from the upload queue")
+        return True
+
+    results = await asyncio.gather(
+        *[retry(entry) for entry in queue.pending(table_name)]
+    )
+    return sum(results)
@@ -1,15 +1,32 @@
+import asyncio
+import hashlib
 import io
 import logging
 import os
+import shutil
 import tempfile
 import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator, Iterator
 
 import httpx
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pandas import DataFrame
+from pandas.api.types import union_categoricals
 from tqdm import tqdm
 
+from src.compression import (
+    COMPRESSION_CONTENT_TYPES,
+    COMPRESSION_EXTENSIONS,
+    compress_blocks,
+)
+from src.dtypes import BDC_DTYPES, arrow_type, cast_batch, check_dtypes, read_dtypes
+
 
 def check_file_size(filepath: str | Path, max_size_mb: int) -> bool:
     """
@@ -34,6 +51,28 @@ def check_file_size(filepath: str | Path, max_size_mb: int) -> bool:
         return True
 
 
+def file_checksum(source: str | Path | bytes) -> tuple[int, str]:
+    """
+    Size and SHA-256 checksum of a file or of bytes already in memory.
+
+    Args:
+        source: Path to the file, or the file contents
+
+    Returns:
+        tuple[int, str]: Size in bytes and hex SHA-256 digest
+    """
+    if isinstance(source, bytes):
+        return len(source), hashlib.sha256(source).hexdigest()
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(source, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
 def zip_file(filepath: str | Path) -> str | Path:
     """
     Zip a file.
@@ -53,71 +92,271 @@ def zip_file(filepath: str | Path) -> str | Path:
     return zip_filepath
 
 
+@asynccontextmanager
+async def _use_client(
+    client: httpx.AsyncClient | None,
+) -> AsyncIterator[httpx.AsyncClient]:
+    # Borrow a shared client, or open one just for this call
+    if client is not None:
+        yield client
+    else:
+        async with httpx.AsyncClient() as new_client:
+            yield new_client
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def upload_timeout(
+    size_bytes: int, min_seconds: float = 60.0, min_throughput_mb: float = 0.5
+) -> float:
+    """
+    Seconds allowed for a whole upload, growing with the size of the file.
+
+    Args:
+        size_bytes: Size of the file
+        min_seconds: Time allowed for the request on top of sending the body
+        min_throughput_mb: Slowest upload speed in MB/s before giving up
+
+    Returns:
+        float: Upload deadline in seconds
+    """
+    return min_seconds + size_bytes / (min_throughput_mb * 1024 * 1024)
+
+
+async def _read_chunks(filepath: str | Path, chunk_size: int) -> AsyncIterator[bytes]:
+    # Read the file in chunks off the event loop so a large upload never
+    # holds more than one chunk in memory or blocks other tasks
+    with open(filepath, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+
+
+async def _multipart_body(
+    preamble: bytes, chunks: AsyncIterator[bytes], epilogue: bytes
+) -> AsyncIterator[bytes]:
+    yield preamble
+    async for chunk in chunks:
+        yield chunk
+    yield epilogue
+
+
+async def _post_to_zapier(
+    client: httpx.AsyncClient,
+    zapier_webhook: str,
+    filename: str,
+    table_name: str,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    size_bytes: int,
+    exact_size: bool = True,
+) -> bool:
+    # Send chunks as the file part of a multipart form. The length is only
+    # set when size_bytes is exact, otherwise the body is sent chunked.
+    boundary = os.urandom(16).hex()
+    preamble = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    epilogue = f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    if exact_size:
+        headers["Content-Length"] = str(len(preamble) + size_bytes + len(epilogue))
+
+    try:
+        async with asyncio.timeout(upload_timeout(size_bytes)):
+            response = await client.post(
+                url=f"{zapier_webhook}?filename={filename}&table_name={table_name}",
+                content=_multipart_body(preamble, chunks, epilogue),
+                headers=headers,
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+
+        if response.status_code == 200:
+            logging.info(f"File {filename} uploaded to Zapier successfully")
+            return True
+        else:
+            logging.error(
+                f"Failed to upload {filename}. Status code: {response.status_code}"
+            )
+            return False
+    except (httpx.TimeoutException, TimeoutError):
+        logging.error(
+            f"Upload timed out for {filename}. File may be too large for processing"
+        )
+        return False
+    except httpx.RequestError as e:
+        logging.error(f"Request error during file upload of {filename}: {str(e)}")
+        return False
+
+
 async def upload_file_to_zapier(
-    filepath: str | Path, zapier_webhook: str, filename: str, table_name: str
+    filepath: str | Path,
+    zapier_webhook: str,
+    filename: str,
+    table_name: str,
+    client: httpx.AsyncClient | None = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
 ) -> bool:
     """
     Upload a file to Zapier via webhook
 
+    The multipart body is streamed from disk in chunks with its length set
+    up front, and the upload is given a deadline from upload_timeout.
+
     Args:
         filepath: Path to the file to upload
         zapier_webhook: Zapier webhook URL
         filename: Name of the file
         table_name: Name of the table
+        client: Pooled client to upload with, eg. BDC.client. A new client
+            is opened for the upload if None.
+        chunk_size: Bytes read from the file at a time
 
     Returns:
         bool: True if upload successful, False otherwise
     """
 
     try:
-        async with httpx.AsyncClient() as client:
-            with open(filepath, "rb") as f:
-                files = {"file": (filename, f, "application/octet-stream")}
-                response = await client.post(
-                    url=f"{zapier_webhook}?filename={filename}&table_name={table_name}",
-                    files=files,
-                    timeout=60.0,  # Increased timeout for larger files
-                )
-
-            if response.status_code == 200:
-                logging.info(f"File {filename} uploaded to Zapier successfully")
-                return True
-            else:
-                logging.error(
-                    f"Failed to upload {filename}. Status code: {response.status_code}"
-                )
-                return False
-    except httpx.TimeoutException:
-        logging.error(
-            f"Upload timed out for {filename}. File may be too large for processing"
-        )
-        return False
-    except httpx.RequestError as e:
-        logging.error(f"Request error during file upload of {filename}: {str(e)}")
+        size_bytes = os.path.getsize(filepath)
+        async with _use_client(client) as client:
+            return await _post_to_zapier(
+                client,
+                zapier_webhook,
+                filename,
+                table_name,
+                _read_chunks(filepath, chunk_size),
+                "application/octet-stream",
+                size_bytes,
+            )
+    except Exception as e:
+        logging.error(f"Unexpected error during upload of {filename}: {str(e)}")
         return False
+
+
+async def upload_compressed_to_zapier(
+    filepath: str | Path,
+    zapier_webhook: str,
+    filename: str,
+    table_name: str,
+    codec: str = "zstd",
+    max_volume_mb: int | None = None,
+    client: httpx.AsyncClient | None = None,
+    level: int | None = None,
+    threads: int | None = None,
+) -> bool:
+    """
+    Compress a file and upload it to Zapier while it compresses.
+
+    Blocks from compress_blocks are sent as soon as they are ready, so the
+    compression overlaps the upload instead of running before it. A file
+    larger than max_volume_mb is split into volumes named eg. name.zst.001,
+    name.zst.002, each at most max_volume_mb and each decompressable on its
+    own. Concatenating the volumes gives the whole compressed file.
+
+    Args:
+        filepath: Path to the file to upload
+        zapier_webhook: Zapier webhook URL
+        filename: Name of the file, the codec's extension is added to it
+        table_name: Name of the table
+        codec: gzip or zstd
+        max_volume_mb: Size limit of each uploaded volume, no limit if None
+        client: Pooled client to upload with, a new client is opened if None
+        level: Compression level, the codec's default if None
+        threads: Number of blocks compressed at once, one per CPU if None
+
+    Returns:
+        bool: True if every volume uploaded, False otherwise
+    """
+    max_volume_bytes = max_volume_mb * 1024 * 1024 if max_volume_mb else None
+    blocks = None
+    try:
+        size_bytes = os.path.getsize(filepath)
+        split = max_volume_bytes is not None and size_bytes > max_volume_bytes
+        blocks = compress_blocks(filepath, codec, level, threads=threads)
+        block = await asyncio.to_thread(next, blocks, None)
+
+        async def volume_blocks() -> AsyncIterator[bytes]:
+            # Send blocks until the next one would not fit in the volume
+            nonlocal block
+            sent = 0
+            while block is not None and (
+                not sent
+                or max_volume_bytes is None
+                or sent + len(block) <= max_volume_bytes
+            ):
+                yield block
+                sent += len(block)
+                block = await asyncio.to_thread(next, blocks, None)
+
+        async with _use_client(client) as client:
+            volume = 0
+            while block is not None:
+                volume += 1
+                name = f"{filename}.{COMPRESSION_EXTENSIONS[codec]}"
+                if split:
+                    name = f"{name}.{volume:03d}"
+                if not await _post_to_zapier(
+                    client,
+                    zapier_webhook,
+                    name,
+                    table_name,
+                    volume_blocks(),
+                    COMPRESSION_CONTENT_TYPES[codec],
+                    min(size_bytes, max_volume_bytes or size_bytes),
+                    exact_size=False,
+                ):
+                    return False
+            return True
     except Exception as e:
         logging.error(f"Unexpected error during upload of {filename}: {str(e)}")
         return False
+    finally:
+        if blocks is not None:
+            await asyncio.to_thread(blocks.close)
 
 
 def extractZip(response, file_id):
     zip_path = f"./{file_id}.csv.zip"
-    extract_path = "./exports"
 
     # Save the content to a file
     with open(zip_path, "wb") as file:
         file.write(response.content)
 
-    # Extract the zip file
+    extractZipFile(zip_path)
+
+
+def extractZipFile(
+    zip_path: str | Path, extract_path: str | Path = "./exports", remove: bool = True
+) -> list[str]:
+    """
+    Extract a ZIP file that has already been written to disk.
+
+    Args:
+        zip_path: Path to the ZIP file
+        extract_path: Directory the members are extracted to
+        remove: Delete the ZIP file after extracting
+
+    Returns:
+        list[str]: Names of the extracted members
+    """
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        members = zip_ref.namelist()
         zip_ref.extractall(extract_path)
 
-    # delete the zip file
-    os.remove(path=zip_path)
+    if remove:
+        os.remove(path=zip_path)
 
+    return members
 
-def upload_tempfile_to_zapier(
-    file_data: io.BytesIO, zapier_webhook: str, filename: str, table_name: str
+
+async def upload_tempfile_to_zapier(
+    file_data: io.BytesIO,
+    zapier_webhook: str,
+    filename: str,
+    table_name: str,
+    client: httpx.AsyncClient | None = None,
 ) -> bool:
     """
     Upload a file to Zapier via webhook
@@ -126,89 +365,237 @@ def upload_tempfile_to_zapier(
         file_data: BytesIO object containing the file data
         zapier_webhook: Zapier webhook URL
         filename: Name of the file
+        table_name: Name of the table
+        client: Pooled client to upload with, a new client is opened if None
 
     Returns:
         bool: True if upload successful, False otherwise
     """
-    temp_file = None
-    try:
-        # Create a temporary file
-        temp_file = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
-        temp_file_path = temp_file.name
-
-        # Write the data to the temporary file
-        file_data.seek(0)  # Ensure we're at the start of the BytesIO
-        temp_file.write(file_data.read())
-        temp_file.close()
-
-        # Upload the file
-        with open(temp_file_path, "rb") as f:
-            files = {"file": f}
-            response = httpx.post(
-                url=f"{zapier_webhook}?filename={filename}&table_name={table_name}",
-                files=files,
-                timeout=30,  # Add timeout
-            )
 
-        if response.status_code == 200:
-            logging.info("File uploaded to Zapier successfully")
-            return True
-        else:
-            logging.error(f"Failed to upload file. Status code: {response.status_code}")
-            return False
+    def spool() -> str:
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temp_file:
+            file_data.seek(0)  # Ensure we're at the start of the BytesIO
+            shutil.copyfileobj(file_data, temp_file)
+            return temp_file.name
 
+    try:
+        temp_file_path = await asyncio.to_thread(spool)
     except Exception as e:
         logging.error(f"Failed to upload file: {str(e)}")
         return False
 
+    try:
+        return await upload_file_to_zapier(
+            temp_file_path, zapier_webhook, filename, table_name, client=client
+        )
     finally:
         # Clean up the temporary file
-        if temp_file is not None:
-            try:
-                os.unlink(temp_file.name)
-            except Exception as e:
-                logging.warning(f"Failed to delete temporary file: {str(e)}")
+        try:
+            os.unlink(temp_file_path)
+        except Exception as e:
+            logging.warning(f"Failed to delete temporary file: {str(e)}")
+
+
+def _csv_files(path: str | list[str]) -> list[str]:
+    if isinstance(path, list):
+        return [str(f) for f in path]
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".csv"))
+
+
+def _read_typed_csv(
+    csv_path: str, columns: list[str] | None, chunksize: int
+) -> Iterator[DataFrame]:
+    chunks = pd.read_csv(
+        csv_path,
+        encoding="utf-8",
+        usecols=columns,
+        dtype=read_dtypes(columns),
+        chunksize=chunksize,
+        index_col=False,
+    )
+    for chunk in chunks:
+        yield cast_batch(chunk, csv_path)
+
+
+def _concat_typed(frames: list[DataFrame]) -> DataFrame:
+    """Concatenate typed chunks without falling back to object dtype when
+    the chunks of a category column have different categories"""
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(
+                [frame[column] for frame in frames], ignore_order=True
+            )
+        else:
+            columns[column] = pd.concat(
+                [frame[column] for frame in frames], ignore_index=True
+            )
+    return DataFrame(columns)
+
 
+def _read_typed_file(
+    csv_path: str, columns: list[str] | None, chunksize: int
+) -> DataFrame:
+    return _concat_typed(list(_read_typed_csv(csv_path, columns, chunksize)))
 
-def combineCSVsintoDataFrame(path: str = "./exports") -> DataFrame | None:
+
+def _write_typed_parquet(
+    csv_path: str, parquet_path: str, columns: list[str] | None, chunksize: int
+) -> str:
+    writer = None
+    schema = None
+    try:
+        for chunk in _read_typed_csv(csv_path, columns, chunksize):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # Category codes can be int8 in one chunk and int16 in the
+                # next, so every chunk is cast to the schema the pipeline's
+                # Parquet export writes, with 32 bit dictionary indices
+                schema = pa.schema(
+                    [
+                        pa.field(field.name, arrow_type(BDC_DTYPES[field.name]))
+                        if field.name in BDC_DTYPES
+                        else field
+                        for field in table.schema
+                    ]
+                )
+                writer = pq.ParquetWriter(parquet_path, schema, compression="zstd")
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return parquet_path
+
+
+def iterCSVBatches(
+    path: str | list[str] = "./exports",
+    columns: list[str] | None = None,
+    chunksize: int = 100_000,
+    processes: int | None = None,
+    check: bool = True,
+) -> Iterator[DataFrame]:
+    """Reads every CSV file in a directory as a stream of typed DataFrames.
+
+    The compact column types in src.dtypes and the column selection are
+    applied while reading, so memory use is bounded by the batch size rather
+    than the directory size.
+
+    Args:
+        path (str | list[str]): The path to the directory containing the CSV
+            files, or a list of CSV or zipped CSV files such as the cached
+            files from DownloadCache.paths.
+        columns (list[str]): Only read these columns, all columns if None.
+        chunksize (int): Number of rows read at a time.
+        processes (int): Read this many files at once in a process pool.
+            Each file is then yielded as a single batch. Reads in the
+            current process if None.
+        check (bool): Check a sample of every file fits its column types
+            before reading any of them.
+
+    Yields:
+        DataFrame: Typed batches, in file order
+
+    Raises:
+        DtypeOverflowError: If a value does not fit its column type
+    """
+    files = _csv_files(path)
+    if check:
+        check_dtypes(files, columns=columns)
+    if not processes:
+        for csv_path in files:
+            yield from _read_typed_csv(csv_path, columns, chunksize)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # Keep at most one file per process in flight so results don't pile up
+        pending = deque()
+        for csv_path in files:
+            pending.append(
+                executor.submit(_read_typed_file, csv_path, columns, chunksize)
+            )
+            if len(pending) >= processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def combineCSVsintoDataFrame(
+    path: str | list[str] = "./exports",
+    columns: list[str] | None = None,
+    processes: int | None = None,
+    check: bool = True,
+) -> DataFrame | None:
     """Combines all CSV files in a directory into a single DataFrame.
 
     Args:
-        path (str): The path to the directory containing the CSV files.
-    """
-    column_types = {
-        "frn": "category",
-        "provider_id": "category",
-        "brand_name": "category",
-        "location_id": "int16",
-        "technology": "category",
-        "max_advertised_download_speed": "category",
-        "max_advertised_upload_speed": "category",
-        "low_latency": "category",
-        "business_residential_code": "category",
-        "state_usps": "category",
-        "block_geoid": "int32",
-        "h3_res8_id": "category",
-    }
-
-    frames = []
-    files = [f for f in os.listdir(path) if f.endswith(".csv")]
-
-    if len(files) == 0:
+        path (str | list[str]): The path to the directory containing the CSV
+            files, or a list of CSV or zipped CSV files such as the cached
+            files from DownloadCache.paths.
+        columns (list[str]): Only read these columns, all columns if None.
+        processes (int): Read this many files at once in a process pool.
+        check (bool): Check a sample of every file fits its column types
+            before reading any of them.
+    """
+    if len(_csv_files(path)) == 0:
         print("No CSV files found")
         return None
-    else:
-        for file in tqdm(files, desc="Loading CSV files"):
-            # Load the CSV files into DataFrames
-            chunks = pd.read_csv(
-                f"{path}/{file}", encoding="utf-8", chunksize=10000, index_col=False
-            )
-            for chunk in chunks:
-                frames.append(chunk)
 
-        # Combine the DataFrames
-        combined_df = pd.concat(frames, ignore_index=True)
-        combined_df = combined_df.astype(column_types)
+    frames = list(
+        tqdm(
+            iterCSVBatches(path, columns=columns, processes=processes, check=check),
+            desc="Loading CSV files",
+        )
+    )
+    combined_df = _concat_typed(frames)
+
+    print("Files have been combined into a DataFrame")
+    return combined_df
 
-        print("Files have been combined into a DataFrame")
-        return combined_df
+
+def combineCSVsintoParquet(
+    path: str | list[str] = "./exports",
+    output_path: str = "./exports/parquet",
+    columns: list[str] | None = None,
+    chunksize: int = 100_000,
+    processes: int | None = None,
+    check: bool = True,
+) -> list[str]:
+    """Writes every CSV file in a directory to a typed Parquet file, for
+    datasets too large to combine in memory. Read the result back with
+    pd.read_parquet(output_path, columns=[...]).
+
+    Args:
+        path (str | list[str]): The path to the directory containing the CSV
+            files, or a list of CSV or zipped CSV files such as the cached
+            files from DownloadCache.paths.
+        output_path (str): Directory the Parquet files are written to.
+        columns (list[str]): Only write these columns, all columns if None.
+        chunksize (int): Number of rows read at a time.
+        processes (int): Convert this many files at once in a process pool.
+        check (bool): Check a sample of every file fits its column types
+            before converting any of them.
+
+    Returns:
+        list[str]: Paths of the Parquet files written
+    """
+    files = _csv_files(path)
+    if check:
+        check_dtypes(files, columns=columns)
+    os.makedirs(output_path, exist_ok=True)
+    jobs = [
+        (
+            csv_path,
+            os.path.join(output_path, f"{Path(csv_path).name.split('.')[0]}.parquet"),
+            columns,
+            chunksize,
+        )
+        for csv_path in files
+    ]
+    if not processes:
+        return [_write_typed_parquet(*job) for job in tqdm(jobs)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_write_typed_parquet, *job) for job in jobs]
+        return [future.result() for future in tqdm(futures)]
@@ -0,0 +1,132 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from db.async_db import AsyncDBConnection
+
+
+class MockColumn(tuple):
+    @property
+    def name(self):
+        return self[0]
+
+
+class MockCursor:
+    def __init__(self, rows, description):
+        self.rows = rows
+        self.description = description
+
+    async def execute(self, query, params=None):
+        self.query = query
+
+    async def fetchall(self):
+        return self.rows
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class MockConnection:
+    def __init__(self, rows, description):
+        self.rows = rows
+        self.description = description
+
+    async def execute(self, query, params=None):
+        await asyncio.sleep(0.01)
+        cursor = MockCursor(list(self.rows), self.description)
+        await cursor.execute(query, params)
+        return cursor
+
+    def cursor(self, name=None):
+        return MockCursor(list(self.rows), self.description)
+
+
+class MockPool:
+    def __init__(self, conninfo, max_size, **kwargs):
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self.rows = []
+        self.description = None
+        self.active = 0
+        self.max_active = 0
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @asynccontextmanager
+    async def connection(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            yield MockConnection(self.rows, self.description)
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def mock_pool(mocker):
+    mocker.patch("db.async_db.AsyncConnectionPool", side_effect=MockPool)
+
+
+class TestAsyncDBConnection:
+    @pytest.mark.asyncio
+    async def test_conninfo_drops_driver(self, mock_pool):
+        db = AsyncDBConnection("postgresql+psycopg2://user@localhost/bdc")
+
+        assert db.pool.conninfo == "postgresql://user@localhost/bdc"
+
+    @pytest.mark.asyncio
+    async def test_execute_query(self, mock_pool):
+        async with AsyncDBConnection("postgresql://localhost/bdc") as db:
+            db.pool.rows = [(1, "AL"), (2, "GA")]
+            db.pool.description = [
+                MockColumn(("location_id", 23)),
+                MockColumn(("state_usps", 1043)),
+            ]
+
+            df = await db.execute_query("SELECT location_id, state_usps FROM bdc")
+            schema = await db.get_table_schema("bdc")
+
+        assert list(df.columns) == ["location_id", "state_usps"]
+        assert len(df) == 2
+        assert schema.startswith("Schema for table bdc:")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_rowcounts(self, mock_pool):
+        async with AsyncDBConnection("postgresql://localhost/bdc") as db:
+            db.pool.rows = [(42,)]
+
+            counts = await asyncio.gather(*[db.get_rowcount("bdc") for _ in range(4)])
+
+        assert counts == [42] * 4
+        # Each call had its own pooled connection
+        assert db.pool.max_active == 4
+
+    @pytest.mark.asyncio
+    async def test_stream_query(self, mock_pool):
+        async with AsyncDBConnection("postgresql://localhost/bdc") as db:
+            db.pool.rows = [(i,) for i in range(25)]
+            db.pool.description = [MockColumn(("location_id", 23))]
+
+            sizes = [
+                len(frame)
+                async for frame in db.stream_query(
+                    "SELECT location_id FROM bdc", itersize=10, max_rows=22
+                )
+            ]
+
+        assert sizes == [10, 10, 2]
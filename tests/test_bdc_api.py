@@ -1,11 +1,24 @@
+import asyncio
+import io
+import time
+import zipfile
+
+import httpx
 import pytest
 from unittest.mock import AsyncMock, patch
-from src.bdc_api import BDC
+from src.bdc_api import BDC, DownloadError, create_http_client
+from src.ratelimit import AdaptiveConcurrency, TokenBucket, retry_after
+from src.utils import upload_file_to_zapier
 
 
 @pytest.fixture
 def bdc_client():
-    return BDC("test_username", "test_api_key")
+    return BDC(
+        "test_username",
+        "test_api_key",
+        list_rate_limit=6000,
+        download_rate_limit=6000,
+    )
 
 
 class TestGetListOfDates:
@@ -158,3 +171,403 @@ class TestErrorHandling:
 
             with pytest.raises(Exception):
                 await bdc_client.getDownloadList(date="2024-03-13", category="State")
+
+
+class TestStreamDownloadFile:
+    @pytest.mark.asyncio
+    async def test_streamDownloadFile_writes_chunks(self, bdc_client, tmp_path):
+        mock_content = b"x" * (3 * 1024 * 1024)
+
+        def handler(request):
+            return httpx.Response(200, content=mock_content)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        progress = []
+
+        path = await bdc_client.streamDownloadFile(
+            "123",
+            tmp_path / "123.csv.zip",
+            chunk_size=1024 * 1024,
+            on_progress=lambda done, total, rate: progress.append((done, total)),
+            verify=False,
+        )
+
+        assert path.read_bytes() == mock_content
+        assert progress[-1] == (len(mock_content), len(mock_content))
+        assert len(progress) >= 3
+
+    @pytest.mark.asyncio
+    async def test_streamDownloadFile_http_error(self, bdc_client, tmp_path):
+        def handler(request):
+            return httpx.Response(404)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await bdc_client.streamDownloadFile("123", tmp_path / "123.csv.zip")
+
+
+@pytest.fixture
+def zip_content():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr("test.csv", "frn,provider_id\n" + "123,456\n" * 10000)
+    return buffer.getvalue()
+
+
+class TestResumableDownload:
+    @pytest.mark.asyncio
+    async def test_resume_from_part_file(self, bdc_client, tmp_path, zip_content):
+        offset = len(zip_content) // 2
+        (tmp_path / "123.csv.zip.part").write_bytes(zip_content[:offset])
+        requests = []
+
+        def handler(request):
+            requests.append(request.headers.get("Range"))
+            start = int(request.headers["Range"][len("bytes=") : -1])
+            return httpx.Response(
+                206,
+                content=zip_content[start:],
+                headers={
+                    "Content-Range": f"bytes {start}-{len(zip_content) - 1}/{len(zip_content)}"
+                },
+            )
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        path = await bdc_client.streamDownloadFile("123", tmp_path / "123.csv.zip")
+
+        assert requests == [f"bytes={offset}-"]
+        assert path.read_bytes() == zip_content
+        assert not (tmp_path / "123.csv.zip.part").exists()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_interrupted_download(
+        self, bdc_client, tmp_path, zip_content
+    ):
+        offset = len(zip_content) // 3
+        requests = []
+
+        def handler(request):
+            requests.append(request.headers.get("Range"))
+            if len(requests) == 1:
+                # Server drops the connection after sending part of the file
+                return httpx.Response(
+                    200,
+                    content=zip_content[:offset],
+                    headers={"Content-Length": str(len(zip_content))},
+                )
+            start = int(request.headers["Range"][len("bytes=") : -1])
+            return httpx.Response(
+                206,
+                content=zip_content[start:],
+                headers={
+                    "Content-Range": f"bytes {start}-{len(zip_content) - 1}/{len(zip_content)}"
+                },
+            )
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        path = await bdc_client.streamDownloadFile("123", tmp_path / "123.csv.zip")
+
+        assert requests == [None, f"bytes={offset}-"]
+        assert path.read_bytes() == zip_content
+
+    @pytest.mark.asyncio
+    async def test_corrupt_download_fails_verification(self, tmp_path, zip_content):
+        bdc_client = BDC("test_username", "test_api_key", max_download_tries=1)
+        corrupt = bytearray(zip_content)
+        corrupt[len(corrupt) // 4] ^= 0xFF
+
+        def handler(request):
+            return httpx.Response(200, content=bytes(corrupt))
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(DownloadError):
+            await bdc_client.streamDownloadFile("123", tmp_path / "123.csv.zip")
+        assert not (tmp_path / "123.csv.zip").exists()
+        assert not (tmp_path / "123.csv.zip.part").exists()
+
+
+@pytest.fixture
+def dates_response():
+    return {
+        "data": [
+            {"data_type": "availability", "as_of_date": "2024-06-30"},
+            {"data_type": "availability", "as_of_date": "2023-12-31"},
+        ]
+    }
+
+
+class TestMetadataCache:
+    @pytest.mark.asyncio
+    async def test_listing_served_from_cache(self, bdc_client, dates_response):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json=dates_response)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        first = await bdc_client.getlistofDates()
+        second = await bdc_client.getlistofDates()
+
+        assert first == second == ("availability", ["2023-12-31", "2024-06-30"])
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_listing_revalidated(self, dates_response):
+        bdc_client = BDC(
+            "test_username", "test_api_key", metadata_ttl=0, list_rate_limit=6000
+        )
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304)
+            return httpx.Response(200, json=dates_response, headers={"ETag": '"v1"'})
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        await bdc_client.getlistofDates()
+        _, dates = await bdc_client.getlistofDates()
+
+        assert dates == ["2023-12-31", "2024-06-30"]
+        assert len(requests) == 2
+        assert requests[1].headers["If-None-Match"] == '"v1"'
+
+    @pytest.mark.asyncio
+    async def test_listing_persisted_and_invalidated(self, tmp_path, dates_response):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json=dates_response)
+
+        path = tmp_path / "metadata.json"
+        for _ in range(2):
+            bdc_client = BDC(
+                "test_username",
+                "test_api_key",
+                metadata_cache_path=path,
+                list_rate_limit=6000,
+            )
+            bdc_client.client = httpx.AsyncClient(
+                transport=httpx.MockTransport(handler)
+            )
+            await bdc_client.getlistofDates()
+        assert len(requests) == 1
+
+        bdc_client.invalidateMetadata()
+        await bdc_client.getlistofDates()
+        assert len(requests) == 2
+        assert "test_api_key" not in path.read_text()
+
+    @pytest.mark.asyncio
+    async def test_error_response_not_cached(self, bdc_client, dates_response):
+        responses = [
+            httpx.Response(404, json={}),
+            httpx.Response(200, json=dates_response),
+        ]
+
+        def handler(request):
+            return responses.pop(0)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        with pytest.raises(KeyError):
+            await bdc_client.getlistofDates()
+        _, dates = await bdc_client.getlistofDates()
+
+        assert dates == ["2023-12-31", "2024-06-30"]
+
+
+class TestRateLimiting:
+    @pytest.mark.asyncio
+    async def test_token_bucket_spaces_requests(self):
+        bucket = TokenBucket(rate=20, per=1)
+        start = time.monotonic()
+
+        for _ in range(4):
+            await bucket.acquire()
+
+        assert time.monotonic() - start >= 0.14
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_pause(self):
+        bucket = TokenBucket(rate=6000)
+        bucket.pause(0.1)
+        start = time.monotonic()
+
+        await bucket.acquire()
+
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_adaptive_concurrency(self):
+        limit = AdaptiveConcurrency(initial=4, maximum=5)
+        limit.throttled()
+        assert limit.limit == 2
+        for _ in range(20):
+            limit.success()
+        assert limit.limit == 5
+
+        active = peak = 0
+        limit.throttled()
+
+        async def request():
+            nonlocal active, peak
+            async with limit:
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*[request() for _ in range(6)])
+        assert peak == 2
+
+    def test_retry_after(self):
+        assert retry_after(httpx.Response(429, headers={"Retry-After": "3"})) == 3
+        assert retry_after(httpx.Response(429)) is None
+        assert (
+            retry_after(
+                httpx.Response(
+                    503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+                )
+            )
+            == 0
+        )
+
+    @pytest.mark.asyncio
+    async def test_download_backs_off_on_429(self, bdc_client, tmp_path, zip_content):
+        responses = [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, content=zip_content),
+        ]
+
+        def handler(request):
+            return responses.pop(0)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        path = await bdc_client.streamDownloadFile("123", tmp_path / "123.csv.zip")
+
+        assert path.read_bytes() == zip_content
+        assert bdc_client.download_concurrency.limit == 2.5
+
+    @pytest.mark.asyncio
+    async def test_listing_retried_on_server_error(self, bdc_client, dates_response):
+        responses = [httpx.Response(503), httpx.Response(200, json=dates_response)]
+
+        def handler(request):
+            return responses.pop(0)
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        _, dates = await bdc_client.getlistofDates()
+
+        assert dates == ["2023-12-31", "2024-06-30"]
+
+
+class TestClientLifecycle:
+    @pytest.mark.asyncio
+    async def test_context_manager_closes_client(self):
+        async with BDC("test_username", "test_api_key") as bdc_client:
+            assert not bdc_client.client.is_closed
+
+        assert bdc_client.client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_shared_client_left_open(self):
+        client = create_http_client(max_connections=4, http2=True)
+
+        async with BDC("test_username", "test_api_key", client=client) as bdc_client:
+            assert bdc_client.client is client
+
+        assert not client.is_closed
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_upload_uses_shared_client(self, tmp_path):
+        uploads = []
+
+        def handler(request):
+            uploads.append(request)
+            return httpx.Response(200)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        file_path = tmp_path / "test.csv"
+        file_path.write_text("frn,provider_id\n123,456\n")
+
+        success = await upload_file_to_zapier(
+            file_path,
+            "http://test-webhook.com",
+            "test.csv",
+            "2024-06-30",
+            client=client,
+        )
+
+        assert success
+        assert uploads[0].url.params["filename"] == "test.csv"
+        assert not client.is_closed
+
+
+class TestDownloadListFilters:
+    @pytest.mark.asyncio
+    async def test_getDownloadList_filters(self, bdc_client):
+        listing = {
+            "data": [
+                {
+                    "file_id": 1,
+                    "file_name": "bdc_01_Cable_fixed_broadband",
+                    "technology_type": "Fixed Broadband",
+                    "file_type": "csv",
+                },
+                {
+                    "file_id": 2,
+                    "file_name": "bdc_01_GSO_Satellite_fixed_broadband",
+                    "technology_type": "Fixed Broadband",
+                    "file_type": "csv",
+                },
+                {
+                    "file_id": 3,
+                    "file_name": "bdc_01_4G_mobile_broadband",
+                    "technology_type": "Mobile Broadband",
+                    "file_type": "gis",
+                },
+            ]
+        }
+        bdc_client.client = httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, json=listing)
+            )
+        )
+
+        default = await bdc_client.getDownloadList("2024-06-30", "State")
+        everything = await bdc_client.getDownloadList(
+            "2024-06-30",
+            "State",
+            technology_type=None,
+            file_type=None,
+            include_satellite=True,
+        )
+
+        assert [file["file_id"] for file in default] == [1]
+        assert [file["file_id"] for file in everything] == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_gis_download_url(self, bdc_client):
+        urls = []
+
+        def handler(request):
+            urls.append(str(request.url))
+            return httpx.Response(200, content=b"gis")
+
+        bdc_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        await bdc_client.getDownloadFile(3, gis_file_type=2)
+
+        assert urls[0].endswith("/downloads/downloadfile/availability/3/2")
@@ -0,0 +1,72 @@
+import os
+
+from src.cache import DownloadCache
+
+
+def make_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return path
+
+
+class TestDownloadCache:
+    def test_put_and_get(self, tmp_path):
+        cache = DownloadCache(tmp_path / "cache")
+        file = {"file_id": 1, "file_name": "test_1", "record_count": "10"}
+        source = make_file(tmp_path, "1.csv.zip", b"zip contents")
+
+        entry = cache.put("2024-06-30", file, source)
+        os.remove(source)
+
+        cached = cache.get("2024-06-30", file)
+        assert cached["path"] == entry["path"]
+        assert cached["size_bytes"] == 12
+        assert open(cached["path"], "rb").read() == b"zip contents"
+        assert cache.get("2024-12-31", file) is None
+
+    def test_index_persists(self, tmp_path):
+        file = {"file_id": 1, "file_name": "test_1"}
+        DownloadCache(tmp_path / "cache").put("2024-06-30", file, b"zip contents")
+
+        assert DownloadCache(tmp_path / "cache").get("2024-06-30", file) is not None
+
+    def test_changed_file_is_a_miss(self, tmp_path):
+        cache = DownloadCache(tmp_path / "cache")
+        file = {"file_id": 1, "file_name": "test_1", "record_count": "10"}
+        cache.put("2024-06-30", file, b"zip contents")
+
+        assert cache.get("2024-06-30", {**file, "record_count": "11"}) is None
+        assert cache.get("2024-06-30", file) is None
+
+    def test_same_content_stored_once(self, tmp_path):
+        cache = DownloadCache(tmp_path / "cache")
+        cache.put("2024-06-30", {"file_id": 1, "file_name": "a"}, b"same")
+        cache.put("2024-06-30", {"file_id": 2, "file_name": "b"}, b"same")
+
+        assert cache.size_bytes == 4
+        assert len(cache.paths("2024-06-30")) == 2
+        assert len(list((tmp_path / "cache" / "objects").iterdir())) == 1
+
+    def test_lru_eviction(self, tmp_path):
+        cache = DownloadCache(tmp_path / "cache", max_size_gb=25 / 1024**3)
+        files = [{"file_id": i, "file_name": f"test_{i}"} for i in range(3)]
+        cache.put("2024-06-30", files[0], b"0" * 10)
+        cache.put("2024-06-30", files[1], b"1" * 10)
+        cache.get("2024-06-30", files[0])
+        cache.put("2024-06-30", files[2], b"2" * 10)
+
+        assert cache.get("2024-06-30", files[1]) is None
+        assert cache.get("2024-06-30", files[0]) is not None
+        assert cache.get("2024-06-30", files[2]) is not None
+        assert cache.size_bytes == 20
+        assert len(list((tmp_path / "cache" / "objects").iterdir())) == 2
+
+    def test_invalidate(self, tmp_path):
+        cache = DownloadCache(tmp_path / "cache")
+        file = {"file_id": 1, "file_name": "test_1"}
+        entry = cache.put("2024-06-30", file, b"zip contents")
+
+        cache.invalidate("2024-06-30", 1)
+
+        assert cache.get("2024-06-30", file) is None
+        assert not os.path.exists(entry["path"])
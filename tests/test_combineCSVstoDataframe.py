@@ -1,9 +1,84 @@
 import sys
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
 sys.path.append("./")
-from src.utils import combineCSVsintoDataFrame
+from src.dtypes import arrow_schema
+from src.utils import (
+    combineCSVsintoDataFrame,
+    combineCSVsintoParquet,
+    iterCSVBatches,
+)
 
 box_path = "/Users/mwhittington/Library/CloudStorage/Box-Box/BDC 2023-12-31"
 
+HEADER = "frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id"
+
+
+@pytest.fixture
+def exports(tmp_path):
+    for state, brand in [("AL", "Brand A"), ("CA", "Brand B"), ("TX", "Brand C")]:
+        rows = [
+            f"0001234567,130077,{brand},{1012345678 + i},50,1000,100,1,R,{state},{10010201001000 + i},8844c0a31dfffff"
+            for i in range(5)
+        ]
+        (tmp_path / f"{state}.csv").write_text("\n".join([HEADER, *rows]))
+    return tmp_path
+
+
+class TestCombineCSVs:
+    def test_iter_batches_typed(self, exports):
+        batches = list(
+            iterCSVBatches(
+                str(exports), columns=["brand_name", "location_id"], chunksize=2
+            )
+        )
+
+        assert len(batches) == 9
+        assert all(
+            list(batch.columns) == ["brand_name", "location_id"] for batch in batches
+        )
+        assert all(batch["brand_name"].dtype == "category" for batch in batches)
+        assert all(batch["location_id"].dtype == "UInt32" for batch in batches)
+
+    def test_combine_keeps_categories(self, exports):
+        df = combineCSVsintoDataFrame(str(exports))
+
+        assert len(df) == 15
+        assert df["brand_name"].dtype == "category"
+        assert set(df["brand_name"]) == {"Brand A", "Brand B", "Brand C"}
+        assert df["state_usps"].tolist()[::5] == ["AL", "CA", "TX"]
+        assert df["location_id"].max() == 1012345682
+        assert df["max_advertised_download_speed"].sum() == 15000
+
+    def test_combine_process_pool(self, exports):
+        df = combineCSVsintoDataFrame(
+            str(exports), columns=["state_usps", "block_geoid"], processes=2
+        )
+
+        assert len(df) == 15
+        assert list(df.columns) == ["state_usps", "block_geoid"]
+        assert df["block_geoid"].dtype == "Int64"
+        assert df["block_geoid"].max() == 10010201001004
+
+    def test_combine_no_files(self, tmp_path):
+        assert combineCSVsintoDataFrame(str(tmp_path)) is None
+
+    def test_combine_into_parquet(self, exports, tmp_path):
+        paths = combineCSVsintoParquet(
+            str(exports), str(tmp_path / "parquet"), chunksize=2
+        )
+
+        assert len(paths) == 3
+        # The same layout as the pipeline's Parquet export, plus state_usps
+        assert pq.read_schema(paths[0]).remove_metadata() == arrow_schema()
+        df = pd.read_parquet(tmp_path / "parquet", columns=["brand_name"])
+        assert len(df) == 15
+        assert df["brand_name"].dtype == "category"
+
+
 if __name__ == "__main__":
     df = combineCSVsintoDataFrame()
     print(df.head())
@@ -0,0 +1,109 @@
+import gzip
+
+import httpx
+import pyarrow as pa
+import pytest
+
+from src.compression import compress_blocks
+from src.utils import upload_compressed_to_zapier
+
+
+def zstd_decompress(data: bytes) -> bytes:
+    return pa.CompressedInputStream(pa.BufferReader(data), "zstd").read()
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "test.csv"
+    rows = [
+        f"{i},130077,Brand {i % 7},{1012345678 + i},50,1000,100" for i in range(50_000)
+    ]
+    path.write_text(
+        "frn,provider_id,brand_name,location_id,technology,down,up\n" + "\n".join(rows)
+    )
+    return path
+
+
+class TestCompressBlocks:
+    @pytest.mark.parametrize(
+        "codec,decompress", [("gzip", gzip.decompress), ("zstd", zstd_decompress)]
+    )
+    def test_blocks_concatenate(self, csv_file, codec, decompress):
+        blocks = list(
+            compress_blocks(csv_file, codec, block_size=256 * 1024, threads=2)
+        )
+
+        assert len(blocks) > 1
+        assert decompress(b"".join(blocks)) == csv_file.read_bytes()
+
+    def test_unsupported_codec(self, csv_file):
+        with pytest.raises(ValueError):
+            list(compress_blocks(csv_file, "brotli"))
+
+
+class TestUploadCompressed:
+    @pytest.mark.asyncio
+    async def test_volumes(self, csv_file, mocker):
+        # Small blocks and a 1 MB limit so the file needs several volumes
+        mocker.patch("src.utils.compress_blocks").side_effect = lambda *args, **kwargs: (
+            compress_blocks(*args, **kwargs, block_size=64 * 1024)
+        )
+        volumes = {}
+
+        async def handler(request):
+            body = b"".join([chunk async for chunk in request.stream])
+            boundary = request.headers["Content-Type"].split("boundary=")[1]
+            content = body.split(b"\r\n\r\n", 1)[1].rsplit(
+                f"\r\n--{boundary}--".encode(), 1
+            )[0]
+            volumes[request.url.params["filename"]] = content
+            return httpx.Response(200)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        large = csv_file.with_name("large.csv")
+        large.write_bytes(csv_file.read_bytes() * 3)
+
+        success = await upload_compressed_to_zapier(
+            large,
+            "http://test-webhook.com",
+            "large",
+            "2024-06-30",
+            codec="gzip",
+            max_volume_mb=1,
+            client=client,
+            level=0,
+        )
+        await client.aclose()
+
+        names = sorted(volumes)
+        assert success
+        assert len(names) > 1
+        assert names[0] == "large.gz.001"
+        assert all(len(volume) <= 1024 * 1024 for volume in volumes.values())
+        # Each volume decompresses on its own
+        assert b"".join(gzip.decompress(volumes[name]) for name in names) == (
+            large.read_bytes()
+        )
+
+    @pytest.mark.asyncio
+    async def test_small_file_single_volume(self, csv_file):
+        names = []
+
+        def handler(request):
+            names.append(request.url.params["filename"])
+            return httpx.Response(200)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        success = await upload_compressed_to_zapier(
+            csv_file,
+            "http://test-webhook.com",
+            "test",
+            "2024-06-30",
+            max_volume_mb=100,
+            client=client,
+        )
+        await client.aclose()
+
+        assert success
+        assert names == ["test.zst"]
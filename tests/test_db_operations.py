@@ -1,7 +1,9 @@
+import zipfile
+
 import pytest
 from sqlalchemy import create_engine, MetaData, inspect
 from sqlalchemy.engine import Engine
-from db.schema import copy_data_to_postgres, create_bdc_table
+from db.schema import copy_data_to_postgres, copy_zip_to_postgres, create_bdc_table
 
 
 @pytest.fixture
@@ -197,3 +199,32 @@ class TestCopyDataToPostgres:
         with test_engine.connect() as conn:
             result = conn.execute(f"SELECT * FROM {table_name}").fetchall()
             assert len(result) == 2  # Should have two rows
+
+
+class TestCopyZipToPostgres:
+    def test_copy_zip_to_postgres_streams_members(
+        self, mocker, tmp_path, sample_csv_content
+    ):
+        zip_path = tmp_path / "test.csv.zip"
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr("test.csv", sample_csv_content)
+            zipf.writestr("readme.txt", "not a csv")
+
+        copied = []
+        engine = mocker.MagicMock()
+        cursor = engine.begin.return_value.__enter__.return_value.connection.cursor()
+        cursor.copy_expert.side_effect = lambda sql, file: copied.append(
+            (sql, file.read())
+        )
+        cursor.rowcount = 1
+
+        rows = copy_zip_to_postgres(engine, zip_path, "test_bdc_table")
+
+        assert rows == 1
+        assert copied == [
+            (
+                "COPY test_bdc_table FROM STDIN WITH CSV HEADER DELIMITER AS ','",
+                sample_csv_content.encode(),
+            )
+        ]
+        assert not (tmp_path / "test.csv").exists()
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from sqlalchemy import BigInteger, Integer, MetaData, SmallInteger
+
+from db.schema import create_typed_bdc_table
+from src.dtypes import (
+    BDC_DTYPES,
+    DtypeOverflowError,
+    arrow_schema,
+    cast_batch,
+    check_dtypes,
+    read_dtypes,
+)
+from src.parquet_export import BDC_PARQUET_SCHEMA
+
+HEADER = "frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id"
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "AL.csv"
+    path.write_text(
+        "\n".join(
+            [
+                HEADER,
+                "0001234567,130077,Brand,1912345678,50,1000,100,1,R,AL,010010201001000,8844c0a31dfffff",
+                "0001234567,130077,Brand,1012345679,50,,,0,B,AL,1.0010201001e+14,",
+            ]
+        )
+    )
+    return path
+
+
+class TestDtypes:
+    def test_read_dtypes_widens_integers(self):
+        dtypes = read_dtypes(["location_id", "brand_name"])
+
+        assert dtypes == {"brand_name": "category", "location_id": "Int64"}
+
+    def test_cast_batch(self, csv_path):
+        batch = pd.read_csv(csv_path, dtype=read_dtypes())
+
+        batch = cast_batch(batch)
+
+        assert batch.dtypes.astype(str).to_dict() == {
+            column: "string" if dtype == "string[pyarrow]" else dtype
+            for column, dtype in BDC_DTYPES.items()
+        }
+        assert batch["frn"].tolist() == ["0001234567", "0001234567"]
+        assert batch["location_id"].tolist() == [1912345678, 1012345679]
+        assert batch["block_geoid"].tolist() == [10010201001000, 100102010010000]
+        assert batch["max_advertised_download_speed"].isna().tolist() == [False, True]
+
+    def test_cast_batch_overflow(self):
+        batch = pd.DataFrame(
+            {"location_id": pd.array([1012345678, 5012345678], dtype="Int64")}
+        )
+
+        with pytest.raises(DtypeOverflowError, match="location_id"):
+            cast_batch(batch, "AL.csv")
+
+    def test_check_dtypes(self, csv_path):
+        check_dtypes([csv_path])
+
+    def test_check_dtypes_fails_fast(self, csv_path, tmp_path):
+        bad_path = tmp_path / "TX.csv"
+        bad_path.write_text(
+            "\n".join(
+                [
+                    HEADER,
+                    "0001234567,130077,Brand,1012345678,50,100000,100,1,R,TX,480010201001000,8844c0a31dfffff",
+                ]
+            )
+        )
+
+        with pytest.raises(DtypeOverflowError, match="max_advertised_download_speed"):
+            check_dtypes([csv_path, bad_path])
+
+    def test_check_dtypes_fractional_value(self, tmp_path):
+        bad_path = tmp_path / "TX.csv"
+        bad_path.write_text("location_id\n1012345678.5\n")
+
+        with pytest.raises(DtypeOverflowError, match="TX.csv"):
+            check_dtypes([bad_path])
+
+    def test_check_dtypes_speed_over_smallint(self, tmp_path):
+        bad_path = tmp_path / "TX.csv"
+        bad_path.write_text("max_advertised_download_speed\n40000\n")
+
+        with pytest.raises(DtypeOverflowError, match="Int16"):
+            check_dtypes([bad_path])
+
+    def test_dtypes_fit_typed_table(self):
+        maximums = {SmallInteger: 2**15 - 1, Integer: 2**31 - 1, BigInteger: 2**63 - 1}
+        table = create_typed_bdc_table("bdc_2024_06_30", MetaData())
+
+        for column in table.columns:
+            dtype = pd.api.types.pandas_dtype(BDC_DTYPES[column.name])
+            if pd.api.types.is_integer_dtype(dtype):
+                maximum = maximums[type(column.type)]
+                assert np.iinfo(dtype.numpy_dtype).max <= maximum, column.name
+
+    def test_parquet_schema_from_dtypes(self):
+        assert BDC_PARQUET_SCHEMA == arrow_schema(
+            [column for column in BDC_DTYPES if column != "state_usps"]
+        )
+        assert BDC_PARQUET_SCHEMA.field("max_advertised_download_speed").type == (
+            pa.int16()
+        )
+        assert BDC_PARQUET_SCHEMA.field("brand_name").type == pa.dictionary(
+            pa.int32(), pa.string()
+        )
@@ -0,0 +1,90 @@
+import pyarrow as pa
+import pytest
+
+from db.export import _copy_sql, _CopyReader, iter_query_batches
+from db.postgres_db import libpq_conninfo
+
+
+class MockCopy:
+    def __init__(self, data: bytes):
+        # One chunk per row, like COPY TO STDOUT
+        self.chunks = [memoryview(line) for line in data.splitlines(keepends=True)]
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class MockColumn:
+    def __init__(self, name, type_code):
+        self.name = name
+        self.type_code = type_code
+
+
+class MockCursor:
+    def __init__(self, data):
+        self.data = data
+        self.description = [
+            MockColumn("location_id", 23),
+            MockColumn("brand_name", 1043),
+            MockColumn("low_latency", 16),
+        ]
+        self.statements = []
+
+    def execute(self, query):
+        self.statements.append(query)
+
+    def copy(self, statement):
+        self.statements.append(statement)
+        return MockCopy(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class TestCopySQL:
+    def test_formats(self):
+        assert _copy_sql("SELECT * FROM bdc;", "csv") == (
+            "COPY (SELECT * FROM bdc) TO STDOUT WITH (FORMAT csv, HEADER true)"
+        )
+        assert _copy_sql("SELECT 1", "binary").endswith("(FORMAT binary)")
+        with pytest.raises(ValueError):
+            _copy_sql("SELECT 1", "parquet")
+
+    def testlibpq_conninfo(self):
+        assert (
+            libpq_conninfo("postgresql+psycopg2://user@host/db")
+            == "postgresql://user@host/db"
+        )
+
+
+class TestIterQueryBatches:
+    def test_copy_reader_fills_buffer(self):
+        reader = _CopyReader(MockCopy(b"a,b\n1,2\n3,4\n"))
+
+        assert reader.read(100) == b"a,b\n1,2\n3,4\n"
+        assert reader.read(100) == b""
+
+    def test_decodes_copy_csv(self, mocker):
+        data = b'location_id,brand_name,low_latency\n1,Brand,t\n2,"",f\n3,,\n'
+        cursor = MockCursor(data)
+        connection = mocker.MagicMock()
+        connection.__enter__.return_value = connection
+        connection.cursor.return_value = cursor
+        mocker.patch("db.export.psycopg.connect", return_value=connection)
+
+        batches = list(iter_query_batches("postgresql://localhost/test", "SELECT 1"))
+        table = pa.Table.from_batches(batches)
+
+        assert table.schema.field("location_id").type == pa.int32()
+        assert table.column("brand_name").to_pylist() == ["Brand", "", None]
+        assert table.column("low_latency").to_pylist() == [True, False, None]
+        assert cursor.statements[-1].startswith("COPY (SELECT 1) TO STDOUT")
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from db.loader import BulkLoader
+
+
+@pytest.fixture
+def csv_sources(tmp_path):
+    sources = []
+    for i in range(8):
+        csv_path = tmp_path / f"test_{i}.csv"
+        csv_path.write_text("frn,provider_id\n123,456\n")
+        sources.append((csv_path, "bdc_a" if i % 2 else "bdc_b"))
+    return sources
+
+
+@pytest.fixture
+def mock_copy(mocker):
+    active = {"all": 0, "bdc_a": 0, "bdc_b": 0}
+    peak = {"all": 0, "bdc_a": 0, "bdc_b": 0}
+    lock = threading.Lock()
+
+    def copy(engine, csv_path, table_name, **kwargs):
+        with lock:
+            for key in ("all", table_name):
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+        time.sleep(0.02)
+        with lock:
+            for key in ("all", table_name):
+                active[key] -= 1
+        return 10
+
+    mocker.patch("db.loader.copy_data_to_postgres", side_effect=copy)
+    return peak
+
+
+class TestBulkLoader:
+    def test_load_concurrent_streams(self, mocker, csv_sources, mock_copy):
+        loader = BulkLoader(mocker.Mock(), max_connections=3)
+
+        results = loader.load(csv_sources)
+
+        assert [stats.source for stats in results] == [
+            str(source) for source, _ in csv_sources
+        ]
+        assert all(stats.rows == 10 for stats in results)
+        assert all(stats.rows_per_sec > 0 for stats in results)
+        assert mock_copy["all"] == 3
+
+    def test_load_table_concurrency(self, mocker, csv_sources, mock_copy):
+        loader = BulkLoader(
+            mocker.Mock(), max_connections=4, table_concurrency={"bdc_a": 1}
+        )
+
+        loader.load(csv_sources)
+
+        assert mock_copy["bdc_a"] == 1
+        assert mock_copy["bdc_b"] > 1
+
+    def test_load_failed_source(self, mocker, csv_sources):
+        mocker.patch(
+            "db.loader.copy_data_to_postgres",
+            side_effect=[10, Exception("COPY failed")],
+        )
+        loader = BulkLoader(mocker.Mock(), max_connections=1)
+
+        results = loader.load(csv_sources[:2])
+
+        assert results[0].error is None
+        assert str(results[1].error) == "COPY failed"
+        assert results[1].rows == 0
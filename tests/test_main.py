@@ -0,0 +1,85 @@
+import pytest
+
+from src.main import parse_args, pipeline_config, select_dates, table_name_for
+
+AVAILABLE = ["2023-06-30", "2023-12-31", "2024-06-30", "2022-12-31"]
+
+
+class TestSelectDates:
+    def test_latest(self):
+        assert select_dates(AVAILABLE, ["latest"]) == ["2024-06-30"]
+
+    def test_all(self):
+        assert select_dates(AVAILABLE, ["all"]) == sorted(AVAILABLE)
+
+    def test_ranges(self):
+        assert select_dates(AVAILABLE, ["2023-01-01:2023-12-31"]) == [
+            "2023-06-30",
+            "2023-12-31",
+        ]
+        assert select_dates(AVAILABLE, ["2023-12-31:"]) == [
+            "2023-12-31",
+            "2024-06-30",
+        ]
+        assert select_dates(AVAILABLE, [":2022-12-31", "latest"]) == [
+            "2022-12-31",
+            "2024-06-30",
+        ]
+
+    def test_unavailable_date(self):
+        with pytest.raises(ValueError):
+            select_dates(AVAILABLE, ["2024-01-01"])
+        with pytest.raises(ValueError):
+            select_dates(AVAILABLE, ["2025-01-01:"])
+
+
+class TestParseArgs:
+    def test_defaults(self):
+        args = parse_args([])
+        config = pipeline_config(args)
+
+        assert args.dates == ["latest"]
+        assert args.sinks == ["postgres", "zapier"]
+        assert config.incremental
+        assert config.parquet_path is None
+        assert not config.rollups
+
+    def test_sinks_and_concurrency(self):
+        args = parse_args(
+            [
+                "--dates",
+                "all",
+                "--states",
+                "al",
+                "ga",
+                "--sinks",
+                "parquet",
+                "--parquet-path",
+                "./data",
+                "--download-concurrency",
+                "8",
+                "--parallel-dates",
+                "2",
+            ]
+        )
+        config = pipeline_config(args)
+
+        assert args.states == ["AL", "GA"]
+        assert args.parallel_dates == 2
+        assert config.download_concurrency == 8
+        assert config.parquet_path == "./data"
+
+    def test_invalid_arguments(self):
+        with pytest.raises(SystemExit):
+            parse_args(["--sinks", "box"])
+        with pytest.raises(SystemExit):
+            parse_args(["--copy-concurrency", "0"])
+        with pytest.raises(SystemExit):
+            parse_args(["--categories", "Provider", "--sinks", "postgres"])
+        with pytest.raises(SystemExit):
+            parse_args(["--fast-load", "--states", "AL"])
+        with pytest.raises(SystemExit):
+            parse_args(["--sinks", "parquet", "--stream-copy"])
+
+    def test_table_name(self):
+        assert table_name_for("2024-06-30") == "bdc_2024_06_30"
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from db.manifest import (
+    create_manifest_table,
+    files_to_load,
+    get_manifest,
+    record_loads,
+    unload_states,
+)
+
+
+@pytest.fixture
+def test_engine():
+    engine = create_engine("sqlite:///:memory:")
+    create_manifest_table(engine)
+    return engine
+
+
+@pytest.fixture
+def download_list():
+    return [
+        {"file_id": "1", "file_name": "bdc_01_Cable", "record_count": "100"},
+        {"file_id": "2", "file_name": "bdc_01_Fiber", "record_count": "200"},
+        {"file_id": "3", "file_name": "bdc_06_Cable", "record_count": "300"},
+    ]
+
+
+def entry(file, rows_loaded=None):
+    return {
+        "file_id": file["file_id"],
+        "as_of_date": "2024-06-30",
+        "file_name": file["file_name"],
+        "record_count": int(file["record_count"]),
+        "size_bytes": 1024,
+        "checksum": "abc123",
+        "rows_loaded": rows_loaded or int(file["record_count"]),
+    }
+
+
+class TestManifest:
+    def test_record_and_get_manifest(self, test_engine, download_list):
+        record_loads(test_engine, "bdc_2024_06_30", [entry(download_list[0])])
+
+        manifest = get_manifest(test_engine, "bdc_2024_06_30")
+
+        assert list(manifest) == ["1"]
+        assert manifest["1"]["rows_loaded"] == 100
+        assert manifest["1"]["loaded_at"] is not None
+        assert get_manifest(test_engine, "bdc_2024_12_31") == {}
+
+    def test_record_loads_replaces_entries(self, test_engine, download_list):
+        record_loads(test_engine, "bdc_2024_06_30", [entry(download_list[0])])
+        record_loads(test_engine, "bdc_2024_06_30", [entry(download_list[0], 99)])
+
+        manifest = get_manifest(test_engine, "bdc_2024_06_30")
+
+        assert len(manifest) == 1
+        assert manifest["1"]["rows_loaded"] == 99
+
+    def test_files_to_load(self, test_engine, download_list):
+        record_loads(
+            test_engine, "bdc_2024_06_30", [entry(file) for file in download_list[:2]]
+        )
+        manifest = get_manifest(test_engine, "bdc_2024_06_30")
+        download_list[1]["record_count"] = "250"
+
+        planned = files_to_load(download_list, manifest)
+
+        assert [file["file_id"] for file in planned] == ["2", "3"]
+
+    def test_unload_states(self, test_engine, download_list):
+        record_loads(
+            test_engine, "bdc_2024_06_30", [entry(file) for file in download_list]
+        )
+        with test_engine.begin() as connection:
+            connection.execute(text("CREATE TABLE bdc_2024_06_30 (state_usps TEXT)"))
+            connection.execute(
+                text("INSERT INTO bdc_2024_06_30 VALUES ('AL'), ('AL'), ('CA')")
+            )
+
+        unload_states(test_engine, "bdc_2024_06_30", ["AL"], ["1", "2"])
+
+        assert list(get_manifest(test_engine, "bdc_2024_06_30")) == ["3"]
+        with test_engine.connect() as connection:
+            states = connection.execute(
+                text("SELECT state_usps FROM bdc_2024_06_30")
+            ).scalars()
+            assert list(states) == ["CA"]
@@ -0,0 +1,89 @@
+import zipfile
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from src.parquet_export import write_csv_to_parquet
+
+
+@pytest.fixture
+def sample_csv_content():
+    rows = [
+        "frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id"
+    ]
+    for i in range(25):
+        rows.append(
+            f'0001234567,130077,"Brand, Inc",{1012345678 + i},50,1000.0,100,1,R,AL,010010201001000,8844c0a31dfffff'
+        )
+    rows.append("0001234567,130077,Brand,1012345703,50,,,0,B,AL,1.0010201001e+14,")
+    return "\n".join(rows) + "\n"
+
+
+class TestWriteCSVToParquet:
+    def test_write_partitioned_file(self, tmp_path, sample_csv_content):
+        csv_path = tmp_path / "test.csv"
+        csv_path.write_text(sample_csv_content)
+
+        stats = write_csv_to_parquet(
+            csv_path, tmp_path / "parquet", "2024-06-30", "AL", row_group_size=10
+        )
+
+        assert stats.path == str(
+            tmp_path
+            / "parquet"
+            / "as_of_date=2024-06-30"
+            / "state_usps=AL"
+            / "test.parquet"
+        )
+        assert stats.rows == 26
+        assert stats.row_groups == 3
+
+        metadata = pq.ParquetFile(stats.path).metadata
+        column = metadata.row_group(0).column(3)
+        assert column.path_in_schema == "location_id"
+        assert column.compression == "ZSTD"
+        assert column.statistics.min == 1012345678
+        assert column.statistics.max == 1012345687
+
+    def test_types_and_partitions(self, tmp_path, sample_csv_content):
+        csv_path = tmp_path / "test.csv"
+        csv_path.write_text(sample_csv_content)
+        write_csv_to_parquet(csv_path, tmp_path / "parquet", "2024-06-30", "AL")
+
+        table = ds.dataset(tmp_path / "parquet", partitioning="hive").to_table()
+        rows = table.to_pylist()
+
+        assert table.schema.field("brand_name").type.value_type == "string"
+        assert rows[0]["frn"] == "0001234567"
+        assert rows[0]["brand_name"] == "Brand, Inc"
+        assert rows[0]["block_geoid"] == 10010201001000
+        assert rows[0]["max_advertised_download_speed"] == 1000
+        assert rows[0]["state_usps"] == "AL"
+        assert rows[-1]["block_geoid"] == 100102010010000
+        assert rows[-1]["max_advertised_download_speed"] is None
+        assert rows[-1]["h3_res8_id"] is None
+
+    def test_write_from_zip(self, tmp_path, sample_csv_content):
+        zip_path = tmp_path / "1234.csv.zip"
+        with zipfile.ZipFile(zip_path, "w") as zipf:
+            zipf.writestr("test.csv", sample_csv_content)
+
+        stats = write_csv_to_parquet(
+            zip_path, tmp_path / "parquet", "2024-06-30", "AL", name="test"
+        )
+
+        assert stats.path.endswith("test.parquet")
+        assert pq.read_table(stats.path).num_rows == 26
+
+    def test_failed_write_leaves_no_file(self, tmp_path, sample_csv_content):
+        csv_path = tmp_path / "test.csv"
+        csv_path.write_text(sample_csv_content.replace("1000.0", "1000.5"))
+
+        with pytest.raises(Exception):
+            write_csv_to_parquet(csv_path, tmp_path / "parquet", "2024-06-30", "AL")
+
+        assert sorted((tmp_path / "parquet").rglob("*")) == [
+            tmp_path / "parquet" / "as_of_date=2024-06-30",
+            tmp_path / "parquet" / "as_of_date=2024-06-30" / "state_usps=AL",
+        ]
@@ -0,0 +1,42 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from db.partitions import (
+    bdc_columns,
+    create_partitioned_parent,
+    state_partition_name,
+    state_usps_for_file,
+)
+
+
+def test_state_partition_name():
+    assert state_partition_name("2024-06-30", "AL") == "bdc_availability_2024_06_30_al"
+
+
+def test_state_usps_for_file():
+    assert state_usps_for_file({"state_fips": "01"}) == "AL"
+    assert state_usps_for_file({"state_fips": 6}) == "CA"
+    assert state_usps_for_file({"state_fips": "72"}) == "PR"
+
+
+def test_bdc_columns():
+    assert bdc_columns()[0] == "frn"
+    assert bdc_columns()[-1] == "h3_res8_id"
+    assert len(bdc_columns(typed=True)) == 12
+
+
+def test_create_partitioned_parent(mocker):
+    mocker.patch("db.partitions.MetaData.create_all")
+
+    parent = create_partitioned_parent(mocker.Mock(), typed=True)
+    ddl = str(CreateTable(parent).compile(dialect=postgresql.dialect()))
+
+    assert parent.columns[0].name == "as_of_date"
+    assert not parent.columns[0].nullable
+    assert "PARTITION BY LIST (as_of_date)" in ddl
+    assert {index.name for index in parent.indexes} == {
+        "bdc_availability_location_id_idx",
+        "bdc_availability_provider_id_idx",
+        "bdc_availability_block_geoid_idx",
+        "bdc_availability_h3_res8_id_idx",
+    }
@@ -0,0 +1,768 @@
+import asyncio
+import io
+import time
+import zipfile
+
+import pytest
+
+from src.pipeline import IngestPipeline, PipelineConfig
+
+
+@pytest.fixture
+def sample_csv_content():
+    return """frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id
+123,456,Test Brand,789,Fiber,1000,100,Yes,1,CA,123456789,abc123"""
+
+
+@pytest.fixture
+def download_list():
+    return [{"file_id": i, "file_name": f"test_{i}"} for i in range(6)]
+
+
+class MockResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class MockBDC:
+    def __init__(self, csv_content, fail_ids=()):
+        self.csv_content = csv_content
+        self.fail_ids = fail_ids
+        self.active = 0
+        self.max_active = 0
+
+    async def getDownloadFile(self, file_id):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if file_id in self.fail_ids:
+            raise Exception("Network error")
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zipf:
+            zipf.writestr(f"test_{file_id}.csv", self.csv_content)
+        return MockResponse(buffer.getvalue())
+
+    async def streamDownloadFile(self, file_id, path):
+        response = await self.getDownloadFile(file_id)
+        with open(path, "wb") as f:
+            f.write(response.content)
+        return path
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "exports").mkdir()
+
+
+@pytest.fixture(autouse=True)
+def manifest(mocker):
+    mocker.patch("src.pipeline.create_manifest_table")
+    mocker.patch("src.pipeline.get_manifest", return_value={})
+    mocker.patch("src.pipeline.states_with_rows", return_value=set())
+    return mocker.patch("src.pipeline.record_loads")
+
+
+class TestIngestPipeline:
+    @pytest.mark.asyncio
+    async def test_run_all_stages(self, mocker, sample_csv_content, download_list):
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        async def mock_upload(*args, **kwargs):
+            return True
+
+        mocker.patch("src.pipeline.upload_file_to_zapier", side_effect=mock_upload)
+        bdc = MockBDC(sample_csv_content)
+        progress = []
+
+        pipeline = IngestPipeline(
+            bdc,
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(download_concurrency=2),
+            on_progress=lambda job, completed, total: progress.append(completed),
+        )
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 6
+        assert len(result.failed) == 0
+        assert copy.call_count == 6
+        assert sum(job.rows for job in result.succeeded) == 6
+        assert bdc.max_active == 2
+        assert progress == [1, 2, 3, 4, 5, 6]
+        assert all(
+            job.stages == ["download", "extract", "copy", "upload"]
+            for job in result.succeeded
+        )
+
+    @pytest.mark.asyncio
+    async def test_run_slow_stage_holds_back_downloads(
+        self, mocker, sample_csv_content
+    ):
+        bdc = MockBDC(sample_csv_content)
+        downloaded = []
+        ahead = []
+        download = bdc.getDownloadFile
+
+        async def counting_download(file_id):
+            response = await download(file_id)
+            downloaded.append(file_id)
+            return response
+
+        def slow_extract(zip_path, exports_path):
+            ahead.append(len(downloaded) - len(ahead))
+            time.sleep(0.02)
+
+        bdc.getDownloadFile = counting_download
+        mocker.patch("src.pipeline.extractZipFile", side_effect=slow_extract)
+        files = [{"file_id": i, "file_name": f"test_{i}"} for i in range(20)]
+
+        pipeline = IngestPipeline(
+            bdc,
+            "2024-06-30",
+            config=PipelineConfig(
+                download_concurrency=4, extract_concurrency=1, queue_size=2
+            ),
+        )
+        await pipeline.run(files)
+
+        # Downloads wait on the extract queue rather than finishing every file
+        assert len(downloaded) == 20
+        assert max(ahead) <= 4 + 2 + 1
+
+    @pytest.mark.asyncio
+    async def test_run_failed_download(self, sample_csv_content, download_list):
+        bdc = MockBDC(sample_csv_content, fail_ids=(2,))
+
+        pipeline = IngestPipeline(bdc, "2024-06-30")
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 5
+        assert [job.file_id for job in result.failed] == [2]
+
+    @pytest.mark.asyncio
+    async def test_run_buffered_downloads(
+        self, tmp_path, sample_csv_content, download_list
+    ):
+        bdc = MockBDC(sample_csv_content)
+
+        pipeline = IngestPipeline(
+            bdc, "2024-06-30", config=PipelineConfig(stream_downloads=False)
+        )
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 6
+        assert all(job.zip_path is None for job in result.succeeded)
+        assert (tmp_path / "exports" / "test_5.csv").exists()
+
+    @pytest.mark.asyncio
+    async def test_run_buffered_downloads_custom_paths(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        (tmp_path / "zips").mkdir()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(
+                stream_downloads=False, download_path="zips", exports_path="csvs"
+            ),
+        )
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 6
+        assert {call.args[1] for call in copy.call_args_list} == {
+            f"csvs/test_{i}.csv" for i in range(6)
+        }
+        assert list((tmp_path / "zips").iterdir()) == []
+        assert not list(tmp_path.glob("*.zip"))
+
+    @pytest.mark.asyncio
+    async def test_run_stream_copy(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        copy_zip = mocker.patch("db.loader.copy_zip_to_postgres", return_value=1)
+        copy_csv = mocker.patch("db.loader.copy_data_to_postgres")
+        bdc = MockBDC(sample_csv_content)
+
+        pipeline = IngestPipeline(
+            bdc,
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(stream_copy=True),
+        )
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 6
+        assert copy_zip.call_count == 6
+        copy_csv.assert_not_called()
+        assert list((tmp_path / "exports").iterdir()) == []
+        assert list(tmp_path.glob("*.zip")) == []
+
+    @pytest.mark.asyncio
+    async def test_run_fast_load(self, mocker, sample_csv_content, download_list):
+        create = mocker.patch(
+            "src.pipeline.create_staging_table", return_value="bdc_2024_06_30_staging"
+        )
+        swap = mocker.patch("src.pipeline.swap_staging_table")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=engine,
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(fast_load=True),
+        )
+        await pipeline.run(download_list)
+
+        create.assert_called_once_with(engine, "bdc_2024_06_30", False)
+        assert {call.args[2] for call in copy.call_args_list} == {
+            "bdc_2024_06_30_staging"
+        }
+        swap.assert_called_once_with(engine, "bdc_2024_06_30_staging", "bdc_2024_06_30")
+
+    @pytest.mark.asyncio
+    async def test_run_fast_load_keeps_staging_on_failure(
+        self, mocker, sample_csv_content, download_list
+    ):
+        mocker.patch(
+            "src.pipeline.create_staging_table", return_value="bdc_2024_06_30_staging"
+        )
+        swap = mocker.patch("src.pipeline.swap_staging_table")
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content, fail_ids=(3,)),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(fast_load=True),
+        )
+        await pipeline.run(download_list)
+
+        swap.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_run_fast_load_swap_failure(
+        self, mocker, sample_csv_content, download_list
+    ):
+        mocker.patch(
+            "src.pipeline.create_staging_table", return_value="bdc_2024_06_30_staging"
+        )
+        mocker.patch(
+            "src.pipeline.swap_staging_table",
+            side_effect=RuntimeError("index build failed"),
+        )
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        upload = mocker.patch("src.pipeline.upload_file_to_zapier", return_value=True)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(fast_load=True),
+        )
+        result = await pipeline.run(download_list)
+
+        # The other stages still finish, the loaded files are failed
+        assert upload.call_count == 6
+        assert result.succeeded == []
+        assert len(result.failed) == 6
+        assert all(str(job.error) == "index build failed" for job in result.failed)
+
+    @pytest.mark.asyncio
+    async def test_run_fast_load_nothing_changed(
+        self, mocker, sample_csv_content, download_list
+    ):
+        loaded = {
+            str(file["file_id"]): {"file_name": file["file_name"], "record_count": None}
+            for file in download_list
+        }
+        mocker.patch("src.pipeline.get_manifest", return_value=loaded)
+        create = mocker.patch("src.pipeline.create_staging_table")
+        swap = mocker.patch("src.pipeline.swap_staging_table")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(fast_load=True, incremental=True),
+        )
+        result = await pipeline.run(download_list)
+
+        # The loaded table must not be replaced by an empty staging table
+        assert result.succeeded == []
+        create.assert_not_called()
+        swap.assert_not_called()
+        copy.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_run_partitioned(self, mocker, sample_csv_content):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "01", "06", "48", "48"])
+        ]
+        mocker.patch("src.pipeline.create_partitioned_parent")
+        mocker.patch("src.pipeline.create_date_partition")
+        create_load = mocker.patch("src.pipeline.create_state_load_table")
+        attach = mocker.patch("src.pipeline.attach_state_partition")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content, fail_ids=(4,)),
+            "2024-06-30",
+            engine=engine,
+            config=PipelineConfig(partitioned=True),
+        )
+        result = await pipeline.run(files)
+
+        assert len(result.succeeded) == 4
+        assert {call.args[2] for call in create_load.call_args_list} == {
+            "AL",
+            "CA",
+            "TX",
+        }
+        assert {call.args[2] for call in copy.call_args_list} == {
+            "bdc_availability_2024_06_30_al_load",
+            "bdc_availability_2024_06_30_ca_load",
+            "bdc_availability_2024_06_30_tx_load",
+        }
+        # TX is missing a file, so its partition is not swapped in
+        assert sorted(call.args[2] for call in attach.call_args_list) == ["AL", "CA"]
+
+    @pytest.mark.asyncio
+    async def test_run_refreshes_rollups_for_attached_states(
+        self, mocker, sample_csv_content
+    ):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "06", "48"])
+        ]
+        mocker.patch("src.pipeline.create_partitioned_parent")
+        mocker.patch("src.pipeline.create_date_partition")
+        mocker.patch("src.pipeline.create_state_load_table")
+        mocker.patch("src.pipeline.attach_state_partition")
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        refresh = mocker.patch("src.pipeline.refresh_rollups")
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content, fail_ids=(2,)),
+            "2024-06-30",
+            engine=engine,
+            config=PipelineConfig(partitioned=True, rollups=True),
+        )
+        await pipeline.run(files)
+
+        refresh.assert_called_once_with(
+            engine, "bdc_availability", "2024-06-30", ["AL", "CA"], True
+        )
+
+    @pytest.mark.asyncio
+    async def test_run_refreshes_rollups_after_swap(
+        self, mocker, sample_csv_content, download_list
+    ):
+        mocker.patch(
+            "src.pipeline.create_staging_table", return_value="bdc_2024_06_30_staging"
+        )
+        mocker.patch("src.pipeline.swap_staging_table")
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        refresh = mocker.patch("src.pipeline.refresh_rollups")
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=engine,
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(fast_load=True, rollups=True),
+        )
+        await pipeline.run(download_list)
+
+        # The whole table was replaced, so every state is refreshed
+        refresh.assert_called_once_with(
+            engine, "bdc_2024_06_30", "2024-06-30", None, False
+        )
+
+    @pytest.mark.asyncio
+    async def test_run_without_upload_removes_csvs(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+        )
+        result = await pipeline.run(download_list)
+
+        assert len(result.succeeded) == 6
+        assert list((tmp_path / "exports").iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_run_partitioned_uploads_other_files(
+        self, mocker, sample_csv_content
+    ):
+        files = [
+            {"file_id": 0, "file_name": "test_0", "state_fips": "01"},
+            {"file_id": 1, "file_name": "test_1", "category": "Provider"},
+            {
+                "file_id": 2,
+                "file_name": "test_2",
+                "state_fips": "01",
+                "technology_type": "Mobile Broadband",
+            },
+            {"file_id": 3, "file_name": "test_3", "state_fips": None},
+        ]
+        mocker.patch("src.pipeline.create_partitioned_parent")
+        mocker.patch("src.pipeline.create_date_partition")
+        create_load = mocker.patch("src.pipeline.create_state_load_table")
+        attach = mocker.patch("src.pipeline.attach_state_partition")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        upload = mocker.patch("src.pipeline.upload_file_to_zapier", return_value=True)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(partitioned=True, stream_downloads=False),
+        )
+        result = await pipeline.run(files)
+
+        assert len(result.succeeded) == 4
+        assert [call.args[2] for call in create_load.call_args_list] == ["AL"]
+        assert copy.call_count == 1
+        assert [call.args[2] for call in attach.call_args_list] == ["AL"]
+        # Files that are not loaded are uploaded as downloaded
+        assert sorted(call.args[2] for call in upload.call_args_list) == [
+            "test_0",
+            "test_1.zip",
+            "test_2.zip",
+            "test_3",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_run_partitioned_limits_attachments(self, mocker, sample_csv_content):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "06", "13", "48"])
+        ]
+        mocker.patch("src.pipeline.create_partitioned_parent")
+        mocker.patch("src.pipeline.create_date_partition")
+        mocker.patch("src.pipeline.create_state_load_table")
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        active = []
+        attached = []
+
+        def slow_attach(engine, date, state_usps):
+            active.append(state_usps)
+            attached.append(len(active))
+            time.sleep(0.02)
+            active.remove(state_usps)
+
+        mocker.patch("src.pipeline.attach_state_partition", side_effect=slow_attach)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            config=PipelineConfig(
+                partitioned=True, copy_concurrency=4, attach_concurrency=1
+            ),
+        )
+        await pipeline.run(files)
+
+        # Attachments hold a pooled connection each, one at a time
+        assert len(attached) == 4
+        assert max(attached) == 1
+
+    @pytest.mark.asyncio
+    async def test_run_records_manifest(
+        self, mocker, manifest, sample_csv_content, download_list
+    ):
+        connection = mocker.Mock()
+
+        def copy(engine, csv_path, table_name, after_copy=None, **kwargs):
+            after_copy(connection, 1)
+            return 1
+
+        mocker.patch("db.loader.copy_data_to_postgres", side_effect=copy)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content, fail_ids=(1,)),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+        )
+        await pipeline.run(download_list)
+
+        # Each file is recorded in its COPY's transaction
+        assert all(call.args[0] is connection for call in manifest.call_args_list)
+        entries = [entry for call in manifest.call_args_list for entry in call.args[2]]
+        assert sorted(entry["file_id"] for entry in entries) == [0, 2, 3, 4, 5]
+        assert all(call.args[1] == "bdc_2024_06_30" for call in manifest.call_args_list)
+        assert all(entry["rows_loaded"] == 1 for entry in entries)
+        assert all(len(entry["checksum"]) == 64 for entry in entries)
+
+    @pytest.mark.asyncio
+    async def test_run_incremental_skips_loaded_files(
+        self, mocker, sample_csv_content, download_list
+    ):
+        loaded = {
+            str(file["file_id"]): {
+                "file_name": file["file_name"],
+                "record_count": None,
+            }
+            for file in download_list[:4]
+        }
+        mocker.patch("src.pipeline.get_manifest", return_value=loaded)
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(incremental=True),
+        )
+        result = await pipeline.run(download_list)
+
+        assert sorted(job.file_id for job in result.succeeded) == [4, 5]
+        assert copy.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_run_incremental_reloads_changed_state_rows(
+        self, mocker, sample_csv_content
+    ):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "01", "06", "13"])
+        ]
+        loaded = {
+            str(file["file_id"]): {"file_name": file["file_name"], "record_count": 10}
+            for file in files[:3]
+        }
+        files[1]["record_count"] = 20
+        mocker.patch("src.pipeline.get_manifest", return_value=loaded)
+        rows = mocker.patch("src.pipeline.states_with_rows", return_value={"AL"})
+        unload = mocker.patch("src.pipeline.unload_states")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=engine,
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(incremental=True),
+        )
+        result = await pipeline.run(files)
+
+        # AL is deleted and reloaded from both of its files, GA is new
+        rows.assert_called_once_with(engine, "bdc_2024_06_30", ["AL", "GA"])
+        unload.assert_called_once_with(engine, "bdc_2024_06_30", ["AL"], [0, 1, 3])
+        assert sorted(job.file_id for job in result.succeeded) == [0, 1, 3]
+        assert copy.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_run_reloads_states_loaded_before_the_manifest(
+        self, mocker, sample_csv_content
+    ):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "06", "13"])
+        ]
+        mocker.patch("src.pipeline.states_with_rows", return_value={"AL", "CA"})
+        unload = mocker.patch("src.pipeline.unload_states")
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        engine = mocker.Mock()
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=engine,
+            table_name="bdc_2024_06_30",
+            config=PipelineConfig(incremental=True),
+        )
+        await pipeline.run(files)
+
+        # No manifest entries, but AL and CA already have rows
+        unload.assert_called_once_with(
+            engine, "bdc_2024_06_30", ["AL", "CA"], [0, 1, 2]
+        )
+        assert copy.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_run_incremental_reloads_changed_states(
+        self, mocker, sample_csv_content
+    ):
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "01", "06"])
+        ]
+        loaded = {
+            str(file["file_id"]): {"file_name": file["file_name"], "record_count": 10}
+            for file in files
+        }
+        files[1]["record_count"] = 20
+        mocker.patch("src.pipeline.get_manifest", return_value=loaded)
+        mocker.patch("src.pipeline.create_partitioned_parent")
+        mocker.patch("src.pipeline.create_date_partition")
+        mocker.patch("src.pipeline.create_state_load_table")
+        attach = mocker.patch("src.pipeline.attach_state_partition")
+        mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+
+        pipeline = IngestPipeline(
+            MockBDC(sample_csv_content),
+            "2024-06-30",
+            engine=mocker.Mock(),
+            config=PipelineConfig(partitioned=True, incremental=True),
+        )
+        result = await pipeline.run(files)
+
+        # Only one AL file changed, but the AL partition needs both of them
+        assert sorted(job.file_id for job in result.succeeded) == [0, 1]
+        assert [call.args[2] for call in attach.call_args_list] == ["AL"]
+
+    @pytest.mark.asyncio
+    async def test_run_failed_upload_keeps_file(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        async def mock_upload(*args, **kwargs):
+            return False
+
+        mocker.patch("src.pipeline.upload_file_to_zapier", side_effect=mock_upload)
+        bdc = MockBDC(sample_csv_content)
+
+        pipeline = IngestPipeline(
+            bdc, "2024-06-30", zapier_webhook="http://test-webhook.com"
+        )
+        result = await pipeline.run(download_list[:1])
+
+        assert len(result.failed) == 1
+        assert (tmp_path / "exports" / "test_0.csv").exists()
+
+    @pytest.mark.asyncio
+    async def test_run_streams_compressed_upload(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        upload = mocker.patch(
+            "src.pipeline.upload_compressed_to_zapier", return_value=True
+        )
+        bdc = MockBDC(sample_csv_content)
+
+        pipeline = IngestPipeline(
+            bdc,
+            "2024-06-30",
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(max_upload_size_mb=0, upload_compression="zstd"),
+        )
+        result = await pipeline.run(download_list[:1])
+
+        assert result.succeeded[0].stages[-1] == "upload"
+        assert upload.call_args.kwargs["codec"] == "zstd"
+        assert not (tmp_path / "exports" / "test_0.csv").exists()
+        assert not (tmp_path / "exports" / "test_0.csv.zip").exists()
+
+    @pytest.mark.asyncio
+    async def test_run_failed_upload_queued(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        uploads = []
+
+        async def mock_upload(path, webhook, filename, table_name, client=None):
+            uploads.append(filename)
+            # Only the retry after the other stages finish succeeds
+            return uploads.count(filename) > 1
+
+        mocker.patch("src.pipeline.upload_file_to_zapier", side_effect=mock_upload)
+        mocker.patch("src.uploads.upload_file_to_zapier", side_effect=mock_upload)
+        bdc = MockBDC(sample_csv_content)
+
+        pipeline = IngestPipeline(
+            bdc,
+            "2024-06-30",
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(upload_queue_path="upload_queue.json"),
+        )
+        result = await pipeline.run(download_list[:2])
+
+        assert len(result.succeeded) == 2
+        assert all(job.stages[-1] == "upload_queued" for job in result.succeeded)
+        assert sorted(uploads) == ["test_0", "test_0", "test_1", "test_1"]
+        assert len(pipeline.upload_queue) == 0
+        assert not (tmp_path / "exports" / "test_0.csv").exists()
+
+    @pytest.mark.asyncio
+    async def test_run_parquet_export(self, tmp_path, mocker):
+        csv_content = """frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id
+0001234567,130077,Brand,1012345678,50,1000,100,1,R,AL,010010201001000,8844c0a31dfffff"""
+        files = [
+            {"file_id": i, "file_name": f"test_{i}", "state_fips": fips}
+            for i, fips in enumerate(["01", "01", "06"])
+        ]
+        upload = mocker.patch("src.pipeline.upload_file_to_zapier", return_value=True)
+
+        pipeline = IngestPipeline(
+            MockBDC(csv_content),
+            "2024-06-30",
+            zapier_webhook="http://test-webhook.com",
+            config=PipelineConfig(parquet_path="parquet", upload_parquet=True),
+        )
+        result = await pipeline.run(files)
+
+        assert len(result.succeeded) == 3
+        assert all(
+            job.stages == ["download", "extract", "export", "upload"]
+            for job in result.succeeded
+        )
+        partition = tmp_path / "parquet" / "as_of_date=2024-06-30"
+        assert (partition / "state_usps=AL" / "test_1.parquet").exists()
+        assert (partition / "state_usps=CA" / "test_2.parquet").exists()
+        assert sorted(call.args[2] for call in upload.call_args_list) == [
+            "test_0.parquet",
+            "test_1.parquet",
+            "test_2.parquet",
+        ]
+        # The CSVs are removed once uploaded, the dataset is kept
+        assert not (tmp_path / "exports" / "test_0.csv").exists()
+
+    @pytest.mark.asyncio
+    async def test_run_uses_download_cache(
+        self, tmp_path, mocker, sample_csv_content, download_list
+    ):
+        copy = mocker.patch("db.loader.copy_data_to_postgres", return_value=1)
+        config = PipelineConfig(cache_path=str(tmp_path / "cache"))
+
+        first = MockBDC(sample_csv_content)
+        await IngestPipeline(
+            first, "2024-06-30", mocker.Mock(), "bdc_2024_06_30", config=config
+        ).run(download_list)
+        second = MockBDC(sample_csv_content, fail_ids=range(6))
+        result = await IngestPipeline(
+            second, "2024-06-30", mocker.Mock(), "bdc_2024_06_30", config=config
+        ).run(download_list)
+
+        assert first.max_active > 0
+        assert second.max_active == 0
+        assert len(result.succeeded) == 6
+        assert all(job.cached for job in result.succeeded)
+        assert copy.call_count == 12
+        assert len(list((tmp_path / "cache" / "objects").iterdir())) == 6
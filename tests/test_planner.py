@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from src.pipeline import PipelineResult
+from src.planner import DownloadPlan, DownloadSelection, plan_downloads, run_plan
+
+
+def listing_file(file_id, state_fips="01", record_count=10, **fields):
+    return {
+        "file_id": file_id,
+        "file_name": f"bdc_{state_fips}_{file_id}",
+        "state_fips": state_fips,
+        "technology_type": "Fixed Broadband",
+        "file_type": "csv",
+        "record_count": str(record_count),
+        **fields,
+    }
+
+
+class MockBDC:
+    def __init__(self, listings):
+        self.listings = listings
+        self.calls = []
+
+    async def getDownloadList(self, date, category, subcategory="", **filters):
+        self.calls.append((date, category, subcategory, filters))
+        return self.listings.get((date, category, subcategory), [])
+
+
+class TestPlanDownloads:
+    @pytest.mark.asyncio
+    async def test_plan_defaults(self):
+        bdc = MockBDC(
+            {
+                ("2024-06-30", "State", ""): [
+                    listing_file(1, record_count=5),
+                    listing_file(2, record_count=50),
+                    listing_file(3, technology_type="Mobile Broadband"),
+                    listing_file(4, file_name="bdc_01_Satellite_fixed_broadband"),
+                    listing_file(5, file_type="gis"),
+                ]
+            }
+        )
+
+        plan = await plan_downloads(bdc, ["2024-06-30"])
+
+        assert [file["file_id"] for file in plan.files["2024-06-30"]] == [2, 1]
+        assert plan.total == 2
+        assert plan.total_records == 55
+
+    @pytest.mark.asyncio
+    async def test_plan_across_dates_and_categories(self):
+        bdc = MockBDC(
+            {
+                ("2024-06-30", "State", "Fixed Broadband"): [
+                    listing_file(1, record_count=5),
+                    listing_file(2, "06", record_count=50),
+                ],
+                ("2024-06-30", "State", "Mobile Broadband"): [
+                    listing_file(
+                        3, record_count=500, technology_type="Mobile Broadband"
+                    ),
+                    listing_file(1, record_count=5),
+                ],
+                ("2023-12-31", "State", "Fixed Broadband"): [
+                    listing_file(1, record_count=5),
+                ],
+            }
+        )
+        selection = DownloadSelection(
+            subcategories=["Fixed Broadband", "Mobile Broadband"],
+            technology_types=None,
+            states=["al"],
+        )
+
+        plan = await plan_downloads(bdc, ["2024-06-30", "2023-12-31"], selection)
+
+        assert len(bdc.calls) == 4
+        assert [file["file_id"] for file in plan.files["2024-06-30"]] == [3, 1]
+        assert [file["file_id"] for file in plan.files["2023-12-31"]] == [1]
+
+    def test_selection_without_state(self):
+        selection = DownloadSelection(states=["AL"], file_types=None)
+
+        assert not selection.matches(listing_file(1, state_fips=None))
+        assert selection.matches(listing_file(1, state_fips="1", file_type="gis"))
+
+
+class TestRunPlan:
+    @pytest.mark.asyncio
+    async def test_run_plan(self):
+        runs = []
+
+        class MockPipeline:
+            def __init__(self, date):
+                self.date = date
+
+            async def run(self, files):
+                runs.append((self.date, [file["file_id"] for file in files]))
+                return PipelineResult()
+
+        plan = DownloadPlan(
+            files={
+                "2024-06-30": [listing_file(1), listing_file(2)],
+                "2023-12-31": [],
+            }
+        )
+
+        results = await run_plan(plan, lambda date, files: MockPipeline(date))
+
+        assert runs == [("2024-06-30", [1, 2])]
+        assert list(results) == ["2024-06-30"]
+
+    @pytest.mark.asyncio
+    async def test_run_plan_limits_concurrent_dates(self):
+        running = 0
+        peak = 0
+
+        class MockPipeline:
+            async def run(self, files):
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                return PipelineResult()
+
+        plan = DownloadPlan(
+            files={
+                date: [listing_file(1)]
+                for date in ["2023-06-30", "2023-12-31", "2024-06-30"]
+            }
+        )
+
+        results = await run_plan(
+            plan, lambda date, files: MockPipeline(), max_concurrent_dates=2
+        )
+
+        assert peak == 2
+        assert len(results) == 3
@@ -0,0 +1,73 @@
+import pyarrow as pa
+import pytest
+
+from db.postgres_db import DBConnection
+
+
+class MockNamedCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = [("location_id", 23), ("state_usps", 1043)]
+        self.fetches = []
+        self.closed = False
+
+    def execute(self, query):
+        self.query = query
+
+    def fetchmany(self, size):
+        self.fetches.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@pytest.fixture
+def db(mocker):
+    rows = [(i, "AL" if i % 2 else None) for i in range(25)]
+    cursor = MockNamedCursor(rows)
+    stream_connection = mocker.Mock()
+    stream_connection.cursor.return_value = cursor
+    mocker.patch(
+        "db.postgres_db.psycopg2.connect",
+        side_effect=[mocker.Mock(), stream_connection],
+    )
+    db = DBConnection("postgresql://localhost/test")
+    db.named_cursor = cursor
+    db.stream_connection = stream_connection
+    return db
+
+
+class TestStreamQuery:
+    def test_stream_arrow_batches(self, db):
+        batches = list(db.stream_query_arrow("SELECT * FROM bdc", itersize=10))
+
+        assert [batch.num_rows for batch in batches] == [10, 10, 5]
+        assert batches[0].schema.field("location_id").type == pa.int32()
+        assert batches[0].schema.field("state_usps").type == pa.string()
+        assert db.named_cursor.closed
+        db.stream_connection.close.assert_called_once()
+        # Uncommitted work on the object's own connection is left alone
+        db.conn.rollback.assert_not_called()
+
+    def test_stream_dataframes_with_row_cap(self, db):
+        frames = list(db.stream_query("SELECT * FROM bdc", itersize=10, max_rows=15))
+
+        assert [len(frame) for frame in frames] == [10, 5]
+        assert db.named_cursor.fetches == [10, 5]
+        assert frames[1]["state_usps"].isna().sum() == 3
+        assert str(frames[0]["location_id"].dtype) == "int32[pyarrow]"
+
+    def test_stopping_early_closes_cursor(self, db):
+        for _ in db.stream_query("SELECT * FROM bdc", itersize=10):
+            break
+
+        assert db.named_cursor.closed
+        db.stream_connection.close.assert_called_once()
@@ -0,0 +1,102 @@
+from sqlalchemy import BigInteger, Float, Integer, SmallInteger, Text
+
+from db.rollups import (
+    BLOCK_PROVIDERS_TABLE,
+    COVERAGE_TABLE,
+    H3_SERVICE_TABLE,
+    refresh_rollups,
+    rollup_queries,
+)
+
+
+def columns(**types):
+    return [{"name": name, "type": column_type} for name, column_type in types.items()]
+
+
+UNTYPED_COLUMNS = columns(
+    provider_id=Integer(),
+    location_id=Integer(),
+    technology=Integer(),
+    max_advertised_download_speed=Integer(),
+    max_advertised_upload_speed=Integer(),
+    low_latency=Integer(),
+    state_usps=Text(),
+    block_geoid=Float(),
+    h3_res8_id=Text(),
+)
+
+
+class TestRollupQueries:
+    def test_untyped_table(self, mocker):
+        mocker.patch(
+            "db.rollups.inspect"
+        ).return_value.get_columns.return_value = UNTYPED_COLUMNS
+
+        queries = rollup_queries(mocker.Mock(), "bdc_2024_06_30", partitioned=False)
+
+        assert set(queries) == {COVERAGE_TABLE, BLOCK_PROVIDERS_TABLE, H3_SERVICE_TABLE}
+        assert all("FROM bdc_2024_06_30" in query for query in queries.values())
+        assert all(":states" not in query for query in queries.values())
+        assert "block_geoid::bigint" in queries[BLOCK_PROVIDERS_TABLE]
+        assert "WHEN (max_advertised_download_speed >= 1000" in queries[COVERAGE_TABLE]
+        assert "to_hex" not in queries[H3_SERVICE_TABLE]
+
+    def test_typed_partitioned_states(self, mocker):
+        mocker.patch(
+            "db.rollups.inspect"
+        ).return_value.get_columns.return_value = columns(
+            technology=SmallInteger(),
+            block_geoid=BigInteger(),
+            h3_res8_id=BigInteger(),
+        )
+
+        queries = rollup_queries(
+            mocker.Mock(), "bdc_availability", partitioned=True, states=["AL"]
+        )
+
+        for query in queries.values():
+            assert "WHERE as_of_date = :as_of_date AND state_usps IN :states" in query
+        assert "to_hex(h3_res8_id)" in queries[H3_SERVICE_TABLE]
+        assert "block_geoid::bigint" not in queries[BLOCK_PROVIDERS_TABLE]
+
+    def test_text_columns_are_cast(self, mocker):
+        mocker.patch(
+            "db.rollups.inspect"
+        ).return_value.get_columns.return_value = columns(
+            max_advertised_download_speed=Text(), location_id=Text()
+        )
+
+        queries = rollup_queries(mocker.Mock(), "bdc_2024_06_30", partitioned=False)
+
+        assert (
+            "NULLIF(max_advertised_download_speed, '')::numeric::bigint >= 100"
+            in queries[COVERAGE_TABLE]
+        )
+        assert "NULLIF(location_id, '')::numeric::bigint" in queries[H3_SERVICE_TABLE]
+
+
+class TestRefreshRollups:
+    def test_refreshes_each_rollup(self, mocker):
+        mocker.patch("db.rollups.create_rollup_tables")
+        mocker.patch(
+            "db.rollups.inspect"
+        ).return_value.get_columns.return_value = UNTYPED_COLUMNS
+        engine = mocker.MagicMock()
+        connection = engine.begin.return_value.__enter__.return_value
+
+        refresh_rollups(engine, "bdc_2024_06_30", "2024-06-30", states=["GA", "AL"])
+
+        # A delete and an insert for each rollup, in one transaction
+        assert engine.begin.call_count == 1
+        assert connection.execute.call_count == 6
+        insert = connection.execute.call_args_list[1]
+        assert insert.args[1] == {"as_of_date": "2024-06-30", "states": ["AL", "GA"]}
+
+    def test_no_states_loaded(self, mocker):
+        create = mocker.patch("db.rollups.create_rollup_tables")
+        engine = mocker.MagicMock()
+
+        refresh_rollups(engine, "bdc_2024_06_30", "2024-06-30", states=[])
+
+        create.assert_not_called()
+        engine.begin.assert_not_called()
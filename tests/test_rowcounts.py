@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import create_engine
+
+from db.manifest import create_manifest_table, get_loaded_rows, record_loads
+from db.rowcounts import RowCount, RowCounter
+
+
+def entry(file_id, rows_loaded, as_of_date="2024-06-30"):
+    return {
+        "file_id": file_id,
+        "as_of_date": as_of_date,
+        "file_name": f"bdc_{file_id}",
+        "record_count": rows_loaded,
+        "size_bytes": 1024,
+        "checksum": "abc123",
+        "rows_loaded": rows_loaded,
+    }
+
+
+@pytest.fixture
+def test_engine():
+    engine = create_engine("sqlite:///:memory:")
+    create_manifest_table(engine)
+    record_loads(engine, "bdc_2024_06_30", [entry(1, 100), entry(2, 250)])
+    record_loads(
+        engine,
+        "bdc_availability",
+        [entry(1, 100), entry(2, 50, as_of_date="2023-12-31")],
+    )
+    return engine
+
+
+class TestLoadedRows:
+    def test_loaded_rows(self, test_engine):
+        assert get_loaded_rows(test_engine, "bdc_2024_06_30") == 350
+        assert get_loaded_rows(test_engine, "bdc_availability", "2023-12-31") == 50
+        assert get_loaded_rows(test_engine, "bdc_2023_12_31") is None
+
+    def test_incomplete_manifest(self, test_engine):
+        record_loads(test_engine, "bdc_2024_06_30", [entry(3, None)])
+
+        assert get_loaded_rows(test_engine, "bdc_2024_06_30") is None
+
+
+class TestRowCounter:
+    def test_count_from_manifest(self, test_engine, mocker):
+        mocker.patch.object(
+            RowCounter,
+            "estimate",
+            side_effect=lambda table_name: RowCount(table_name, 340, "estimate"),
+        )
+        counter = RowCounter(test_engine)
+
+        count = counter.count("bdc_2024_06_30")
+
+        assert count == RowCount("bdc_2024_06_30", 350, "manifest")
+        assert str(count) == "bdc_2024_06_30: 350 rows"
+
+    def test_manifest_disagrees_with_estimate(self, test_engine, mocker):
+        # eg. rows loaded before the manifest existed
+        mocker.patch.object(
+            RowCounter,
+            "estimate",
+            side_effect=lambda table_name: RowCount(table_name, 1000, "estimate"),
+        )
+        counter = RowCounter(test_engine)
+
+        count = counter.count("bdc_2024_06_30")
+
+        assert count == RowCount("bdc_2024_06_30", 1000, "estimate")
+        assert not count.exact
+
+    def test_missing_table(self, test_engine, mocker):
+        mocker.patch.object(RowCounter, "estimate", return_value=None)
+
+        assert RowCounter(test_engine).count("bdc_2024_06_30") is None
+
+    def test_falls_back_to_estimate(self, test_engine, mocker):
+        estimate = mocker.patch.object(
+            RowCounter,
+            "estimate",
+            side_effect=lambda table_name: RowCount(table_name, 1000, "estimate"),
+        )
+        counter = RowCounter(test_engine)
+
+        count = counter.count("bdc_2023_12_31")
+        partition = counter.count("bdc_availability", as_of_date="2022-06-30")
+
+        assert str(count) == "bdc_2023_12_31: about 1,000 rows"
+        assert not count.exact
+        assert partition.table_name == "bdc_availability_2022_06_30"
+        assert estimate.call_count == 2
+
+    def test_cache(self, test_engine, mocker):
+        mocker.patch.object(
+            RowCounter,
+            "estimate",
+            side_effect=lambda table_name: RowCount(table_name, 375, "estimate"),
+        )
+        counter = RowCounter(test_engine, ttl=60)
+        assert counter.count("bdc_2024_06_30").rows == 350
+
+        record_loads(test_engine, "bdc_2024_06_30", [entry(3, 50)])
+        assert counter.count("bdc_2024_06_30").rows == 350
+
+        counter.invalidate("bdc_2024_06_30")
+        assert counter.count("bdc_2024_06_30").rows == 400
@@ -3,6 +3,8 @@ import sys
 
 import pytest
 from sqlalchemy import MetaData, create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
 
 sys.path.append("./")
 from db.schema import create_bdc_table
@@ -30,6 +32,30 @@ def test_create_table():
     assert table.columns[11].name == "h3_res8_id"
 
 
+def test_create_unlogged_table():
+    metadata = MetaData()
+    table = create_bdc_table("bdc_info_staging", metadata, unlogged=True)
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert ddl.strip().startswith("CREATE UNLOGGED TABLE bdc_info_staging")
+
+
+def test_create_typed_table():
+    metadata = MetaData()
+    table = create_bdc_table("bdc_info", metadata, typed=True)
+    column_types = {
+        column.name: str(column.type.compile(dialect=postgresql.dialect()))
+        for column in table.columns
+    }
+    assert len(table.columns) == 12
+    assert column_types["location_id"] == "BIGINT"
+    assert column_types["technology"] == "SMALLINT"
+    assert column_types["max_advertised_download_speed"] == "SMALLINT"
+    assert column_types["business_residential_code"] == "CHAR(1)"
+    assert column_types["state_usps"] == "CHAR(2)"
+    assert column_types["block_geoid"] == "BIGINT"
+    assert column_types["h3_res8_id"] == "BIGINT"
+
+
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
     os.remove("test.db")
@@ -0,0 +1,56 @@
+import io
+import zipfile
+
+import pytest
+
+from db.transform import BDC_TYPED_CONVERTERS, TransformedCSV, h3_to_integer, to_integer
+
+
+@pytest.fixture
+def sample_csv_content():
+    return """frn,provider_id,brand_name,location_id,technology,max_advertised_download_speed,max_advertised_upload_speed,low_latency,business_residential_code,state_usps,block_geoid,h3_res8_id
+0001234567,130077,"Brand, Inc",1012345678,50,1000,100,1,R,AL,010010201001000,8844c0a31dfffff
+0001234567,130077,Brand,1012345679,50,1000.0,,1,B,AL,1.0010201001e+14,"""
+
+
+class TestConverters:
+    def test_to_integer(self):
+        assert to_integer("010010201001000") == "10010201001000"
+        assert to_integer("1000.0") == "1000"
+        assert to_integer("1.0010201001e+14") == "100102010010000"
+
+    def test_h3_to_integer(self):
+        assert h3_to_integer("8844c0a31dfffff") == str(0x8844C0A31DFFFFF)
+        assert int(h3_to_integer("8f2830828052d25")) < 2**63
+
+
+class TestTransformedCSV:
+    def test_read_converts_rows(self, sample_csv_content):
+        stream = TransformedCSV(io.StringIO(sample_csv_content), BDC_TYPED_CONVERTERS)
+
+        lines = stream.read().splitlines()
+
+        assert lines[0] == sample_csv_content.splitlines()[0]
+        assert lines[1] == (
+            f'0001234567,130077,"Brand, Inc",1012345678,50,1000,100,1,R,AL,10010201001000,{0x8844C0A31DFFFFF}'
+        )
+        assert lines[2] == (
+            "0001234567,130077,Brand,1012345679,50,1000,,1,B,AL,100102010010000,"
+        )
+
+    def test_read_in_small_chunks_from_zip(self, sample_csv_content):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr("test.csv", sample_csv_content)
+
+        with zipfile.ZipFile(buffer) as zipf, zipf.open("test.csv") as file:
+            stream = TransformedCSV(file, BDC_TYPED_CONVERTERS, batch_size=1)
+            chunks = []
+            while chunk := stream.read(7):
+                assert len(chunk) <= 7
+                chunks.append(chunk)
+
+        expected = TransformedCSV(
+            io.StringIO(sample_csv_content), BDC_TYPED_CONVERTERS
+        ).read()
+        assert "".join(chunks) == expected
@@ -0,0 +1,83 @@
+import httpx
+import pytest
+
+from src.uploads import UploadQueue, retry_uploads
+from src.utils import upload_file_to_zapier, upload_timeout
+
+
+class TestStreamingUpload:
+    @pytest.mark.asyncio
+    async def test_multipart_streamed_in_chunks(self, tmp_path):
+        uploads = []
+
+        async def handler(request):
+            body = b"".join([chunk async for chunk in request.stream])
+            uploads.append((request, body))
+            return httpx.Response(200)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        file_path = tmp_path / "test.csv"
+        file_path.write_bytes(b"frn,provider_id\n" + b"123,456\n" * 1000)
+
+        success = await upload_file_to_zapier(
+            file_path,
+            "http://test-webhook.com",
+            "test.csv",
+            "2024-06-30",
+            client=client,
+            chunk_size=1024,
+        )
+        await client.aclose()
+
+        request, body = uploads[0]
+        assert success
+        assert int(request.headers["Content-Length"]) == len(body)
+        assert "Transfer-Encoding" not in request.headers
+        assert b'filename="test.csv"' in body
+        assert file_path.read_bytes() in body
+        boundary = request.headers["Content-Type"].split("boundary=")[1]
+        assert body.endswith(f"--{boundary}--\r\n".encode())
+
+    def test_timeout_grows_with_size(self):
+        assert upload_timeout(0) == 60
+        assert upload_timeout(1024**3) > upload_timeout(100 * 1024**2) > 60
+
+
+class TestUploadQueue:
+    def test_queue_is_durable(self, tmp_path):
+        path = tmp_path / "queue.json"
+        queue = UploadQueue(path, max_attempts=2)
+        queue.add(tmp_path / "a.csv", "a.csv", "2024-06-30", error="timeout")
+        queue.add(tmp_path / "b.csv", "b.csv", "2023-12-31")
+
+        reloaded = UploadQueue(path, max_attempts=2)
+
+        assert len(reloaded) == 2
+        assert [entry["filename"] for entry in reloaded.pending("2024-06-30")] == [
+            "a.csv"
+        ]
+        reloaded.add(tmp_path / "a.csv", "a.csv", "2024-06-30")
+        assert [entry["filename"] for entry in reloaded.pending()] == ["b.csv"]
+
+    @pytest.mark.asyncio
+    async def test_retry_uploads(self, tmp_path, mocker):
+        async def mock_upload(path, webhook, filename, table_name, client=None):
+            return filename != "bad.csv"
+
+        mocker.patch("src.uploads.upload_file_to_zapier", side_effect=mock_upload)
+        queue = UploadQueue(tmp_path / "queue.json")
+        for name in ["good.csv", "bad.csv", "kept.parquet"]:
+            (tmp_path / name).write_text("data")
+            queue.add(
+                tmp_path / name, name, "2024-06-30", remove=name != "kept.parquet"
+            )
+        queue.add(tmp_path / "gone.csv", "gone.csv", "2024-06-30")
+
+        uploaded = await retry_uploads(queue, "http://test-webhook.com")
+
+        assert uploaded == 2
+        assert [entry["filename"] for entry in queue.pending()] == ["bad.csv"]
+        assert queue.pending()[0]["attempts"] == 2
+        assert not (tmp_path / "good.csv").exists()
+        assert (tmp_path / "bad.csv").exists()
+        assert (tmp_path / "kept.parquet").exists()
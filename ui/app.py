@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 import os
 import sys
@@ -9,9 +8,11 @@ from dotenv import load_dotenv
 from sqlalchemy import MetaData, create_engine, inspect
 
 sys.path.append("./")
-from db.schema import copy_data_to_postgres, create_bdc_table
+from db.partitions import PARENT_TABLE
+from db.rowcounts import RowCounter
+from db.schema import create_bdc_table
 from src.bdc_api import BDC
-from src.utils import extractZip, upload_file_to_zapier
+from src.pipeline import IngestPipeline, PipelineConfig
 
 load_dotenv()
 
@@ -22,18 +23,31 @@ ZAPIER_WEBHOOK = str(os.getenv("ZAPIER_WEBHOOK"))
 
 CONNECTION_STRING = str(os.getenv("CONNECTION_STRING"))
 
+CACHE_PATH = os.getenv("CACHE_PATH", "./cache")
+
 logging.basicConfig(level=logging.WARNING)
 
 
 async def main():
     st.title("Broadband Data Collection")
 
+    # The client is closed however the script run ends, including
+    # Streamlit's rerun and stop exceptions
+    async with BDC(
+        USERNAME,
+        API_KEY,
+        metadata_cache_path=os.path.join(CACHE_PATH, "metadata.json"),
+    ) as bdc:
+        await ingest_page(bdc)
+
+
+async def ingest_page(bdc: BDC):
     engine = create_engine(CONNECTION_STRING)
     inspector = inspect(engine)
     metadata = MetaData()
 
-    # Initialize the BDC class
-    bdc = BDC(USERNAME, API_KEY)
+    if st.button("Refresh file listings"):
+        bdc.invalidateMetadata()
 
     # Get the list of dates
     dates = await bdc.getlistofDates()
@@ -57,57 +71,105 @@ async def main():
 
     table_name = f"bdc_{date}".replace("-", "_")
 
+    with st.expander("Pipeline settings"):
+        config = PipelineConfig(
+            download_concurrency=st.number_input("Downloads", 1, 16, 4),
+            extract_concurrency=st.number_input("Extracts", 1, 16, 2),
+            copy_concurrency=st.number_input("Postgres COPY streams", 1, 16, 2),
+            upload_concurrency=st.number_input("Uploads", 1, 16, 2),
+            stream_copy=st.checkbox(
+                "Stream ZIPs straight into Postgres without extracting them"
+            ),
+            fast_load=st.checkbox(
+                "Fast load into an unlogged staging table, then build indexes and swap it in"
+            ),
+            typed_schema=st.checkbox(
+                "Use the compact typed schema for new tables"
+            ),
+            partitioned=st.checkbox(
+                "Load into the bdc_availability table partitioned by date and state"
+            ),
+            incremental=st.checkbox(
+                "Skip files that are already loaded and unchanged", value=True
+            ),
+            rollups=st.checkbox(
+                "Refresh the summary tables for the states loaded"
+            ),
+            parquet_path=st.text_input(
+                "Parquet dataset directory (leave empty to skip the Parquet export)"
+            )
+            or None,
+            upload_parquet=st.checkbox("Upload Parquet files instead of CSVs"),
+            cache_path=st.text_input(
+                "Download cache directory (leave empty to always download)",
+                CACHE_PATH,
+            )
+            or None,
+            upload_compression=st.selectbox(
+                "Compression for files too large to upload as they are",
+                ["zip", "gzip", "zstd"],
+            ),
+            upload_queue_path=st.text_input(
+                "Upload queue file to retry failed uploads from (leave empty to fail the file instead)",
+                "./upload_queue.json",
+            )
+            or None,
+        )
+
     if st.button("Download files then upload to Box and Postgres"):
+        # The partitioned load creates its own tables
+        if config.partitioned:
+            logging.info(f"Loading into {PARENT_TABLE}, {table_name} is not created")
         # Check if table exists
-        if table_name in inspector.get_table_names():
+        elif table_name in inspector.get_table_names():
             logging.warning(f"Table {table_name} already exists")
             pass
         else:
-            create_bdc_table(table_name, metadata)
+            create_bdc_table(table_name, metadata, typed=config.typed_schema)
             metadata.create_all(engine)
             logging.info(f"Table {table_name} created")
 
-        # Get the download list for a specific date
-        downloadList: list[dict] = await bdc.getDownloadList(
-            date=date, category="State"
-        )
         if not downloadList:
             logging.error("No files to download")
             sys.exit(1)
         else:
             my_bar = st.progress(0)
 
-            for file in downloadList:
-                progress = (downloadList.index(file) + 1) / len(downloadList)
+            def on_progress(job, completed, total):
                 my_bar.progress(
-                    progress,
-                    text=f"{file['file_name']} {downloadList.index(file) + 1}/{len(downloadList)}",
+                    completed / total,
+                    text=f"{job.filename} {completed}/{total}",
                 )
-                logging.info(json.dumps(file, indent=4, sort_keys=True))
-
-                file_id = file["file_id"]
-                response = await bdc.getDownloadFile(file_id)
-                extractZip(response=response, file_id=file["file_id"])
-                filename = f"{file['file_name']}"
-
-                logging.info(f"Extracted {filename}")
-
-                copy_data_to_postgres(engine, f"exports/{filename}.csv", table_name)
-
-                try:
-                    await upload_file_to_zapier(
-                        f"exports/{filename}.csv", ZAPIER_WEBHOOK, filename, date
-                    )
-                except Exception as e:
-                    logging.error(f"Error uploading file to Zapier: {e}")
-                    st.error(f"Error uploading file to Zapier: {e}")
-
-                os.remove(f"exports/{filename}.csv")
-                logging.info(f"Deleted {filename}")
-
-            st.write(
-                f"Files uploaded to Box folder Broadband Data/{date} and {table_name} table created in database"
+                if job.error is not None:
+                    st.error(f"Error ingesting {job.filename}: {job.error}")
+
+            pipeline = IngestPipeline(
+                bdc,
+                date,
+                engine=engine,
+                table_name=None if config.partitioned else table_name,
+                zapier_webhook=ZAPIER_WEBHOOK,
+                config=config,
+                on_progress=on_progress,
             )
+            await pipeline.run(downloadList)
+
+            counter = RowCounter(engine)
+            if config.partitioned:
+                row_count = counter.count(PARENT_TABLE, as_of_date=date)
+            else:
+                row_count = counter.count(table_name)
+            if row_count is not None:
+                st.write(str(row_count))
+
+            if config.partitioned:
+                st.write(
+                    f"Files uploaded to Box folder Broadband Data/{date} and loaded into the {PARENT_TABLE} table in database"
+                )
+            else:
+                st.write(
+                    f"Files uploaded to Box folder Broadband Data/{date} and {table_name} table created in database"
+                )
 
 
 if __name__ == "__main__":